@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Compare the Flask and ASGI serving modes of a service at equal memory.
+
+Starts the service (``polyglot_common.serve``) once per mode, on this
+machine and against the database in the ``DB_*`` variables:
+
+1. with one worker, warmed up by every scenario, to measure the resident
+   memory of the server process and of one worker
+2. with as many workers as fit in ``--memory-mb`` (at least one), to run the
+   ``suite.py`` scenarios of that service
+
+Flask runs under gunicorn with ``--flask-threads`` threads per worker, ASGI
+under uvicorn with one event loop per worker. Both use a pool of up to
+``DB_POOL_MAX_SIZE`` connections per worker. The catalog must match
+``--scale`` and ``--seed`` (see ``suite.py --load``).
+
+    python benchmarks/python/asgi_vs_flask.py --service product --scale 100k \\
+        --memory-mb 512 --concurrency 64 --output results/asgi_vs_flask.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from suite import (REPO_ROOT, HttpTarget, cart_scenarios, git_commit, product_scenarios, run_scenario)
+from generate import DEFAULT_SEED, generate_products, parse_count
+
+MODES = ('flask', 'asgi')
+SERVICE_DIRS = {
+    'product': os.path.join(REPO_ROOT, 'services', 'product_service', 'python'),
+    'cart': os.path.join(REPO_ROOT, 'services', 'cart_service', 'python'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_kib(pid):
+    """Resident memory of one process, in KiB (Linux)."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def children(pid):
+    """Direct children of ``pid``, from /proc (Linux)."""
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; fields resume after ')'.
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory(pid):
+    """(server KiB, [worker KiB, ...]); a server without children is its own worker."""
+    workers = [rss_kib(child) for child in children(pid)]
+    if not workers:
+        return 0, [rss_kib(pid)]
+    return rss_kib(pid), workers
+
+
+class Server:
+    def __init__(self, service, mode, workers, args):
+        self.port = free_port()
+        env = dict(os.environ, SERVER_MODE=mode, WEB_CONCURRENCY=str(workers), PORT=str(self.port),
+                   FLASK_THREADS=str(args.flask_threads))
+        # The in-memory hot tier is Flask-only; compare both on Postgres.
+        env['CART_STORE_MODE'] = 'off'
+        self.log = open(args.server_log, 'a')
+        self.process = subprocess.Popen([sys.executable, '-m', 'polyglot_common.serve'], cwd=SERVICE_DIRS[service],
+                                        env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.workers = workers
+        self._wait_ready(args.startup_timeout)
+
+    def _wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'server exited with {self.process.returncode}; see the server log')
+            try:
+                with urllib.request.urlopen(self.url + '/healthz', timeout=1):
+                    pass
+                if len(children(self.process.pid)) >= (self.workers if self.workers > 1 else 0):
+                    return
+            except (OSError, urllib.error.URLError):
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f'server not ready after {timeout}s')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+def scenarios_for(service, args, target):
+    if service == 'product':
+        return product_scenarios(args, target)
+    product_ids = [product['id'] for product in itertools.islice(generate_products(args.scale, args.seed), 10)]
+    return cart_scenarios(args, target, product_ids)
+
+
+def measure_mode(mode, args):
+    print(f'[{mode}] sizing...', file=sys.stderr)
+    server = Server(args.service, mode, 1, args)
+    try:
+        for scenario in scenarios_for(args.service, args, HttpTarget(server.url)):
+            run_scenario(scenario, args.concurrency, args.warmup, 0, args.seed)
+        base_kib, (worker_kib,) = memory(server.process.pid)
+    finally:
+        server.stop()
+    workers = max(1, (args.memory_mb * 1024 - base_kib) // worker_kib)
+    if args.max_workers:
+        workers = min(workers, args.max_workers)
+    print(f'[{mode}] server {base_kib // 1024} MiB + {worker_kib // 1024} MiB per worker: {workers} workers',
+          file=sys.stderr)
+
+    server = Server(args.service, mode, workers, args)
+    results = []
+    try:
+        for scenario in scenarios_for(args.service, args, HttpTarget(server.url)):
+            if args.scenarios and scenario.name not in args.scenarios:
+                continue
+            result = run_scenario(scenario, args.concurrency, args.duration, args.warmup, args.seed)
+            print(f"[{mode}] {scenario.name}: {result['rps']:.1f} req/s, p50 {result['latency_ms']['p50']} ms, "
+                  f"p99 {result['latency_ms']['p99']} ms, {result['errors']} errors", file=sys.stderr)
+            results.append(result)
+        base, worker_rss = memory(server.process.pid)
+    finally:
+        server.stop()
+    return {
+        'workers': workers,
+        'threads_per_worker': args.flask_threads if mode == 'flask' else 1,
+        'sizing_kib': {'server': base_kib, 'worker': worker_kib},
+        'rss_mb_after': round((base + sum(worker_rss)) / 1024, 1),
+        'results': results,
+    }
+
+
+def print_table(modes):
+    flask = {result['scenario']: result for result in modes['flask']['results']}
+    print(f"{'scenario':32} {'flask rps':>10} {'asgi rps':>10} {'ratio':>6} {'flask p99':>10} {'asgi p99':>10}",
+          file=sys.stderr)
+    for result in modes['asgi']['results']:
+        base = flask.get(result['scenario'])
+        if base is None:
+            continue
+        ratio = result['rps'] / base['rps'] if base['rps'] else float('nan')
+        print(f"{result['scenario']:32} {base['rps']:10.1f} {result['rps']:10.1f} {ratio:6.2f} "
+              f"{base['latency_ms']['p99'] or 0:10.2f} {result['latency_ms']['p99'] or 0:10.2f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--service', choices=sorted(SERVICE_DIRS), default='product')
+    parser.add_argument('--memory-mb', type=int, default=512, help='memory budget per mode, server included')
+    parser.add_argument('--max-workers', type=int, help='cap the worker count (e.g. at the number of cores)')
+    parser.add_argument('--flask-threads', type=int, default=8, help='gunicorn threads per Flask worker')
+    parser.add_argument('--scale', type=parse_count, default=parse_count('10k'))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--scenarios', type=lambda value: set(value.split(',')))
+    parser.add_argument('--allow-cache', dest='cache_bust', action='store_false')
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    parser.add_argument('--server-log', default=os.devnull, help='append the servers\' output here')
+    parser.add_argument('--output', '-o')
+    args = parser.parse_args()
+
+    modes = {mode: measure_mode(mode, args) for mode in MODES}
+    print_table(modes)
+
+    document = {
+        'suite': {'name': 'asgi_vs_flask', 'commit': git_commit(),
+                  'started_at': datetime.now(timezone.utc).isoformat()},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'config': {'service': args.service, 'memory_mb': args.memory_mb, 'scale': args.scale, 'seed': args.seed,
+                   'duration': args.duration, 'warmup': args.warmup, 'concurrency': args.concurrency,
+                   'cache_bust': args.cache_bust},
+        'modes': modes,
+    }
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Compare two result files written by ``suite.py``.
+
+    python benchmarks/python/compare.py results/base.json results/head.json
+
+Prints, per scenario present in both files, throughput and latency
+percentiles with the relative change, and exits with status 1 when any
+scenario got worse than ``--threshold`` (default 10%) on p50, p99 or
+throughput. Runs with a different scale, seed or concurrency are refused:
+their numbers are not comparable.
+"""
+import argparse
+import json
+import sys
+
+# Metric -> True when higher values are worse.
+METRICS = {'rps': False, 'p50': True, 'p95': True, 'p99': True}
+GATED = ('rps', 'p50', 'p99')
+COMPARABLE_CONFIG = ('scale', 'seed', 'concurrency', 'cache_bust')
+
+
+def _value(result, metric):
+    return result['rps'] if metric == 'rps' else result['latency_ms'].get(metric)
+
+
+def compare(base, head, threshold=0.10):
+    """Rows of ``(scenario, metric, base, head, change, regressed)``."""
+    base_results = {result['scenario']: result for result in base['results']}
+    rows = []
+    for result in head['results']:
+        previous = base_results.get(result['scenario'])
+        if previous is None:
+            continue
+        for metric, higher_is_worse in METRICS.items():
+            old, new = _value(previous, metric), _value(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change if higher_is_worse else -change
+            rows.append((result['scenario'], metric, old, new, change, metric in GATED and worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown (default 0.10)')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    mismatched = [key for key in COMPARABLE_CONFIG if base['config'].get(key) != head['config'].get(key)]
+    if mismatched:
+        sys.exit(f'results are not comparable, config differs in: {", ".join(mismatched)}')
+
+    print(f"base {base['suite'].get('commit') or '?'}  head {head['suite'].get('commit') or '?'}")
+    regressed = False
+    for scenario, metric, old, new, change, worse in compare(base, head, args.threshold):
+        regressed = regressed or worse
+        print(f"{scenario:32} {metric:>4} {old:12.3f} {new:12.3f} {change:+8.1%}{'  REGRESSED' if worse else ''}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Measure the per-request cost of polyglot_common.metrics instrumentation.
+
+Runs the same trivial Flask route with and without ``instrument_app`` through
+the WSGI test client. A trivial route is the worst case: the absolute
+overhead is fixed, so it is the largest share of a cheap request.
+
+    python benchmarks/python/metrics_overhead.py [--requests 20000] [--rps 500]
+
+``--rps`` is the per-worker request rate to express the overhead as a share
+of one CPU core.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from flask import Flask
+
+
+def build_app(instrumented):
+    app = Flask(__name__)
+
+    @app.route('/api/v1/products/<product_id>')
+    def get_product(product_id):
+        return {'id': product_id}
+
+    if instrumented:
+        from polyglot_common.metrics import instrument_app
+        instrument_app(app, service='overhead_check')
+    return app
+
+
+def time_requests(app, count):
+    client = app.test_client()
+    for _ in range(200):
+        client.get('/api/v1/products/warmup')
+    started = time.perf_counter()
+    for i in range(count):
+        client.get(f'/api/v1/products/{i}')
+    return (time.perf_counter() - started) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rps', type=float, default=500, help='requests per second per worker')
+    parser.add_argument('--multiprocess', action='store_true', help='use PROMETHEUS_MULTIPROC_DIR storage')
+    args = parser.parse_args()
+    if args.multiprocess:
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp()
+
+    plain, instrumented = build_app(False), build_app(True)
+    base = statistics.median(time_requests(plain, args.requests) for _ in range(args.repeat))
+    with_metrics = statistics.median(time_requests(instrumented, args.requests) for _ in range(args.repeat))
+    overhead = with_metrics - base
+    print(f'baseline:      {base * 1e6:8.1f} us/request')
+    print(f'instrumented:  {with_metrics * 1e6:8.1f} us/request')
+    print(f'overhead:      {overhead * 1e6:8.1f} us/request ({overhead / base:.1%} of a trivial request)')
+    print(f'at {args.rps:g} rps:  {overhead * args.rps:.2%} of one core')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""Benchmark suite for the product, cart and worker services.
+
+Runs each scenario as a closed loop (``--concurrency`` threads on keep-alive
+connections) for ``--duration`` seconds after a warm-up, and writes one JSON
+document per run that ``compare.py`` can diff across commits.
+
+The product scenarios expect the catalog generated by ``seed/generate.py``
+with the same ``--scale`` and ``--seed``: ids, search terms and the deep
+keyset cursor are derived from the generator rather than queried, so the
+requests are identical on every run. ``--load`` (re)creates that catalog
+first; it empties the products table.
+
+    python benchmarks/python/suite.py --scale 100k --load \\
+        --dsn postgresql://pp:pp@localhost:5432/polyglot \\
+        --product-url http://localhost:8081 --cart-url http://localhost:8082 \\
+        --output results/$(git rev-parse --short HEAD).json
+"""
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'seed'))
+
+from generate import DEFAULT_SEED, SEARCH_TERMS, generate_products, parse_count  # noqa: E402
+
+SUITE_VERSION = 1
+PAGE_SIZE = 20
+PERCENTILES = (50, 90, 95, 99)
+# Small programs that exercise startup and a little work, per language.
+PROGRAMS = {
+    'python': 'print(sum(range(100000)))',
+    'javascript': 'let s = 0; for (let i = 0; i < 100000; i++) s += i; console.log(s);',
+    'ruby': 'puts (0...100000).sum',
+    'php': '<?php echo array_sum(range(0, 99999)), "\\n";',
+    'go': 'package main\nimport "fmt"\nfunc main() { s := 0; for i := 0; i < 100000; i++ { s += i }; fmt.Println(s) }\n',
+    'rust': 'fn main() { let s: u64 = (0..100000).sum(); println!("{}", s); }\n',
+    'cpp': '#include <iostream>\nint main() { long s = 0; for (int i = 0; i < 100000; i++) s += i; '
+           'std::cout << s << std::endl; }\n',
+    'java': 'public class Main { public static void main(String[] a) { long s = 0; '
+            'for (int i = 0; i < 100000; i++) s += i; System.out.println(s); } }\n',
+}
+
+
+class HttpTarget:
+    """Per-thread keep-alive connection to one service."""
+
+    def __init__(self, base_url, timeout=30):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            return response.status, payload
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+class Scenario:
+    """A named request mix; ``make_request(worker, rng)`` performs one operation and returns its status."""
+
+    def __init__(self, name, service, make_request, setup=None):
+        self.name = name
+        self.service = service
+        self.make_request = make_request
+        self.setup = setup
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_scenario(scenario, concurrency, duration, warmup, seed):
+    if scenario.setup:
+        scenario.setup(concurrency)
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    started = threading.Event()
+    measure_from = [0.0]
+    end = [0.0]
+
+    def worker(index):
+        rng = random.Random(f'{seed}-{scenario.name}-{index}')
+        started.wait()
+        while True:
+            begin = time.perf_counter()
+            if begin >= end[0]:
+                break
+            try:
+                ok = 200 <= scenario.make_request(index, rng) < 400
+            except Exception:
+                ok = False
+            finished = time.perf_counter()
+            if begin >= measure_from[0]:
+                latencies[index].append(finished - begin)
+                if not ok:
+                    errors[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    now = time.perf_counter()
+    measure_from[0] = now + warmup
+    end[0] = measure_from[0] + duration
+    started.set()
+    for thread in threads:
+        thread.join()
+
+    samples = sorted(itertools.chain.from_iterable(latencies))
+    elapsed = duration
+    return {
+        'scenario': scenario.name,
+        'service': scenario.service,
+        'requests': len(samples),
+        'errors': sum(errors),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'latency_ms': dict(
+            {f'p{p}': round(percentile(samples, p) * 1000, 3) if samples else None for p in PERCENTILES},
+            mean=round(sum(samples) / len(samples) * 1000, 3) if samples else None,
+            max=round(samples[-1] * 1000, 3) if samples else None,
+        ),
+    }
+
+
+def encode_cursor(position):
+    """Same encoding as product_service's ``encode_cursor``."""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def product_scenarios(args, target):
+    rows = args.scale
+    sample = list(itertools.islice(generate_products(rows, args.seed), min(rows, 1000)))
+    ids = [product['id'] for product in sample]
+    deep_page = max(1, rows // PAGE_SIZE - 1)
+    # Position of the row just before the last page, in (created_at, id) order.
+    deep_row = next(generate_products(rows, args.seed, start=max(0, rows - PAGE_SIZE - 1)), None)
+    deep_cursor = encode_cursor([deep_row['created_at'], deep_row['id']]) if deep_row else ''
+    counter = itertools.count()
+
+    def get(path):
+        if args.cache_bust:
+            # Distinct URLs defeat product_service's response cache, so the
+            # database path is what gets measured.
+            path += f'&_bust={next(counter)}'
+        return target.request('GET', path)[0]
+
+    return [
+        Scenario('product_list_first_page', 'product_service',
+                 lambda worker, rng: get(f'/api/v1/products?page=1&limit={PAGE_SIZE}')),
+        Scenario('product_list_deep_offset', 'product_service',
+                 lambda worker, rng: get(f'/api/v1/products?page={deep_page}&limit={PAGE_SIZE}')),
+        Scenario('product_list_deep_cursor', 'product_service',
+                 lambda worker, rng: get(f'/api/v1/products?cursor={deep_cursor}&limit={PAGE_SIZE}')),
+        Scenario('product_search', 'product_service',
+                 lambda worker, rng: get('/api/v1/products?limit=20&q='
+                                         + urllib.parse.quote(' '.join(rng.sample(SEARCH_TERMS, 2))))),
+        Scenario('product_search_prefix', 'product_service',
+                 lambda worker, rng: get('/api/v1/products?limit=10&prefix=1&q='
+                                         + urllib.parse.quote(rng.choice(SEARCH_TERMS)[:3]))),
+        Scenario('product_get', 'product_service',
+                 lambda worker, rng: get(f'/api/v1/products/{rng.choice(ids)}?')),
+        Scenario('product_batch_lookup', 'product_service',
+                 lambda worker, rng: target.request('POST', '/api/v1/products/batch',
+                                                    {'ids': rng.sample(ids, min(20, len(ids)))})[0]),
+    ]
+
+
+def cart_scenarios(args, target, product_ids):
+    run_id = uuid.uuid4().hex[:8]
+    shared_session = {'X-Session-ID': f'bench-{run_id}-shared'}
+
+    def session(worker):
+        return {'X-Session-ID': f'bench-{run_id}-{worker}'}
+
+    def fill_carts(concurrency):
+        for worker in range(concurrency):
+            for product_id in product_ids[:5]:
+                target.request('POST', '/api/v1/cart', {'product_id': product_id, 'quantity': 1}, session(worker))
+
+    def add(headers, rng):
+        return target.request('POST', '/api/v1/cart', {'product_id': rng.choice(product_ids[:10]), 'quantity': 1},
+                              headers)[0]
+
+    return [
+        Scenario('cart_read', 'cart_service',
+                 lambda worker, rng: target.request('GET', '/api/v1/cart', headers=session(worker))[0],
+                 setup=fill_carts),
+        Scenario('cart_add_distinct_sessions', 'cart_service', lambda worker, rng: add(session(worker), rng)),
+        Scenario('cart_add_one_session', 'cart_service', lambda worker, rng: add(shared_session, rng)),
+    ]
+
+
+def worker_scenarios(args):
+    from celery import Celery
+
+    # Publish like any producer: the worker's router picks the language queue
+    # and applies admission control, so rejected jobs count as errors.
+    sys.path.insert(0, os.path.join(REPO_ROOT, 'services', 'worker_service', 'python'))
+    from runtimes import load_runtimes
+    from scheduling import Scheduler, transport_options
+
+    celery = Celery('benchmarks', broker=args.broker, backend=args.result_backend or args.broker)
+    celery.conf.update(task_routes=(Scheduler(load_runtimes(), redis_url=args.broker).route,),
+                       broker_transport_options=transport_options())
+
+    def execute(language):
+        def run(worker, rng):
+            # cache=False: identical snippets would otherwise be answered by
+            # the worker's result cache.
+            result = celery.send_task('worker.execute_code_task', args=[language, PROGRAMS[language]],
+                                      kwargs={'cache': False}).get(timeout=120)
+            return 200 if result.get('status') == 'success' else 500
+        return run
+
+    return [Scenario(f'worker_execute_{language}', 'worker_service', execute(language))
+            for language in args.languages]
+
+
+def record_results(dsn, document, implementation):
+    """Store each scenario as a completed row of benchmark_results."""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        for result in document['results']:
+            latency = result['latency_ms']
+            cur.execute(
+                "INSERT INTO benchmark_results (implementation_id, service_name, duration_seconds, p50_ms, "
+                "p95_ms, p99_ms, rps, errors, raw_output, status, finished_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'completed', now())",
+                (implementation, f"{result['service']}:{result['scenario']}", document['config']['duration'],
+                 latency['p50'], latency['p95'], latency['p99'], result['rps'], result['errors'],
+                 json.dumps(dict(result, suite=document['suite'], config=document['config']))))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--scale', type=parse_count, default=parse_count('10k'), help='catalog size: 10k, 100k, 1m')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--duration', type=float, default=10, help='measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds before each scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--product-url', default=os.environ.get('PRODUCT_SERVICE_URL'))
+    parser.add_argument('--cart-url', default=os.environ.get('CART_SERVICE_URL'))
+    parser.add_argument('--broker', default=os.environ.get('CELERY_BROKER_URL'),
+                        help='Celery broker of the execution workers; enables worker scenarios')
+    parser.add_argument('--result-backend', default=os.environ.get('CELERY_RESULT_BACKEND'))
+    parser.add_argument('--languages', default='python,javascript,go',
+                        type=lambda value: [language for language in value.split(',') if language])
+    parser.add_argument('--scenarios', type=lambda value: set(value.split(',')),
+                        help='comma-separated scenario names to run (default: all available)')
+    parser.add_argument('--allow-cache', dest='cache_bust', action='store_false',
+                        help="let product_service's response cache answer repeated requests")
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'), help='PostgreSQL DSN for --load/--record')
+    parser.add_argument('--load', action='store_true', help='replace the products table with the generated catalog')
+    parser.add_argument('--load-jobs', type=int, default=4, help='parallel COPY processes for --load')
+    parser.add_argument('--record', action='store_true', help='store results in benchmark_results')
+    parser.add_argument('--implementation', default='python', help='implementation_id for --record')
+    parser.add_argument('--output', '-o', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    unknown = [language for language in args.languages if language not in PROGRAMS]
+    if unknown:
+        parser.error(f'no benchmark program for: {", ".join(unknown)}')
+    if (args.load or args.record) and not args.dsn:
+        parser.error('--load and --record need --dsn')
+
+    if args.load:
+        from load import load
+
+        load(args.dsn, {'products': args.scale}, args.seed, jobs=args.load_jobs, truncate=True,
+             log=lambda message: print(message, file=sys.stderr))
+
+    scenarios = []
+    if args.product_url:
+        scenarios += product_scenarios(args, HttpTarget(args.product_url))
+    if args.cart_url:
+        product_ids = [product['id'] for product in itertools.islice(generate_products(args.scale, args.seed), 10)]
+        scenarios += cart_scenarios(args, HttpTarget(args.cart_url), product_ids)
+    if args.broker:
+        scenarios += worker_scenarios(args)
+    if args.scenarios:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.scenarios]
+    if not scenarios:
+        parser.error('nothing to run: pass --product-url, --cart-url and/or --broker')
+
+    results = []
+    for scenario in scenarios:
+        print(f'running {scenario.name}...', file=sys.stderr)
+        result = run_scenario(scenario, args.concurrency, args.duration, args.warmup, args.seed)
+        print(f"  {result['rps']:.1f} req/s, p50 {result['latency_ms']['p50']} ms, "
+              f"p99 {result['latency_ms']['p99']} ms, {result['errors']} errors", file=sys.stderr)
+        results.append(result)
+
+    document = {
+        'suite': {'version': SUITE_VERSION, 'commit': git_commit(),
+                  'started_at': datetime.now(timezone.utc).isoformat()},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'config': {'scale': args.scale, 'seed': args.seed, 'duration': args.duration, 'warmup': args.warmup,
+                   'concurrency': args.concurrency, 'cache_bust': args.cache_bust},
+        'results': results,
+    }
+    if args.record:
+        record_results(args.dsn, document, args.implementation)
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
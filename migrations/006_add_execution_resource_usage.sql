@@ -0,0 +1,10 @@
+ALTER TABLE executions
+ADD COLUMN IF NOT EXISTS compile_ms INTEGER,
+ADD COLUMN IF NOT EXISTS run_ms INTEGER,
+ADD COLUMN IF NOT EXISTS cpu_user_ms INTEGER,
+ADD COLUMN IF NOT EXISTS cpu_system_ms INTEGER,
+ADD COLUMN IF NOT EXISTS peak_memory_kb INTEGER,
+ADD COLUMN IF NOT EXISTS stdout_bytes BIGINT,
+ADD COLUMN IF NOT EXISTS stderr_bytes BIGINT;
+
+CREATE INDEX IF NOT EXISTS idx_executions_snippet_executed_at ON executions (snippet_id, executed_at DESC);
@@ -0,0 +1,6 @@
+-- Keyset pagination orders products by (created_at, id); the column must not
+-- be NULL for row comparisons to work.
+UPDATE products SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_products_created_at_id ON products (created_at, id);
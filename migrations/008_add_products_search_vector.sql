@@ -0,0 +1,12 @@
+-- Full-text search over products: a stored, weighted tsvector (title >
+-- category > description) kept up to date by Postgres, plus a GIN index.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS category TEXT;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector);
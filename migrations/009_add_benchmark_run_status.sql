@@ -0,0 +1,6 @@
+-- Benchmark runs now execute in the background: track their lifecycle.
+-- Rows written before this migration held finished (placeholder) results.
+ALTER TABLE benchmark_results ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'completed'
+    CHECK (status IN ('pending', 'running', 'completed', 'failed'));
+ALTER TABLE benchmark_results ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ;
+ALTER TABLE benchmark_results ADD COLUMN IF NOT EXISTS error TEXT;
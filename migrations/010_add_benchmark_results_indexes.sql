@@ -0,0 +1,11 @@
+-- Benchmark queries page by (run_at, id) and filter by service and
+-- implementation; keyset row comparisons need run_at to be NOT NULL.
+UPDATE benchmark_results SET run_at = now() WHERE run_at IS NULL;
+ALTER TABLE benchmark_results ALTER COLUMN run_at SET NOT NULL;
+
+-- Unfiltered listing, newest first.
+CREATE INDEX IF NOT EXISTS idx_benchmark_results_run_at_id ON benchmark_results (run_at DESC, id DESC);
+-- Filtered listing, per-service comparison and the trailing baseline of a
+-- service/implementation pair.
+CREATE INDEX IF NOT EXISTS idx_benchmark_results_service_impl_run_at
+    ON benchmark_results (service_name, implementation_id, run_at DESC, id DESC);
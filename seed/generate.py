@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Generate reproducible synthetic catalogs from ``seed/products.json``.
+
+Every product is a variation of one of the seed products: same category,
+currency and image, with an adjective and material mixed into the title and
+description, a price scaled around the template's and a random stock level.
+Output depends only on ``--seed`` and the row number, so the same command
+always produces the same rows, ids included, the first N rows of a large
+scale are identical to the N rows of a smaller one, and any range of rows
+can be generated on its own (``start``), which lets loaders split a table
+between workers.
+
+``created_at`` increases strictly with the row number (one second apart from
+2024-01-01), so row ``i`` is also the ``i``-th product in the service's
+``(created_at, id)`` order.
+
+Users and carts are generated the same way; cart items refer to the first
+``POPULAR_PRODUCTS`` generated products.
+
+    python seed/generate.py --products 100k --seed 42 > products.jsonl
+    python seed/generate.py --table carts --carts 10k --format csv > carts.csv
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+SEED_PRODUCTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'products.json')
+DEFAULT_SEED = 42
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Rows are drawn from a fresh random stream every BLOCK_ROWS rows.
+BLOCK_ROWS = 10000
+# Cart items pick from this many products (fewer if the catalog is smaller).
+POPULAR_PRODUCTS = 10000
+MAX_CART_ITEMS = 8
+# Not a valid bcrypt hash: seeded users exist for volume and cannot log in.
+SEED_PASSWORD_HASH = '!seeded'
+
+ADJECTIVES = ['Compact', 'Premium', 'Portable', 'Ergonomic', 'Vintage', 'Wireless', 'Classic', 'Smart',
+              'Lightweight', 'Durable', 'Handmade', 'Modern', 'Rugged', 'Slim', 'Deluxe', 'Eco']
+MATERIALS = ['bamboo', 'steel', 'leather', 'cotton', 'aluminium', 'walnut', 'recycled plastic', 'glass',
+             'linen', 'ceramic']
+# Words the benchmark suite searches for; all of them occur in generated rows.
+SEARCH_TERMS = [adjective.lower() for adjective in ADJECTIVES] + MATERIALS
+
+PRODUCT_COLUMNS = ['id', 'title', 'description', 'category', 'price_cents', 'currency', 'stock', 'image_url',
+                   'created_at']
+USER_COLUMNS = ['id', 'email', 'password_hash', 'display_name', 'name', 'role', 'status', 'created_at']
+CART_COLUMNS = ['id', 'session_id', 'items', 'updated_at']
+FIRST_NAMES = ['Ada', 'Grace', 'Alan', 'Linus', 'Barbara', 'Ken', 'Margaret', 'Dennis', 'Frances', 'Guido',
+               'Radia', 'Bjarne', 'Hedy', 'James', 'Katherine', 'Yukihiro']
+LAST_NAMES = ['Lovelace', 'Hopper', 'Turing', 'Torvalds', 'Liskov', 'Thompson', 'Hamilton', 'Ritchie', 'Allen',
+              'Rossum', 'Perlman', 'Stroustrup', 'Lamarr', 'Gosling', 'Johnson', 'Matsumoto']
+
+
+def parse_count(value):
+    """Row counts such as ``10000``, ``10k`` or ``1m``."""
+    text = str(value).strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    if multiplier != 1:
+        text = text[:-1]
+    try:
+        count = int(float(text) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'not a row count: {value}')
+    if count < 0:
+        raise argparse.ArgumentTypeError(f'not a row count: {value}')
+    return count
+
+
+def load_templates(path=SEED_PRODUCTS):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _rows(table, seed, start, stop, make_row):
+    """Rows ``start..stop-1``; each block of ``BLOCK_ROWS`` rows has its own random stream."""
+    block = start // BLOCK_ROWS
+    while block * BLOCK_ROWS < stop:
+        rng = random.Random(f'{seed}:{table}:{block}')
+        first = block * BLOCK_ROWS
+        for i in range(first, min(first + BLOCK_ROWS, stop)):
+            row = make_row(rng, i)
+            if i >= start:
+                yield row
+        block += 1
+
+
+def generate_products(count, seed=DEFAULT_SEED, templates=None, start=0):
+    """Yield products ``start..count-1`` as dicts (columns as in ``PRODUCT_COLUMNS``)."""
+    templates = templates or load_templates()
+
+    def product(rng, i):
+        template = templates[rng.randrange(len(templates))]
+        adjective = rng.choice(ADJECTIVES)
+        material = rng.choice(MATERIALS)
+        return {
+            'id': _uuid(rng),
+            'title': f"{adjective} {template['title']} {i + 1}",
+            'description': f"{template.get('description') or ''} Made from {material}.".strip(),
+            'category': template.get('category'),
+            'price_cents': max(99, int(template['price_cents'] * rng.uniform(0.5, 2.0))),
+            'currency': template.get('currency', 'USD'),
+            'stock': rng.randint(0, 500),
+            'image_url': template.get('image_url'),
+            'created_at': (EPOCH + timedelta(seconds=i)).isoformat(),
+        }
+
+    return _rows('products', seed, start, count, product)
+
+
+def generate_users(count, seed=DEFAULT_SEED, start=0):
+    """Yield users ``start..count-1`` (columns as in ``USER_COLUMNS``)."""
+    def user(rng, i):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        return {
+            'id': _uuid(rng),
+            'email': f'user{i + 1}@seed.polyglot.test',
+            'password_hash': SEED_PASSWORD_HASH,
+            'display_name': name,
+            'name': name,
+            'role': 'user',
+            'status': 'active',
+            'created_at': (EPOCH + timedelta(seconds=i)).isoformat(),
+        }
+
+    return _rows('users', seed, start, count, user)
+
+
+def generate_carts(count, seed=DEFAULT_SEED, products=POPULAR_PRODUCTS, start=0, templates=None):
+    """Yield carts ``start..count-1`` holding items from the first ``products`` products."""
+    product_ids = [product['id'] for product in
+                   generate_products(min(products, POPULAR_PRODUCTS), seed, templates)]
+
+    def cart(rng, i):
+        chosen = rng.sample(product_ids, min(len(product_ids), rng.randint(0, MAX_CART_ITEMS)))
+        return {
+            'id': _uuid(rng),
+            'session_id': f'seed-{i + 1}',
+            'items': [{'product_id': product_id, 'quantity': rng.randint(1, 3)} for product_id in chosen],
+            'updated_at': (EPOCH + timedelta(seconds=i)).isoformat(),
+        }
+
+    return _rows('carts', seed, start, count, cart)
+
+
+TABLE_COLUMNS = {'products': PRODUCT_COLUMNS, 'users': USER_COLUMNS, 'carts': CART_COLUMNS}
+
+
+def write_jsonl(rows, out):
+    for row in rows:
+        out.write(json.dumps(row) + '\n')
+
+
+def write_csv(rows, out, columns):
+    writer = csv.DictWriter(out, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({column: json.dumps(value) if isinstance(value, (list, dict)) else value
+                         for column, value in row.items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--table', choices=sorted(TABLE_COLUMNS), default='products')
+    parser.add_argument('--products', type=parse_count, default=parse_count('10k'),
+                        help='number of products, e.g. 10k, 100k, 1m (default 10k)')
+    parser.add_argument('--users', type=parse_count, default=parse_count('10k'))
+    parser.add_argument('--carts', type=parse_count, default=parse_count('10k'))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--templates', default=SEED_PRODUCTS, help='seed products to vary (JSON array)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--output', '-o', help='file to write instead of stdout')
+    args = parser.parse_args()
+
+    templates = load_templates(args.templates)
+    if args.table == 'users':
+        rows = generate_users(args.users, args.seed)
+    elif args.table == 'carts':
+        rows = generate_carts(args.carts, args.seed, args.products, templates=templates)
+    else:
+        rows = generate_products(args.products, args.seed, templates)
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            write_csv(rows, out, TABLE_COLUMNS[args.table])
+        else:
+            write_jsonl(rows, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
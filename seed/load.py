@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Bulk-load generated products, users and carts into Postgres with COPY.
+
+Rows come from ``generate.py`` and are streamed straight into
+``COPY ... FROM STDIN``: nothing is materialised, so memory stays constant
+whatever the scale. Each table is split into ``BLOCK_ROWS``-aligned shards
+that ``--jobs`` worker processes load in parallel, on their own connections
+and transactions.
+
+When a table is empty before the load (always with ``--truncate``), its
+secondary indexes and the primary key / unique constraints that no foreign
+key depends on are dropped first and rebuilt once all shards are in, which
+is several times faster than maintaining them row by row. The rebuild
+statements are written to ``--restore-file`` before anything is dropped. If
+the load fails or is interrupted, the statements that did not complete are
+retried one at a time. Any that still fail (e.g. a primary key over duplicate
+rows) stay in that file, which ``psql -f`` can replay once the data is fixed.
+The table is analyzed afterwards. Throughput is reported per table.
+
+    python seed/load.py --dsn postgresql://pp:pp@localhost:5432/polyglot \\
+        --products 10m --users 1m --carts 1m --jobs 8 --truncate
+
+The same ``--seed`` and counts always load the same rows, so the benchmark
+suite can derive ids and cursors without querying the database. ``--truncate``
+empties the loaded tables first; Postgres refuses if another table has a
+foreign key to one of them (``users`` is referenced by ``executions``).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+
+from generate import (BLOCK_ROWS, DEFAULT_SEED, POPULAR_PRODUCTS, SEED_PRODUCTS, TABLE_COLUMNS, generate_carts,
+                      generate_products, generate_users, load_templates, parse_count)
+
+logger = logging.getLogger(__name__)
+
+# Tables in load order; index builds of a table start as soon as it is loaded.
+TABLES = ('products', 'users', 'carts')
+COPY_BUFFER_BYTES = 1 << 16
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+    return str(value).translate(_ESCAPES)
+
+
+class CopyStream:
+    """File-like object serving ``rows`` in COPY text format, a buffer at a time."""
+
+    def __init__(self, rows, columns):
+        self._rows = iter(rows)
+        self._columns = columns
+        self._buffer = b''
+        self.count = 0
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else COPY_BUFFER_BYTES
+        lines = [self._buffer]
+        length = len(self._buffer)
+        for row in self._rows:
+            line = ('\t'.join(_copy_value(row[column]) for column in self._columns) + '\n').encode()
+            lines.append(line)
+            length += len(line)
+            self.count += 1
+            if length >= size:
+                break
+        data = b''.join(lines)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def table_rows(table, count, seed, start=0, products=POPULAR_PRODUCTS, templates_path=SEED_PRODUCTS):
+    if table == 'products':
+        return generate_products(count, seed, load_templates(templates_path), start=start)
+    if table == 'users':
+        return generate_users(count, seed, start=start)
+    return generate_carts(count, seed, products, start=start, templates=load_templates(templates_path))
+
+
+def shards(count, jobs):
+    """Split ``range(count)`` into at most ``jobs`` block-aligned ranges."""
+    blocks = -(-count // BLOCK_ROWS)
+    per_shard = max(1, -(-blocks // max(jobs, 1))) * BLOCK_ROWS
+    return [(start, min(start + per_shard, count)) for start in range(0, count, per_shard)]
+
+
+def copy_shard(dsn, table, count, seed, start, products, templates_path):
+    """Worker: COPY rows ``start..count-1`` of ``table``; returns the row count."""
+    columns = TABLE_COLUMNS[table]
+    stream = CopyStream(table_rows(table, count, seed, start, products, templates_path), columns)
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        # Losing the tail of a seed load on a crash is fine; waiting for the
+        # WAL flush of every shard's commit is not needed.
+        cur.execute('SET synchronous_commit = off')
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream, size=COPY_BUFFER_BYTES)
+        conn.commit()
+    finally:
+        conn.close()
+    return stream.count
+
+
+def build_index(dsn, statement, maintenance_work_mem):
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute('SET maintenance_work_mem = %s', (maintenance_work_mem,))
+        cur.execute(statement)
+    finally:
+        conn.close()
+
+
+def defer_indexes(cur, table):
+    """Drop ``table``'s droppable indexes; returns the statements that rebuild them."""
+    cur.execute(
+        "SELECT conname, pg_get_constraintdef(c.oid) FROM pg_constraint c "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u') "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint f WHERE f.contype = 'f' AND f.conindid = c.conindid)",
+        (table,))
+    constraints = cur.fetchall()
+    cur.execute(
+        "SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = %s::regclass AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid)",
+        (table,))
+    indexes = cur.fetchall()
+    for name, _ in constraints:
+        cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+    for name, _ in indexes:
+        cur.execute(f'DROP INDEX {name}')
+    return ([f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}' for name, definition in constraints]
+            + [definition for _, definition in indexes])
+
+
+def write_restore_file(path, statements):
+    with open(path, 'w') as f:
+        f.write('-- Indexes and constraints dropped by seed/load.py that are not rebuilt yet.\n')
+        for statement in statements:
+            f.write(statement + ';\n')
+
+
+def restore_indexes(dsn, statements, maintenance_work_mem, log):
+    """Run ``statements`` one by one after a failed load; returns those that still fail."""
+    failed = []
+    for statement in statements:
+        try:
+            build_index(dsn, statement, maintenance_work_mem)
+        except Exception as e:
+            log(f'could not restore: {statement}: {e}')
+            failed.append(statement)
+    return failed
+
+
+def load(dsn, counts, seed=DEFAULT_SEED, jobs=4, truncate=False, products=POPULAR_PRODUCTS,
+         maintenance_work_mem='512MB', templates_path=SEED_PRODUCTS, log=None, restore_path=None):
+    """Load ``counts`` (table -> rows) and return per-table timings."""
+    log = log or logger.info
+    restore_path = restore_path or os.path.join(tempfile.gettempdir(), f'polyglot-seed-restore-{os.getpid()}.sql')
+    tables = [table for table in TABLES if counts.get(table)]
+    conn = psycopg2.connect(dsn)
+    rebuild = {}
+    try:
+        cur = conn.cursor()
+        for table in tables:
+            if truncate:
+                cur.execute(f'TRUNCATE {table}')
+            cur.execute(f'SELECT NOT EXISTS (SELECT 1 FROM {table})')
+            if cur.fetchone()[0]:
+                rebuild[table] = defer_indexes(cur, table)
+        statements = [statement for table in tables for statement in rebuild.get(table, [])]
+        if statements:
+            # Recorded before the drop commits, so nothing is lost on any failure.
+            write_restore_file(restore_path, statements)
+            log(f'dropped {len(statements)} indexes and constraints; rebuild statements saved to {restore_path}')
+        conn.commit()
+    finally:
+        conn.close()
+
+    report = {}
+    built = {}  # future -> rebuild statement
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            index_builds = []
+            for table in tables:
+                started = time.perf_counter()
+                futures = [pool.submit(copy_shard, dsn, table, stop, seed, start, products, templates_path)
+                           for start, stop in shards(counts[table], jobs)]
+                rows = sum(future.result() for future in futures)
+                seconds = time.perf_counter() - started
+                report[table] = {'rows': rows, 'load_seconds': seconds,
+                                 'rows_per_second': rows / seconds if seconds else 0}
+                log(f'{table}: {rows} rows in {seconds:.1f}s ({report[table]["rows_per_second"]:.0f} rows/s)')
+                # Index builds overlap with loading the next table.
+                futures = [pool.submit(build_index, dsn, statement, maintenance_work_mem)
+                           for statement in rebuild.get(table, [])]
+                built.update(zip(futures, rebuild.get(table, [])))
+                index_builds.append((table, time.perf_counter(), futures))
+            for table, started, futures in index_builds:
+                for future in futures:
+                    future.result()
+                report[table]['indexes_rebuilt'] = len(futures)
+                report[table]['index_seconds'] = time.perf_counter() - started
+                if futures:
+                    log(f'{table}: rebuilt {len(futures)} indexes in {report[table]["index_seconds"]:.1f}s')
+    finally:
+        done = {statement for future, statement in built.items()
+                if future.done() and not future.cancelled() and future.exception() is None}
+        missing = [statement for statement in statements if statement not in done]
+        if missing:
+            log(f'load failed; restoring {len(missing)} dropped indexes and constraints')
+            missing = restore_indexes(dsn, missing, maintenance_work_mem, log)
+        if missing:
+            write_restore_file(restore_path, missing)
+            log(f'{len(missing)} indexes or constraints are still missing; see {restore_path}')
+        elif statements:
+            os.unlink(restore_path)
+
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        for table in tables:
+            cur.execute(f'ANALYZE {table}')
+    finally:
+        conn.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--dsn', required=True, help='PostgreSQL DSN')
+    parser.add_argument('--products', type=parse_count, default=0, help='products to load, e.g. 10k, 1m, 10m')
+    parser.add_argument('--users', type=parse_count, default=0)
+    parser.add_argument('--carts', type=parse_count, default=0)
+    parser.add_argument('--cart-products', type=parse_count,
+                        help='catalog size the cart items refer to (default --products, or 10k)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--jobs', type=int, default=4, help='parallel COPY / index build processes')
+    parser.add_argument('--truncate', action='store_true', help='empty the loaded tables first')
+    parser.add_argument('--maintenance-work-mem', default='512MB', help='memory per index build')
+    parser.add_argument('--templates', default=SEED_PRODUCTS, help='seed products to vary (JSON array)')
+    parser.add_argument('--restore-file', help='where to save the statements rebuilding dropped indexes '
+                                               '(default: a file in the temp directory)')
+    args = parser.parse_args()
+
+    counts = {'products': args.products, 'users': args.users, 'carts': args.carts}
+    if not any(counts.values()):
+        parser.error('nothing to load: pass --products, --users and/or --carts')
+    started = time.perf_counter()
+    report = load(args.dsn, counts, args.seed, args.jobs, args.truncate,
+                  args.cart_products or args.products or POPULAR_PRODUCTS, args.maintenance_work_mem,
+                  args.templates, log=lambda message: print(message, file=sys.stderr),
+                  restore_path=args.restore_file)
+    seconds = time.perf_counter() - started
+    rows = sum(table['rows'] for table in report.values())
+    print(f'total: {rows} rows in {seconds:.1f}s ({rows / seconds:.0f} rows/s)', file=sys.stderr)
+    print(json.dumps({'seed': args.seed, 'seconds': seconds, 'tables': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,282 @@
 
 from flask import Flask, jsonify, request
-import os
-import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
+from polyglot_common.db import get_db_connection
+from polyglot_common.metrics import instrument_app
+from loadgen import LoadConfig, run_load
+from regression import check_run
+from datetime import datetime, timezone
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import uuid
 
 app = Flask(__name__)
+instrument_app(app, service='analytics_service')
+logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get("DB_HOST", "postgres"),
-        database=os.environ.get("DB_NAME", "polyglot"),
-        user=os.environ.get("DB_USER", "pp"),
-        password=os.environ.get("DB_PASSWORD", "pp")
-    )
-    return conn
+MAX_DURATION_S = int(os.environ.get('BENCHMARK_MAX_DURATION_S', 600))
+MAX_CONCURRENCY = int(os.environ.get('BENCHMARK_MAX_CONCURRENCY', 1000))
+# Runs share this process's CPU with the API, so only a few run at once.
+RUN_SLOTS = threading.BoundedSemaphore(int(os.environ.get('BENCHMARK_MAX_CONCURRENT_RUNS', 1)))
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+DEFAULT_BASELINE_RUNS = 10
+LIST_COLUMNS = sql.SQL(', ').join(map(sql.Identifier, (
+    'id', 'implementation_id', 'service_name', 'run_at', 'duration_seconds', 'p50_ms', 'p95_ms', 'p99_ms',
+    'rps', 'memory_peak_mb', 'errors', 'status', 'finished_at', 'error')))
+
+def resolve_target(target_service):
+    """Base URL of a service named in BENCHMARK_TARGETS (JSON object); no other host can be targeted."""
+    targets = json.loads(os.environ.get('BENCHMARK_TARGETS', '{}'))
+    if not isinstance(target_service, str) or target_service not in targets:
+        raise ValueError(f"target_service must be one of: {', '.join(sorted(targets)) or 'none configured'}")
+    return targets[target_service].rstrip('/')
+
+def _update_run(run_id, **values):
+    assignments = ', '.join(f'{column} = %({column})s' for column in values)
+    values['id'] = run_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"UPDATE benchmark_results SET {assignments} WHERE id = %(id)s", values)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+def execute_run(run_id, config):
+    """Background thread: run the load test and store its results."""
+    try:
+        _update_run(run_id, status='running')
+        result = asyncio.run(run_load(config))
+        _update_run(run_id, status='completed', finished_at=datetime.now(timezone.utc),
+                    p50_ms=result['p50_ms'], p95_ms=result['p95_ms'], p99_ms=result['p99_ms'],
+                    rps=result['rps'], memory_peak_mb=result['memory_peak_mb'], errors=result['errors'],
+                    raw_output=json.dumps(result['raw']))
+    except Exception as e:
+        logger.exception('Benchmark run %s failed', run_id)
+        try:
+            _update_run(run_id, status='failed', finished_at=datetime.now(timezone.utc), error=str(e))
+        except Exception:
+            logger.exception('Could not record failure of benchmark run %s', run_id)
+    finally:
+        RUN_SLOTS.release()
 
 @app.route('/healthz')
 def healthz():
     return jsonify({"status": "ok", "uptime_seconds": 0, "version": "0.0.1"})
 
-@app.route('/metrics')
-def metrics():
-    return 'Prometheus metrics would be exposed here.'
+def _int_arg(name, default, minimum, maximum):
+    raw = request.args.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if not minimum <= value <= maximum:
+        raise ValueError(f'{name} must be between {minimum} and {maximum}')
+    return value
+
+def _float_arg(name, default):
+    raw = request.args.get(name)
+    if raw is None:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+def _time_arg(name):
+    raw = request.args.get(name)
+    if raw is None:
+        return None
+    try:
+        return datetime.fromisoformat(raw.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 timestamp')
+
+def encode_cursor(run_at, run_id):
+    return base64.urlsafe_b64encode(json.dumps([run_at.isoformat(), str(run_id)]).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        run_at, run_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        datetime.fromisoformat(run_at)
+        uuid.UUID(run_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    return run_at, run_id
+
+def _filters():
+    """WHERE conditions shared by the query endpoints: service, implementation, status and time window."""
+    conditions, params = [], []
+    for arg, column in (('service', 'service_name'), ('implementation', 'implementation_id'), ('status', 'status')):
+        if request.args.get(arg):
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+            params.append(request.args[arg])
+    for arg, operator in (('since', '>='), ('until', '<')):
+        value = _time_arg(arg)
+        if value is not None:
+            conditions.append(sql.SQL("run_at " + operator + " %s"))
+            params.append(value)
+    return conditions, params
+
+def _where(conditions):
+    return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
 
 @app.route('/api/v1/benchmarks', methods=['GET'])
 def get_benchmarks():
+    """Runs, newest first, optionally filtered; the next page's cursor is in X-Next-Cursor."""
+    try:
+        limit = _int_arg('limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+        conditions, params = _filters()
+        cursor = request.args.get('cursor')
+        if cursor:
+            conditions.append(sql.SQL("(run_at, id) < (%s::timestamptz, %s::uuid)"))
+            params.extend(decode_cursor(cursor))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # raw_output holds whole histograms; only send it when asked for.
+    columns = sql.SQL("*") if request.args.get('include') == 'raw_output' else LIST_COLUMNS
+    query = (sql.SQL("SELECT {} FROM benchmark_results").format(columns) + _where(conditions)
+             + sql.SQL(" ORDER BY run_at DESC, id DESC LIMIT %s"))
+    params.append(limit + 1)
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM benchmark_results ORDER BY run_at DESC")
+    cur.execute(query, params)
     benchmarks = cur.fetchall()
     cur.close()
     conn.close()
-    return jsonify(benchmarks)
+
+    response = jsonify(benchmarks[:limit])
+    if len(benchmarks) > limit:
+        last = benchmarks[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last['run_at'], last['id'])
+    return response
+
+@app.route('/api/v1/benchmarks/compare', methods=['GET'])
+def compare_benchmarks():
+    """Aggregate completed runs of a service per implementation, fastest p95 first."""
+    if not request.args.get('service'):
+        return jsonify({'error': 'service is required'}), 400
+    try:
+        conditions, params = _filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conditions.append(sql.SQL("status = 'completed'"))
+
+    query = sql.SQL("""
+        SELECT implementation_id,
+               count(*) AS runs,
+               max(run_at) AS last_run_at,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY p50_ms) AS median_p50_ms,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY p95_ms) AS median_p95_ms,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY p99_ms) AS median_p99_ms,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY rps) AS median_rps,
+               max(memory_peak_mb) AS max_memory_peak_mb,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY rps / nullif(memory_peak_mb, 0)) AS median_rps_per_mb,
+               sum(errors) AS errors
+        FROM benchmark_results""") + _where(conditions) + sql.SQL("""
+        GROUP BY implementation_id
+        ORDER BY median_p95_ms NULLS LAST, implementation_id""")
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(query, params)
+    implementations = cur.fetchall()
+    cur.close()
+    conn.close()
+    return jsonify({'service': request.args['service'], 'implementations': implementations})
+
+def _regression_report(run, cur):
+    try:
+        window = _int_arg('baseline', DEFAULT_BASELINE_RUNS, 1, 100)
+        thresholds = {'z_threshold': _float_arg('z_threshold', 3.0), 'min_change': _float_arg('min_change', 0.05)}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cur.execute(
+        "SELECT id, run_at, p50_ms, p95_ms, p99_ms, rps FROM benchmark_results "
+        "WHERE service_name = %s AND implementation_id = %s AND status = 'completed' "
+        "AND (run_at, id) < (%s, %s) ORDER BY run_at DESC, id DESC LIMIT %s",
+        (run['service_name'], run['implementation_id'], run['run_at'], run['id'], window)
+    )
+    baseline = cur.fetchall()
+    report = check_run(run, baseline, **thresholds)
+    report.update(run_id=run['id'], service_name=run['service_name'], implementation_id=run['implementation_id'],
+                  run_at=run['run_at'], baseline_run_ids=[row['id'] for row in baseline])
+    return jsonify(report)
+
+@app.route('/api/v1/benchmarks/regression', methods=['GET'])
+def check_latest_regression():
+    """Did the latest completed run of `service` / `implementation` regress?"""
+    service, implementation = request.args.get('service'), request.args.get('implementation')
+    if not service or not implementation:
+        return jsonify({'error': 'service and implementation are required'}), 400
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(
+            "SELECT * FROM benchmark_results WHERE service_name = %s AND implementation_id = %s "
+            "AND status = 'completed' ORDER BY run_at DESC, id DESC LIMIT 1", (service, implementation)
+        )
+        run = cur.fetchone()
+        if run is None:
+            return jsonify({'error': 'No completed runs'}), 404
+        return _regression_report(run, cur)
+    finally:
+        cur.close()
+        conn.close()
+
+@app.route('/api/v1/benchmarks/<run_id>/regression', methods=['GET'])
+def check_run_regression(run_id):
+    try:
+        uuid.UUID(run_id)
+    except ValueError:
+        return jsonify({'error': 'Benchmark run not found'}), 404
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT * FROM benchmark_results WHERE id = %s", (run_id,))
+        run = cur.fetchone()
+        if run is None:
+            return jsonify({'error': 'Benchmark run not found'}), 404
+        if run['status'] != 'completed':
+            return jsonify({'error': f"Run is {run['status']}"}), 409
+        return _regression_report(run, cur)
+    finally:
+        cur.close()
+        conn.close()
+
+@app.route('/api/v1/benchmarks/<run_id>', methods=['GET'])
+def get_benchmark(run_id):
+    try:
+        uuid.UUID(run_id)
+    except ValueError:
+        return jsonify({'error': 'Benchmark run not found'}), 404
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute("SELECT * FROM benchmark_results WHERE id = %s", (run_id,))
+    run = cur.fetchone()
+    cur.close()
+    conn.close()
+    if run is None:
+        return jsonify({'error': 'Benchmark run not found'}), 404
+    if run['raw_output']:
+        try:
+            run['raw_output'] = json.loads(run['raw_output'])
+        except ValueError:
+            pass
+    return jsonify(run)
 
 @app.route('/api/v1/benchmarks/run', methods=['POST'])
 def run_benchmark():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     target_service = data.get('target_service')
     implementation_id = data.get('implementation_id')
     duration_seconds = data.get('duration_seconds')
@@ -43,20 +284,36 @@ def run_benchmark():
     if not all([target_service, implementation_id, duration_seconds]):
         return jsonify({'error': 'Missing required fields'}), 400
 
-    # In a real application, this would trigger a k6 run.
-    # For this demo, we'll just insert a placeholder result.
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute(
-        "INSERT INTO benchmark_results (implementation_id, service_name, duration_seconds, p50_ms, p95_ms, p99_ms, rps, memory_peak_mb, errors) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
-        (implementation_id, target_service, duration_seconds, 50, 100, 200, 1000, 256, 0)
-    )
-    new_id = cur.fetchone()['id']
-    conn.commit()
-    cur.close()
-    conn.close()
+    path = data.get('path', '/healthz')
+    try:
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError("path must start with '/'")
+        base_url = resolve_target(target_service)
+        config = LoadConfig.from_request(data, url=base_url + path, memory_url=base_url + '/metrics',
+                                         max_duration=MAX_DURATION_S, max_concurrency=MAX_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not RUN_SLOTS.acquire(blocking=False):
+        return jsonify({'error': 'Another benchmark is already running'}), 409
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(
+            "INSERT INTO benchmark_results (implementation_id, service_name, duration_seconds, status) "
+            "VALUES (%s, %s, %s, 'pending') RETURNING id",
+            (implementation_id, target_service, config.duration_seconds)
+        )
+        new_id = cur.fetchone()['id']
+        conn.commit()
+        cur.close()
+        conn.close()
+        threading.Thread(target=execute_run, args=(new_id, config), name=f'benchmark-{new_id}', daemon=True).start()
+    except Exception:
+        RUN_SLOTS.release()
+        raise
 
-    return jsonify({'run_id': new_id, 'status': 'Benchmark started'}), 202
+    return jsonify({'run_id': new_id, 'status': 'pending', 'status_url': f'/api/v1/benchmarks/{new_id}'}), 202
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
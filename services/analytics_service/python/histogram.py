@@ -0,0 +1,93 @@
+"""Latency histogram with bounded relative error, in the style of HdrHistogram.
+
+Values (integer microseconds) are counted in log-linear buckets: exact below
+``2 ** sub_bucket_bits``, and above that each power-of-two range is split into
+``2 ** (sub_bucket_bits - 1)`` equal buckets. Every bucket is therefore at
+most ``2 ** -(sub_bucket_bits - 1)`` of its value wide (under 1% with the
+default of 8 bits), whatever the latency range, and memory grows only with the
+number of distinct buckets hit. Percentiles report the highest value of the
+bucket they fall in, so they never understate latency.
+"""
+import math
+
+
+class Histogram:
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self._exact = 1 << sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+
+    def _index(self, value):
+        if value < self._exact:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return shift * self._half + (value >> shift)
+
+    def _highest_equivalent(self, index):
+        if index < self._exact:
+            return index
+        shift = (index - self._exact) // self._half + 1
+        mantissa = index - shift * self._half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError('Cannot merge histograms with different precision')
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.total:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Value at or below which ``percent`` of the recorded values fall."""
+        if not self.total:
+            return None
+        target = max(1, math.ceil(self.total * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else None
+
+    def to_dict(self):
+        return {
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'sum': self.sum,
+            # JSON object keys are strings; buckets are sorted for readability.
+            'counts': {str(index): self.counts[index] for index in sorted(self.counts)},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['sub_bucket_bits'])
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        histogram.sum = data['sum']
+        return histogram
@@ -0,0 +1,212 @@
+"""Asynchronous HTTP load generator used by ``POST /api/v1/benchmarks/run``.
+
+Two load models are supported:
+
+- ``closed``: ``concurrency`` virtual users each send a request, wait for the
+  response and immediately send the next one. Throughput is whatever the
+  target sustains.
+- ``open``: requests are scheduled at a fixed ``rps`` regardless of how fast
+  responses come back, with at most ``concurrency`` in flight. Latency is
+  measured from each request's scheduled send time, so queueing behind a
+  slow target is counted instead of hidden (no coordinated omission).
+
+Requests sent during the warm-up period are not recorded. Latencies go into
+an HDR-style ``Histogram`` in microseconds. While the test runs, the
+target's ``/metrics`` endpoint is polled for ``process_resident_memory_bytes``
+to report its peak memory when it exposes one.
+"""
+import asyncio
+import re
+
+import aiohttp
+
+from histogram import Histogram
+
+MODES = ('closed', 'open')
+MEMORY_SAMPLE_INTERVAL_S = 1.0
+RSS_PATTERN = re.compile(r'^process_resident_memory_bytes(?:\{[^}]*\})?\s+(\S+)', re.MULTILINE)
+REPORTED_PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LoadConfig:
+    def __init__(self, url, duration_seconds, mode='closed', concurrency=10, rps=None,
+                 warmup_seconds=0, timeout_seconds=10, memory_url=None):
+        self.url = url
+        self.duration_seconds = duration_seconds
+        self.mode = mode
+        self.concurrency = concurrency
+        self.rps = rps
+        self.warmup_seconds = warmup_seconds
+        self.timeout_seconds = timeout_seconds
+        self.memory_url = memory_url
+
+    @classmethod
+    def from_request(cls, data, url, memory_url=None, max_duration=600, max_concurrency=1000):
+        """Build a config from a run request, raising ValueError on bad input."""
+        def number(name, default, minimum, maximum, kind=int):
+            value = data.get(name, default)
+            if value is None:
+                return None
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not minimum <= value <= maximum:
+                raise ValueError(f'{name} must be a number between {minimum} and {maximum}')
+            return kind(value)
+
+        mode = data.get('mode', 'closed')
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {", ".join(MODES)}')
+        config = cls(
+            url=url,
+            duration_seconds=number('duration_seconds', None, 1, max_duration),
+            mode=mode,
+            concurrency=number('concurrency', 10, 1, max_concurrency),
+            rps=number('rps', None, 0.1, 100000, float),
+            warmup_seconds=number('warmup_seconds', 0, 0, max_duration),
+            timeout_seconds=number('timeout_seconds', 10, 0.1, 300, float),
+            memory_url=memory_url,
+        )
+        if mode == 'open' and config.rps is None:
+            raise ValueError('rps is required for open-loop runs')
+        return config
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class _Recorder:
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self.histogram = Histogram()
+        self.status_codes = {}
+        self.errors = 0
+        self.first_sent = None
+        self.last_completed = None
+
+    def record(self, intended, completed, status):
+        if intended < self.measure_from:
+            return
+        self.histogram.record((completed - intended) * 1_000_000)
+        key = str(status) if status is not None else 'error'
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.first_sent = intended if self.first_sent is None else min(self.first_sent, intended)
+        self.last_completed = completed if self.last_completed is None else max(self.last_completed, completed)
+
+
+async def _send(session, url, recorder, intended, slots=None):
+    loop = asyncio.get_running_loop()
+    status = None
+    try:
+        if slots is not None:
+            await slots.acquire()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                status = response.status
+        finally:
+            if slots is not None:
+                slots.release()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+    recorder.record(intended, loop.time(), status)
+
+
+async def _closed_loop(session, config, recorder, end):
+    loop = asyncio.get_running_loop()
+
+    async def user():
+        while loop.time() < end:
+            await _send(session, config.url, recorder, loop.time())
+
+    await asyncio.gather(*(user() for _ in range(config.concurrency)))
+
+
+async def _open_loop(session, config, recorder, start, end):
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(config.concurrency)
+    interval = 1.0 / config.rps
+    pending = set()
+    sent = 0
+    while True:
+        intended = start + sent * interval
+        if intended >= end:
+            break
+        delay = intended - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.ensure_future(_send(session, config.url, recorder, intended, slots))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        sent += 1
+    if pending:
+        await asyncio.gather(*pending)
+
+
+async def _sample_memory(session, url, samples, stop):
+    while not stop.is_set():
+        try:
+            async with session.get(url) as response:
+                match = RSS_PATTERN.search(await response.text()) if response.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            match = None
+        if match is None:
+            return  # target does not expose its memory
+        samples.append(float(match.group(1)) / (1024 * 1024))
+        try:
+            await asyncio.wait_for(stop.wait(), MEMORY_SAMPLE_INTERVAL_S)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(config):
+    """Run the load test described by ``config`` and summarize it."""
+    loop = asyncio.get_running_loop()
+    # One extra connection for the memory sampler.
+    connector = aiohttp.TCPConnector(limit=config.concurrency + 1)
+    timeout = aiohttp.ClientTimeout(total=config.timeout_seconds)
+    memory_samples = []
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = loop.time()
+        measure_from = start + config.warmup_seconds
+        end = measure_from + config.duration_seconds
+        recorder = _Recorder(measure_from)
+        stop_sampling = asyncio.Event()
+        sampler = None
+        if config.memory_url:
+            sampler = asyncio.ensure_future(_sample_memory(session, config.memory_url, memory_samples, stop_sampling))
+        try:
+            if config.mode == 'open':
+                await _open_loop(session, config, recorder, start, end)
+            else:
+                await _closed_loop(session, config, recorder, end)
+        finally:
+            stop_sampling.set()
+            if sampler is not None:
+                await sampler
+    return summarize(config, recorder, memory_samples)
+
+
+def summarize(config, recorder, memory_samples):
+    histogram = recorder.histogram
+
+    def ms(value):
+        return None if value is None else value / 1000
+
+    elapsed = (recorder.last_completed - recorder.first_sent) if histogram.total else 0.0
+    return {
+        'p50_ms': ms(histogram.percentile(50)),
+        'p95_ms': ms(histogram.percentile(95)),
+        'p99_ms': ms(histogram.percentile(99)),
+        'rps': histogram.total / elapsed if elapsed > 0 else 0.0,
+        'errors': recorder.errors,
+        'memory_peak_mb': max(memory_samples) if memory_samples else None,
+        'raw': {
+            'config': config.to_dict(),
+            'requests': histogram.total,
+            'status_codes': recorder.status_codes,
+            'latency_ms': dict({'min': ms(histogram.min), 'mean': ms(histogram.mean), 'max': ms(histogram.max)},
+                               **{f'p{p:g}': ms(histogram.percentile(p)) for p in REPORTED_PERCENTILES}),
+            'histogram_us': histogram.to_dict(),
+            'memory_samples_mb': memory_samples,
+        },
+    }
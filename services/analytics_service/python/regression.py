@@ -0,0 +1,72 @@
+"""Regression check of a benchmark run against its trailing baseline.
+
+Each metric of the run is compared with the same metric over the previous
+completed runs of the same service and implementation. Run-to-run noise is
+estimated with the median absolute deviation (MAD), which a single outlier
+in the baseline cannot inflate the way it would a standard deviation. A
+metric regresses when it is worse than the baseline median by more than
+``z_threshold`` robust standard deviations *and* by more than
+``min_change`` relative to the median, so tiny but consistent shifts on a
+very quiet baseline are not flagged.
+"""
+import statistics
+
+# Metric name -> True when higher values are worse.
+METRICS = {'p50_ms': True, 'p95_ms': True, 'p99_ms': True, 'rps': False}
+# Scale the median / mean absolute deviation to a standard deviation for
+# normally distributed data.
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+
+def robust_spread(samples, median):
+    deviations = [abs(sample - median) for sample in samples]
+    spread = MAD_SCALE * statistics.median(deviations)
+    if spread == 0:
+        # More than half the runs equal the median (common with few, coarse
+        # samples); fall back to the mean absolute deviation.
+        spread = MEAN_AD_SCALE * statistics.mean(deviations)
+    return spread
+
+
+def check_metric(value, baseline, higher_is_worse=True, z_threshold=3.0, min_change=0.05):
+    baseline = [sample for sample in baseline if sample is not None]
+    if value is None or not baseline:
+        return None
+    median = statistics.median(baseline)
+    spread = robust_spread(baseline, median)
+    worse_by = (value - median) if higher_is_worse else (median - value)
+    relative = worse_by / median if median else 0.0
+    if spread > 0:
+        z_score = worse_by / spread
+    else:
+        # A perfectly flat baseline: any change beyond min_change counts.
+        z_score = float('inf') if worse_by > 0 else 0.0
+    return {
+        'value': value,
+        'baseline_median': median,
+        'baseline_spread': spread,
+        'z_score': z_score if z_score != float('inf') else None,
+        'relative_change': relative,
+        'regressed': worse_by > 0 and z_score > z_threshold and relative > min_change,
+    }
+
+
+def check_run(run, baseline_runs, min_baseline=3, **thresholds):
+    """Compare ``run`` with ``baseline_runs`` (rows of benchmark_results)."""
+    if len(baseline_runs) < min_baseline:
+        return {'status': 'insufficient_baseline', 'regressed': False, 'baseline_runs': len(baseline_runs),
+                'metrics': {}}
+    metrics = {}
+    for name, higher_is_worse in METRICS.items():
+        result = check_metric(run.get(name), [row.get(name) for row in baseline_runs], higher_is_worse,
+                              **thresholds)
+        if result is not None:
+            metrics[name] = result
+    regressed = any(result['regressed'] for result in metrics.values())
+    return {
+        'status': 'regressed' if regressed else 'ok',
+        'regressed': regressed,
+        'baseline_runs': len(baseline_runs),
+        'metrics': metrics,
+    }
@@ -0,0 +1,87 @@
+import pytest
+import app as analytics
+from app import app
+from unittest.mock import patch
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+TARGETS = '{"product_service": "http://product_service:8080/"}'
+
+@patch.dict('os.environ', {'BENCHMARK_TARGETS': TARGETS})
+@patch('app.threading.Thread')
+@patch('app.get_db_connection')
+def test_run_benchmark_starts_background_run(mock_get_db_connection, mock_thread, client):
+    """A run is recorded as pending and handed to a background thread."""
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    mock_cur.fetchone.return_value = {'id': 'run-1'}
+
+    rv = client.post('/api/v1/benchmarks/run', json={
+        'target_service': 'product_service', 'implementation_id': 'python', 'duration_seconds': 5,
+        'path': '/api/v1/products', 'mode': 'open', 'rps': 50})
+
+    assert rv.status_code == 202
+    assert rv.get_json()['status'] == 'pending'
+    statement, params = mock_cur.execute.call_args[0]
+    assert "'pending'" in statement
+    assert params == ('python', 'product_service', 5)
+    run_id, config = mock_thread.call_args[1]['args']
+    assert config.url == 'http://product_service:8080/api/v1/products'
+    mock_thread.return_value.start.assert_called_once()
+
+    # The slot is held until the (mocked) run finishes.
+    assert client.post('/api/v1/benchmarks/run', json={
+        'target_service': 'product_service', 'implementation_id': 'python', 'duration_seconds': 5}).status_code == 409
+    analytics.RUN_SLOTS.release()
+
+@patch.dict('os.environ', {'BENCHMARK_TARGETS': TARGETS})
+def test_run_benchmark_rejects_bad_config(client):
+    body = {'target_service': 'product_service', 'implementation_id': 'python', 'duration_seconds': 5}
+    assert client.post('/api/v1/benchmarks/run', json=dict(body, mode='open')).status_code == 400
+    assert client.post('/api/v1/benchmarks/run', json=dict(body, target_service='a/b@c')).status_code == 400
+    assert client.post('/api/v1/benchmarks/run', json=dict(body, duration_seconds=10 ** 6)).status_code == 400
+
+@patch.dict('os.environ', {'BENCHMARK_TARGETS': TARGETS})
+@patch('app.get_db_connection')
+def test_run_benchmark_only_targets_configured_services(mock_get_db_connection, client):
+    """Hosts outside BENCHMARK_TARGETS are refused before anything is recorded or run."""
+    body = {'implementation_id': 'python', 'duration_seconds': 5}
+    for target in ('cart_service', 'internal-admin', 'localhost', ['product_service']):
+        rv = client.post('/api/v1/benchmarks/run', json=dict(body, target_service=target))
+        assert rv.status_code == 400
+        assert 'product_service' in rv.get_json()['error']
+    mock_get_db_connection.assert_not_called()
+    with patch.dict('os.environ', {'BENCHMARK_TARGETS': '{}'}):
+        assert client.post('/api/v1/benchmarks/run',
+                           json=dict(body, target_service='product_service')).status_code == 400
+
+@patch('app.get_db_connection')
+def test_list_benchmarks_pages_with_cursor_header(mock_get_db_connection, client):
+    """The list keeps its array shape; the next page's cursor travels in a header."""
+    from datetime import datetime, timezone
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    run_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mock_cur.fetchall.return_value = [
+        {'id': f'00000000-0000-0000-0000-00000000000{i}', 'run_at': run_at, 'p95_ms': 10} for i in range(3)]
+
+    rv = client.get('/api/v1/benchmarks?limit=2&service=product_service&since=2023-12-01T00:00:00Z')
+
+    assert rv.status_code == 200
+    assert len(rv.get_json()) == 2
+    cursor = rv.headers['X-Next-Cursor']
+    _, params = mock_cur.execute.call_args[0]
+    assert params[0] == 'product_service'
+    assert params[-1] == 3
+
+    client.get(f'/api/v1/benchmarks?limit=2&cursor={cursor}')
+    _, params = mock_cur.execute.call_args[0]
+    assert params == [run_at.isoformat(), '00000000-0000-0000-0000-000000000001', 3]
+
+def test_query_endpoints_validate_params(client):
+    assert client.get('/api/v1/benchmarks?cursor=bogus').status_code == 400
+    assert client.get('/api/v1/benchmarks?since=yesterday').status_code == 400
+    assert client.get('/api/v1/benchmarks/compare').status_code == 400
+    assert client.get('/api/v1/benchmarks/regression?service=product_service').status_code == 400
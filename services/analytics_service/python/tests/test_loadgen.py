@@ -0,0 +1,68 @@
+import asyncio
+import math
+import random
+import threading
+
+import pytest
+from aiohttp import web
+
+from histogram import Histogram
+from loadgen import LoadConfig, run_load
+
+def test_histogram_percentiles_within_relative_error():
+    """Percentiles stay within the bucket precision and never understate."""
+    rng = random.Random(7)
+    values = sorted(int(rng.lognormvariate(8, 1)) for _ in range(20000))
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    for percent in (50, 95, 99, 99.9):
+        exact = values[math.ceil(len(values) * percent / 100) - 1]
+        reported = histogram.percentile(percent)
+        assert exact <= reported <= exact * 1.01
+    restored = Histogram.from_dict(histogram.to_dict())
+    assert restored.percentile(99) == histogram.percentile(99)
+
+@pytest.fixture
+def target():
+    """A local HTTP server that answers after 5ms and exposes its memory."""
+    async def slow(request):
+        await asyncio.sleep(0.005)
+        return web.Response(text='ok')
+
+    async def metrics(request):
+        return web.Response(text='process_resident_memory_bytes 52428800.0\n')
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.add_routes([web.get('/slow', slow), web.get('/metrics', metrics)])
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{port}'
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+def test_closed_loop_run(target):
+    config = LoadConfig(url=target + '/slow', duration_seconds=1, concurrency=4, warmup_seconds=0.2,
+                        memory_url=target + '/metrics')
+    result = asyncio.run(run_load(config))
+    assert result['errors'] == 0
+    assert result['p50_ms'] >= 5
+    assert result['raw']['requests'] > 100
+    assert result['memory_peak_mb'] == 50
+
+def test_open_loop_run_holds_rate(target):
+    config = LoadConfig(url=target + '/slow', duration_seconds=1, mode='open', rps=200, concurrency=50)
+    result = asyncio.run(run_load(config))
+    assert result['raw']['requests'] == 200
+    assert result['errors'] == 0
+
+def test_open_loop_requires_rps():
+    with pytest.raises(ValueError):
+        LoadConfig.from_request({'duration_seconds': 5, 'mode': 'open'}, url='http://x')
@@ -0,0 +1,23 @@
+from regression import check_metric, check_run
+
+BASELINE = [{'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p95 * 2, 'rps': rps}
+            for p50, p95, rps in [(10, 40, 1000), (11, 42, 980), (10, 41, 1010), (12, 39, 990), (10, 80, 1005)]]
+
+def test_noise_within_baseline_is_not_a_regression():
+    report = check_run({'p50_ms': 11.5, 'p95_ms': 43, 'p99_ms': 86, 'rps': 985}, BASELINE)
+    assert report['status'] == 'ok'
+    assert report['baseline_runs'] == 5
+
+def test_slower_run_is_flagged_despite_baseline_outlier():
+    """The 80ms outlier in the baseline must not hide a real p95 regression."""
+    report = check_run({'p50_ms': 10, 'p95_ms': 60, 'p99_ms': 80, 'rps': 1000}, BASELINE)
+    assert report['regressed']
+    assert report['metrics']['p95_ms']['regressed']
+    assert not report['metrics']['p50_ms']['regressed']
+
+def test_lower_throughput_is_worse():
+    assert check_metric(700, [1000, 990, 1010, 1005], higher_is_worse=False)['regressed']
+    assert not check_metric(1300, [1000, 990, 1010, 1005], higher_is_worse=False)['regressed']
+
+def test_needs_enough_baseline_runs():
+    assert check_run({'p95_ms': 100}, BASELINE[:2])['status'] == 'insufficient_baseline'
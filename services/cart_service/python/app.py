@@ -1,19 +1,14 @@
 from flask import Flask, jsonify, request
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
+from cart_store import CartStoreBacklogged, check_quantity, store
+from polyglot_common.metrics import instrument_app
+from product_client import ProductServiceError, expand_products
 
 app = Flask(__name__)
+instrument_app(app, service='cart_service')
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get("DB_HOST", "postgres"),
-        database=os.environ.get("DB_NAME", "polyglot"),
-        user=os.environ.get("DB_USER", "pp"),
-        password=os.environ.get("DB_PASSWORD", "pp")
-    )
-    return conn
+@app.errorhandler(CartStoreBacklogged)
+def store_backlogged(e):
+    return jsonify({'error': 'Cart storage is temporarily unavailable'}), 503
 
 @app.route('/healthz')
 def healthz():
@@ -25,65 +20,66 @@ def get_cart():
     if not session_id:
         return jsonify({'error': 'X-Session-ID header is required'}), 400
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM carts WHERE session_id = %s", (session_id,))
-    cart = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if cart is None:
-        return jsonify({'id': '', 'session_id': session_id, 'items': []})
+    cart = store.get(session_id)
+    if request.args.get('expand') == 'products':
+        try:
+            cart = expand_products(cart)
+        except ProductServiceError as e:
+            return jsonify({'error': str(e)}), 502
     return jsonify(cart)
 
+def _cart_response(cart, created=False):
+    return jsonify(cart), 201 if created else 200
+
 @app.route('/api/v1/cart', methods=['POST'])
 def add_to_cart():
     session_id = request.headers.get('X-Session-ID')
     if not session_id:
         return jsonify({'error': 'X-Session-ID header is required'}), 400
 
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data or 'product_id' not in data or 'quantity' not in data:
         return jsonify({'error': 'product_id and quantity are required'}), 400
+    try:
+        quantity = check_quantity(data['quantity'], 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return _cart_response(*store.mutate('add', session_id, str(data['product_id']), quantity))
+
+@app.route('/api/v1/cart/items/<product_id>', methods=['PUT'])
+def set_item_quantity(product_id):
+    session_id = request.headers.get('X-Session-ID')
+    if not session_id:
+        return jsonify({'error': 'X-Session-ID header is required'}), 400
+
+    data = request.get_json(silent=True)
+    if not data or 'quantity' not in data:
+        return jsonify({'error': 'quantity is required'}), 400
+    try:
+        quantity = check_quantity(data['quantity'], 0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return _cart_response(*store.mutate('set', session_id, product_id, quantity))
+
+@app.route('/api/v1/cart/items/<product_id>', methods=['DELETE'])
+def remove_item(product_id):
+    session_id = request.headers.get('X-Session-ID')
+    if not session_id:
+        return jsonify({'error': 'X-Session-ID header is required'}), 400
+    return _cart_response(*store.mutate('remove', session_id, product_id))
+
+@app.route('/api/v1/cart', methods=['DELETE'])
+def clear_cart():
+    session_id = request.headers.get('X-Session-ID')
+    if not session_id:
+        return jsonify({'error': 'X-Session-ID header is required'}), 400
+    return _cart_response(*store.mutate('clear', session_id))
 
-    product_id = data['product_id']
-    quantity = data['quantity']
-
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    # Check if cart exists
-    cur.execute("SELECT * FROM carts WHERE session_id = %s", (session_id,))
-    cart = cur.fetchone()
-
-    if cart is None:
-        # Create new cart
-        cur.execute("INSERT INTO carts (session_id, items) VALUES (%s, %s) RETURNING *", 
-                    (session_id, json.dumps([{'product_id': product_id, 'quantity': quantity}])))
-        new_cart = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify(new_cart), 201
-    else:
-        # Update existing cart
-        items = cart['items']
-        found = False
-        for item in items:
-            if item['product_id'] == product_id:
-                item['quantity'] += quantity
-                found = True
-                break
-        if not found:
-            items.append({'product_id': product_id, 'quantity': quantity})
-        
-        cur.execute("UPDATE carts SET items = %s WHERE session_id = %s RETURNING *", 
-                    (json.dumps(items), session_id))
-        updated_cart = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify(updated_cart)
+@app.route('/api/v1/cart/store/stats')
+def get_store_stats():
+    return jsonify(store.stats())
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
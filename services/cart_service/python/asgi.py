@@ -0,0 +1,154 @@
+"""Asyncio (ASGI) serving mode of the cart service.
+
+Serves the same routes and JSON documents as ``app.py`` from one event loop
+per process. Mutations run the same single-statement upserts from
+``cart_store``, rewritten for asyncpg's numbered parameters. The in-memory hot
+tier (``CART_STORE_MODE``) is thread-based and only available in Flask mode.
+
+    SERVER_MODE=asgi python -m polyglot_common.serve
+"""
+import re
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.routing import Route
+
+from polyglot_common.asgi import JSONResponse, MetricsMiddleware, connection, error, fetchrow, lifespan, metrics
+from polyglot_common.metrics import METRICS_ENDPOINT
+from cart_store import STATEMENTS, check_quantity, empty_cart, store
+from product_client import ProductServiceError, expand_products
+
+if store.mode != 'off':
+    raise ValueError('CART_STORE_MODE must be off in ASGI mode')
+
+
+def _numbered(statement):
+    """Rewrite pyformat ``%(name)s`` parameters as ``$n``; returns the SQL and parameter names."""
+    names = []
+
+    def placeholder(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f'${names.index(match.group(1)) + 1}'
+    return re.sub(r'%\((\w+)\)s', placeholder, statement), names
+
+
+STATEMENTS_NUMBERED = {op: _numbered(statement) for op, statement in STATEMENTS.items()}
+
+
+async def load_cart(session_id):
+    return await fetchrow("SELECT * FROM carts WHERE session_id = $1", session_id)
+
+
+async def mutate_cart(op, session_id, product_id=None, quantity=None):
+    """Run one mutation statement; returns (cart, created)."""
+    if op == 'set' and quantity == 0:
+        op = 'remove'
+    statement, names = STATEMENTS_NUMBERED[op]
+    values = {'session_id': session_id, 'product_id': product_id, 'quantity': quantity}
+    async with connection() as conn:
+        row = await conn.fetchrow(statement, *(values[name] for name in names))
+    if row is None:
+        return empty_cart(session_id), False
+    cart = dict(row)
+    return cart, cart.pop('inserted')
+
+
+def _session_id(request):
+    return request.headers.get('X-Session-ID')
+
+
+async def _json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def _cart_response(cart, created=False):
+    return JSONResponse(cart, status_code=201 if created else 200)
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok", "uptime_seconds": 0, "version": "0.0.1"})
+
+
+async def get_cart(request: Request):
+    session_id = _session_id(request)
+    if not session_id:
+        return error('X-Session-ID header is required', 400)
+
+    cart = await load_cart(session_id) or empty_cart(session_id)
+    if request.query_params.get('expand') == 'products':
+        try:
+            # The product client is blocking; keep it off the event loop.
+            cart = await run_in_threadpool(expand_products, cart)
+        except ProductServiceError as e:
+            return error(str(e), 502)
+    return JSONResponse(cart)
+
+
+async def add_to_cart(request: Request):
+    session_id = _session_id(request)
+    if not session_id:
+        return error('X-Session-ID header is required', 400)
+
+    data = await _json(request)
+    if not isinstance(data, dict) or 'product_id' not in data or 'quantity' not in data:
+        return error('product_id and quantity are required', 400)
+    try:
+        quantity = check_quantity(data['quantity'], 1)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    return _cart_response(*await mutate_cart('add', session_id, str(data['product_id']), quantity))
+
+
+async def set_item_quantity(request: Request):
+    session_id = _session_id(request)
+    if not session_id:
+        return error('X-Session-ID header is required', 400)
+
+    data = await _json(request)
+    if not isinstance(data, dict) or 'quantity' not in data:
+        return error('quantity is required', 400)
+    try:
+        quantity = check_quantity(data['quantity'], 0)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    return _cart_response(*await mutate_cart('set', session_id, request.path_params['product_id'], quantity))
+
+
+async def remove_item(request: Request):
+    session_id = _session_id(request)
+    if not session_id:
+        return error('X-Session-ID header is required', 400)
+    return _cart_response(*await mutate_cart('remove', session_id, request.path_params['product_id']))
+
+
+async def clear_cart(request: Request):
+    session_id = _session_id(request)
+    if not session_id:
+        return error('X-Session-ID header is required', 400)
+    return _cart_response(*await mutate_cart('clear', session_id))
+
+
+async def get_store_stats(request):
+    return JSONResponse(store.stats())
+
+
+routes = [
+    Route('/healthz', healthz),
+    Route('/metrics', metrics, name=METRICS_ENDPOINT),
+    Route('/api/v1/cart', get_cart, methods=['GET']),
+    Route('/api/v1/cart', add_to_cart, methods=['POST']),
+    Route('/api/v1/cart', clear_cart, methods=['DELETE']),
+    Route('/api/v1/cart/items/{product_id}', set_item_quantity, methods=['PUT']),
+    Route('/api/v1/cart/items/{product_id}', remove_item, methods=['DELETE']),
+    Route('/api/v1/cart/store/stats', get_store_stats),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, service='cart_service', routes=routes)
@@ -0,0 +1,370 @@
+"""Cart persistence, with an optional in-memory hot tier in front of Postgres.
+
+Every mutation is one of ``add``, ``set``, ``remove`` or ``clear``. By
+default (``CART_STORE_MODE=off``) each runs as a single atomic statement
+against the ``carts`` table. The hot tier keeps recently used carts in a
+bounded LRU and serves reads from it:
+
+- ``write-through``: the statement still runs on every mutation and the
+  returned cart is cached, so a write is durable once acknowledged.
+- ``write-behind``: mutations are applied in memory and the cart is marked
+  dirty. A background thread flushes dirty carts with one multi-row upsert
+  every ``CART_STORE_FLUSH_INTERVAL_S`` seconds, or sooner once
+  ``CART_STORE_FLUSH_MAX_DIRTY`` carts are waiting. Up to one interval of
+  writes can be lost if the process dies.
+
+The hot tier lives in each process, so with several workers a session must
+always be routed to the same one (sticky sessions or a single worker);
+otherwise workers serve each other stale carts.
+"""
+import atexit
+import collections
+import copy
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from polyglot_common.db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+MODES = ('off', 'write-through', 'write-behind')
+
+# Mutations are single statements that rewrite `items` inside Postgres. The
+# upsert's row lock serializes concurrent requests for one session, and each
+# statement sees the latest committed items, so no update is lost and two
+# first requests cannot both insert the cart.
+ITEMS = "jsonb_array_elements(coalesce(carts.items, '[]'::jsonb)) WITH ORDINALITY AS e(item, pos)"
+HAS_ITEM = f"EXISTS (SELECT 1 FROM {ITEMS} WHERE item->>'product_id' = %(product_id)s)"
+# Strictly increasing per cart, in commit order: the row lock makes a waiting
+# statement evaluate this after the previous writer committed. The write-through
+# tier relies on it to keep the newest of two concurrently returned carts.
+NEXT_UPDATED_AT = "greatest(clock_timestamp(), carts.updated_at + interval '1 microsecond')"
+NEW_ITEM = "jsonb_build_array(jsonb_build_object('product_id', %(product_id)s::text, 'quantity', %(quantity)s::int))"
+
+
+def _upsert_item(quantity_sql):
+    return f"""
+        INSERT INTO carts (session_id, items) VALUES (%(session_id)s, {NEW_ITEM})
+        ON CONFLICT (session_id) DO UPDATE SET updated_at = {NEXT_UPDATED_AT}, items = CASE
+            WHEN {HAS_ITEM} THEN (
+                SELECT jsonb_agg(CASE WHEN item->>'product_id' = %(product_id)s
+                                      THEN jsonb_set(item, '{{quantity}}', to_jsonb({quantity_sql}))
+                                      ELSE item END ORDER BY pos)
+                FROM {ITEMS})
+            ELSE coalesce(carts.items, '[]'::jsonb) || EXCLUDED.items
+        END
+        RETURNING *, (xmax = 0) AS inserted"""
+
+
+ADD_ITEM_SQL = _upsert_item("(item->>'quantity')::int + %(quantity)s::int")
+SET_ITEM_SQL = _upsert_item("%(quantity)s::int")
+REMOVE_ITEM_SQL = f"""
+    UPDATE carts SET updated_at = {NEXT_UPDATED_AT}, items = coalesce(
+        (SELECT jsonb_agg(item ORDER BY pos) FROM {ITEMS} WHERE item->>'product_id' <> %(product_id)s),
+        '[]'::jsonb)
+    WHERE session_id = %(session_id)s
+    RETURNING *, false AS inserted"""
+CLEAR_SQL = f"""
+    UPDATE carts SET items = '[]'::jsonb, updated_at = {NEXT_UPDATED_AT}
+    WHERE session_id = %(session_id)s
+    RETURNING *, false AS inserted"""
+
+STATEMENTS = {'add': ADD_ITEM_SQL, 'set': SET_ITEM_SQL, 'remove': REMOVE_ITEM_SQL, 'clear': CLEAR_SQL}
+
+# Write-behind flush: last writer wins, which is what the hot tier holds.
+FLUSH_SQL = """
+    INSERT INTO carts (id, session_id, items, updated_at) VALUES %s
+    ON CONFLICT (session_id) DO UPDATE SET items = EXCLUDED.items, updated_at = EXCLUDED.updated_at"""
+
+
+def empty_cart(session_id):
+    return {'id': '', 'session_id': session_id, 'items': []}
+
+
+def load_cart(session_id):
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT * FROM carts WHERE session_id = %s", (session_id,))
+        cart = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    return cart
+
+
+def mutate_cart(op, session_id, product_id=None, quantity=None):
+    """Run one mutation statement; returns (cart, created)."""
+    if op == 'set' and quantity == 0:
+        op = 'remove'
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(STATEMENTS[op], {'session_id': session_id, 'product_id': product_id, 'quantity': quantity})
+        cart = cur.fetchone()
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    if cart is None:
+        return empty_cart(session_id), False
+    return cart, cart.pop('inserted')
+
+
+def _older(cart, than):
+    """Whether ``cart`` is an earlier version of the stored cart ``than``."""
+    return (cart.get('updated_at') is not None and than.get('updated_at') is not None
+            and cart['updated_at'] < than['updated_at'])
+
+
+class CartStoreBacklogged(Exception):
+    """Write-behind mode has too many evicted carts waiting for Postgres."""
+
+
+def check_quantity(value, minimum):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f'quantity must be an integer of at least {minimum}')
+    return value
+
+
+def apply_mutation(items, op, product_id=None, quantity=None):
+    """In-memory equivalent of the mutation statements; returns the new items."""
+    if op == 'clear':
+        return []
+    if op == 'remove' or (op == 'set' and quantity == 0):
+        return [item for item in items if str(item['product_id']) != product_id]
+    items = [dict(item) for item in items]
+    matched = False
+    for item in items:
+        if str(item['product_id']) == product_id:
+            item['quantity'] = item['quantity'] + quantity if op == 'add' else quantity
+            matched = True
+    if not matched:
+        items.append({'product_id': product_id, 'quantity': quantity})
+    return items
+
+
+class _Entry:
+    __slots__ = ('cart', 'version', 'flushed_version')
+
+    def __init__(self, cart):
+        self.cart = cart
+        self.version = self.flushed_version = 0
+
+    @property
+    def dirty(self):
+        return self.version != self.flushed_version
+
+
+class CartStore:
+    def __init__(self, mode=None, max_sessions=None, flush_interval=None, flush_max_dirty=None,
+                 max_evicted_dirty=None):
+        env = os.environ
+        self.mode = mode or env.get('CART_STORE_MODE', 'off')
+        if self.mode not in MODES:
+            raise ValueError(f'CART_STORE_MODE must be one of {", ".join(MODES)}')
+        self.max_sessions = int(max_sessions if max_sessions is not None
+                                else env.get('CART_STORE_MAX_SESSIONS', 10000))
+        self.flush_interval = float(flush_interval if flush_interval is not None
+                                    else env.get('CART_STORE_FLUSH_INTERVAL_S', 1))
+        self.flush_max_dirty = int(flush_max_dirty if flush_max_dirty is not None
+                                   else env.get('CART_STORE_FLUSH_MAX_DIRTY', 500))
+        self.max_evicted_dirty = int(max_evicted_dirty if max_evicted_dirty is not None
+                                     else env.get('CART_STORE_MAX_EVICTED_DIRTY', 10000))
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._entries = collections.OrderedDict()
+        # Dirty carts pushed out of the LRU, kept until they are flushed.
+        self._evicted = {}
+        self._flusher = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.flushed_carts = 0
+        self.flush_errors = 0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Carts inherited from the parent are its responsibility.
+            self._reset_state()
+
+    def _ensure_flusher(self):
+        if self.mode == 'write-behind' and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='cart-store-flush', daemon=True)
+            self._flusher.start()
+
+    def get(self, session_id):
+        if self.mode == 'off':
+            return load_cart(session_id) or empty_cart(session_id)
+        with self._lock:
+            self._check_pid()
+            entry = self._lookup(session_id)
+            if entry is not None:
+                return copy.deepcopy(entry.cart)
+        return copy.deepcopy(self._load(session_id).cart)
+
+    def mutate(self, op, session_id, product_id=None, quantity=None):
+        """Apply a mutation; returns (cart, created)."""
+        if self.mode == 'off':
+            return mutate_cart(op, session_id, product_id, quantity)
+        if self.mode == 'write-through':
+            cart, created = mutate_cart(op, session_id, product_id, quantity)
+            with self._lock:
+                self._check_pid()
+                # Concurrent mutations of one session can get here in either
+                # order; never replace a newer cart with an older one.
+                cached = self._entries.get(session_id)
+                if cached is None or not _older(cart, cached.cart):
+                    self._put(session_id, _Entry(cart))
+            return copy.deepcopy(cart), created
+
+        with self._lock:
+            self._check_pid()
+            self._ensure_flusher()
+            if session_id not in self._entries and len(self._evicted) >= self.max_evicted_dirty:
+                # Postgres has not taken flushes for a while; taking this
+                # session in would push out yet another unsaved cart.
+                self._wakeup.set()
+                raise CartStoreBacklogged(f'{len(self._evicted)} evicted carts are waiting to be saved')
+            entry = self._lookup(session_id)
+        if entry is None:
+            entry = self._load(session_id)
+        with self._lock:
+            # Re-check: another request may have loaded the session meanwhile.
+            entry = self._lookup(session_id, count=False) or entry
+            cart = entry.cart
+            items = apply_mutation(cart['items'] or [], op, product_id, quantity)
+            created = False
+            if not cart['id']:
+                # Not in Postgres yet; the flush inserts it under this id.
+                if op in ('remove', 'clear'):
+                    return copy.deepcopy(cart), False
+                cart['id'] = str(uuid.uuid4())
+                created = True
+            cart['items'] = items
+            cart['updated_at'] = datetime.now(timezone.utc)
+            entry.version += 1
+            self._put(session_id, entry)
+            dirty = sum(1 for e in self._entries.values() if e.dirty) + len(self._evicted)
+            result = copy.deepcopy(cart)
+        if dirty >= self.flush_max_dirty:
+            self._wakeup.set()
+        return result, created
+
+    def _lookup(self, session_id, count=True):
+        entry = self._entries.get(session_id) or self._evicted.get(session_id)
+        if count:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is not None:
+            self._put(session_id, entry)
+        return entry
+
+    def _load(self, session_id):
+        cart = load_cart(session_id)
+        entry = _Entry(cart or empty_cart(session_id))
+        with self._lock:
+            existing = self._entries.get(session_id) or self._evicted.get(session_id)
+            if existing is not None:
+                return existing
+            if len(self._evicted) < self.max_evicted_dirty:
+                self._put(session_id, entry)
+        return entry
+
+    def _put(self, session_id, entry):
+        self._evicted.pop(session_id, None)
+        self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            victim_id, victim = self._entries.popitem(last=False)
+            self.evictions += 1
+            if victim.dirty:
+                self._evicted[victim_id] = victim
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Cart flush failed')
+
+    def flush(self):
+        """Write all dirty carts to Postgres in one multi-row upsert."""
+        with self._flush_lock:
+            with self._lock:
+                self._check_pid()
+                pending = [(session_id, entry, entry.version)
+                           for session_id, entry in list(self._entries.items()) + list(self._evicted.items())
+                           if entry.dirty]
+                rows = [(entry.cart['id'], session_id, json.dumps(entry.cart['items']), entry.cart['updated_at'])
+                        for session_id, entry, _ in pending]
+            if not rows:
+                return 0
+            try:
+                conn = get_db_connection()
+                try:
+                    cur = conn.cursor()
+                    execute_values(cur, FLUSH_SQL, rows, page_size=len(rows))
+                    conn.commit()
+                    cur.close()
+                finally:
+                    conn.close()
+            except psycopg2.Error as e:
+                with self._lock:
+                    self.flush_errors += 1
+                logger.warning('Could not flush %d carts, will retry: %s', len(rows), e)
+                return 0
+            with self._lock:
+                for session_id, entry, version in pending:
+                    entry.flushed_version = max(entry.flushed_version, version)
+                    if not entry.dirty and self._evicted.get(session_id) is entry:
+                        del self._evicted[session_id]
+                self.flushes += 1
+                self.flushed_carts += len(rows)
+            return len(rows)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'mode': self.mode,
+                'sessions': len(self._entries),
+                'max_sessions': self.max_sessions,
+                'dirty': sum(1 for e in self._entries.values() if e.dirty) + len(self._evicted),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'flushes': self.flushes,
+                'flushed_carts': self.flushed_carts,
+                'flush_errors': self.flush_errors,
+            }
+
+
+store = CartStore()
+
+
+@atexit.register
+def _flush_on_exit():
+    if store.mode == 'write-behind':
+        try:
+            store.flush()
+        except Exception:
+            logger.exception('Final cart flush failed')
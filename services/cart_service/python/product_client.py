@@ -0,0 +1,68 @@
+"""Client for product_service's batch lookup endpoint, and cart expansion on top of it."""
+import json
+import os
+import urllib.error
+import urllib.request
+
+PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://product_service:8080')
+PRODUCT_SERVICE_TIMEOUT_S = float(os.environ.get('PRODUCT_SERVICE_TIMEOUT_S', 2))
+BATCH_SIZE = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', 100))
+
+
+class ProductServiceError(Exception):
+    """Raised when product_service cannot be reached or returns an error."""
+
+
+def _post_batch(ids):
+    body = json.dumps({'ids': ids}).encode('utf-8')
+    req = urllib.request.Request(PRODUCT_SERVICE_URL.rstrip('/') + '/api/v1/products/batch', data=body,
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(req, timeout=PRODUCT_SERVICE_TIMEOUT_S) as resp:
+            return json.loads(resp.read())
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise ProductServiceError(f'Product lookup failed: {e}')
+
+
+def fetch_products(product_ids):
+    """Map each product id to its product, or None if it does not exist.
+
+    Uses one request per ``BATCH_SIZE`` distinct ids instead of one per item.
+    """
+    ids = list(dict.fromkeys(product_ids))
+    products = {}
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        result = _post_batch(chunk)
+        missing = set(result.get('missing', []))
+        found = iter(result.get('items', []))
+        # Items come back in request order, minus the missing ones.
+        for product_id in chunk:
+            products[product_id] = None if product_id in missing else next(found, None)
+    return products
+
+
+def expand_products(cart):
+    """Attach product details, line totals and cart totals to `cart`.
+
+    All products are fetched with batch lookups rather than one request per
+    line item. Items whose product no longer exists get `product: null` and
+    are listed in `missing_product_ids`.
+    """
+    items = cart['items'] or []
+    products = fetch_products([str(item['product_id']) for item in items])
+    lines, missing, subtotals = [], [], {}
+    item_count = 0
+    for item in items:
+        product = products.get(str(item['product_id']))
+        line = dict(item, product=product, line_total_cents=None)
+        if product is None:
+            missing.append(item['product_id'])
+        else:
+            line['line_total_cents'] = product['price_cents'] * item['quantity']
+            currency = product.get('currency') or 'USD'
+            subtotals[currency] = subtotals.get(currency, 0) + line['line_total_cents']
+            item_count += item['quantity']
+        lines.append(line)
+    return dict(cart, items=lines, missing_product_ids=missing,
+                totals={'item_count': item_count, 'subtotal_cents': subtotals})
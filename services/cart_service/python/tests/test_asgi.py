@@ -0,0 +1,77 @@
+import contextlib
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from starlette.testclient import TestClient
+
+from asgi import STATEMENTS_NUMBERED, app
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def conn():
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock()
+
+    @contextlib.asynccontextmanager
+    async def connection():
+        yield conn
+
+    with patch('asgi.connection', connection):
+        yield conn
+
+def test_statements_use_numbered_parameters():
+    statement, names = STATEMENTS_NUMBERED['add']
+    assert '%(' not in statement
+    assert names == ['session_id', 'product_id', 'quantity']
+    assert STATEMENTS_NUMBERED['clear'][1] == ['session_id']
+
+def test_add_to_cart_is_one_upsert(client, conn):
+    """Adding an item is a single statement; a new cart answers 201."""
+    conn.fetchrow.return_value = {'id': 'c1', 'session_id': 's1', 'inserted': True,
+                                  'items': [{'product_id': 'p1', 'quantity': 2}]}
+
+    rv = client.post('/api/v1/cart', headers={'X-Session-ID': 's1'}, json={'product_id': 'p1', 'quantity': 2})
+
+    assert rv.status_code == 201
+    assert 'inserted' not in rv.json()
+    statement, *params = conn.fetchrow.call_args[0]
+    assert 'ON CONFLICT (session_id)' in statement
+    assert params == ['s1', 'p1', 2]
+
+def test_set_quantity_zero_removes_item(client, conn):
+    """PUT with quantity 0 removes the line; removing from no cart returns an empty cart."""
+    conn.fetchrow.return_value = None
+
+    rv = client.put('/api/v1/cart/items/p1', headers={'X-Session-ID': 's1'}, json={'quantity': 0})
+
+    assert rv.status_code == 200
+    assert rv.json()['items'] == []
+    statement, *params = conn.fetchrow.call_args[0]
+    assert statement.strip().startswith('UPDATE carts')
+    assert params == ['p1', 's1']
+
+def test_cart_mutations_validate_input(client, conn):
+    """Missing sessions and bad quantities are rejected before touching the database."""
+    assert client.post('/api/v1/cart', json={'product_id': 'p1', 'quantity': 1}).status_code == 400
+    headers = {'X-Session-ID': 's1'}
+    assert client.post('/api/v1/cart', headers=headers, json={'product_id': 'p1', 'quantity': 0}).status_code == 400
+    assert client.post('/api/v1/cart', headers=headers, json={'product_id': 'p1', 'quantity': '2'}).status_code == 400
+    assert client.put('/api/v1/cart/items/p1', headers=headers, json={'quantity': -1}).status_code == 400
+    assert client.put('/api/v1/cart/items/p1', headers=headers, content=b'not json').status_code == 400
+    conn.fetchrow.assert_not_called()
+
+@patch('asgi.expand_products')
+@patch('asgi.fetchrow', new_callable=AsyncMock)
+def test_get_cart_expands_products(mock_fetchrow, mock_expand_products, client):
+    mock_fetchrow.return_value = None
+    mock_expand_products.side_effect = lambda cart: dict(cart, expanded=True)
+
+    rv = client.get('/api/v1/cart?expand=products', headers={'X-Session-ID': 's1'})
+
+    assert rv.status_code == 200
+    assert rv.json()['expanded'] is True
+    assert rv.json()['session_id'] == 's1'
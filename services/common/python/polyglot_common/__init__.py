@@ -0,0 +1 @@
+"""Shared runtime helpers for the Python services."""
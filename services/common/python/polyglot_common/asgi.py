@@ -0,0 +1,216 @@
+"""Building blocks for the services' asyncio (ASGI) serving mode.
+
+The Flask apps hold a thread (and a pooled psycopg2 connection) for every
+request in flight, so their concurrency is bounded by workers x threads. In
+ASGI mode one event loop per process serves any number of requests, and
+waits on Postgres without holding a thread. This module provides:
+
+- an asyncpg pool per process (``fetch``, ``fetchrow``), configured by the
+  same ``DB_*`` variables as ``polyglot_common.db``; connections older than
+  ``DB_POOL_MAX_LIFETIME_S`` are closed on release, and ``jsonb`` columns
+  decode to Python objects
+- ``JSONResponse`` / ``error``: orjson serialization producing the same
+  documents as Flask's ``jsonify`` (sorted keys, HTTP dates, decimals as
+  strings), so both modes honour one contract
+- ``MetricsMiddleware`` and ``metrics``: the ``polyglot_common.metrics``
+  request, latency and query metrics, and ``/metrics``
+- ``lifespan``: closes the pool on shutdown
+
+Requires the ``asgi`` extra (starlette, asyncpg, orjson, uvicorn).
+"""
+import contextlib
+import contextvars
+import decimal
+import email.utils
+import os
+import re
+import time
+from datetime import date, datetime, timezone
+
+import asyncpg
+import orjson
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import Response
+from starlette.routing import Match
+
+from polyglot_common.metrics import (DB_QUERY_LATENCY, IN_FLIGHT, LATENCY, METRICS_ENDPOINT, REQUESTS,
+                                     UNMATCHED_ROUTE, _registry)
+
+_pool = None
+_max_lifetime = None
+_route = contextvars.ContextVar('route', default='background')
+_service = contextvars.ContextVar('service', default='')
+
+
+class _Connection(asyncpg.Connection):
+    """asyncpg connection that knows its age, for ``DB_POOL_MAX_LIFETIME_S``."""
+    __slots__ = ('created_at',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+
+
+async def _init_connection(conn):
+    for jsonb in ('json', 'jsonb'):
+        await conn.set_type_codec(jsonb, encoder=lambda value: orjson.dumps(value).decode(),
+                                  decoder=orjson.loads, schema='pg_catalog')
+
+
+async def get_pool():
+    """Return this process's asyncpg pool, creating it on first use."""
+    global _pool, _max_lifetime
+    if _pool is None:
+        env = os.environ
+        _max_lifetime = float(env.get('DB_POOL_MAX_LIFETIME_S', 1800))
+        _pool = await asyncpg.create_pool(
+            host=env.get('DB_HOST', 'postgres'),
+            database=env.get('DB_NAME', 'polyglot'),
+            user=env.get('DB_USER', 'pp'),
+            password=env.get('DB_PASSWORD', 'pp'),
+            min_size=int(env.get('DB_POOL_MIN_SIZE', 1)),
+            max_size=int(env.get('DB_POOL_MAX_SIZE', 10)),
+            init=_init_connection,
+            connection_class=_Connection,
+        )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+@contextlib.asynccontextmanager
+async def connection():
+    """A pooled connection whose queries are timed into ``db_query_duration_seconds``."""
+    pool = await get_pool()
+    timeout = float(os.environ.get('DB_POOL_TIMEOUT_S', 5))
+    async with pool.acquire(timeout=timeout) as conn:
+        yield _TimedConnection(conn)
+        if time.monotonic() - conn.created_at > _max_lifetime:
+            # As in polyglot_common.db; the pool opens a replacement on demand.
+            await conn.close()
+
+
+class _TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        attribute = getattr(self._conn, name)
+        if name not in ('fetch', 'fetchrow', 'fetchval', 'execute', 'executemany'):
+            return attribute
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attribute(*args, **kwargs)
+            finally:
+                _observe_query(time.perf_counter() - started)
+        return timed
+
+
+def _observe_query(seconds):
+    service = _service.get()
+    if service:
+        DB_QUERY_LATENCY.labels(service, _route.get()).observe(seconds)
+
+
+async def fetch(query, *args):
+    async with connection() as conn:
+        return [dict(row) for row in await conn.fetch(query, *args)]
+
+
+async def fetchrow(query, *args):
+    async with connection() as conn:
+        row = await conn.fetchrow(query, *args)
+    return dict(row) if row is not None else None
+
+
+def _default(value):
+    # Flask's default JSON provider: RFC 822 dates, decimals as strings.
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return email.utils.format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+    if isinstance(value, date):
+        return email.utils.format_datetime(datetime(value.year, value.month, value.day, tzinfo=timezone.utc),
+                                           usegmt=True)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(content):
+    return orjson.dumps(content, default=_default,
+                        option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+class JSONResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content):
+        return dumps(content)
+
+
+def error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+async def metrics(request):
+    return Response(generate_latest(_registry()), media_type=CONTENT_TYPE_LATEST)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await close_pool()
+
+
+class MetricsMiddleware:
+    """ASGI counterpart of ``instrument_app``.
+
+    The route label is the path template written the Flask way
+    (``/api/v1/products/<product_id>``), so both modes share dashboards.
+    """
+
+    def __init__(self, app, service, routes):
+        self.app = app
+        self.service = service
+        self.routes = [(route, re.sub(r'\{(\w+)(:\w+)?\}', r'<\1>', route.path)) for route in routes]
+
+    def _route(self, scope):
+        for route, template in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route, template
+        return None, UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        route, template = self._route(scope)
+        if route is not None and route.name == METRICS_ENDPOINT:
+            return await self.app(scope, receive, send)
+        method = scope['method']
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        _service.set(self.service)
+        _route.set(template)
+        in_flight = IN_FLIGHT.labels(self.service, template)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            LATENCY.labels(self.service, method, template).observe(time.perf_counter() - started)
+            REQUESTS.labels(self.service, method, template, str(status[0])).inc()
@@ -0,0 +1,313 @@
+"""Thread-safe PostgreSQL connection pool shared by the Python services.
+
+Opening a connection costs a TCP and authentication handshake, which used to
+be paid on every request. The pool keeps connections open and hands out
+proxies whose ``close()`` returns the connection instead of closing it, so
+request handlers keep the familiar ``conn = get_db_connection() ...
+conn.close()`` shape.
+
+Connections are validated with a ``SELECT 1`` when they have been idle for a
+while, recycled after a maximum lifetime, and rolled back before they are
+reused. Each process builds its own pool on first use and forgets inherited
+connections after a ``fork``, which keeps it safe under gunicorn's pre-fork
+workers as well as threaded servers.
+"""
+import collections
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the timeout."""
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.environ.get("DB_HOST", "postgres"),
+        database=os.environ.get("DB_NAME", "polyglot"),
+        user=os.environ.get("DB_USER", "pp"),
+        password=os.environ.get("DB_PASSWORD", "pp")
+    )
+
+
+class _Slot:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = self.last_used = time.monotonic()
+
+
+# Called with the duration in seconds of every query run through a pooled
+# connection; set by ``set_query_observer`` (see polyglot_common.metrics).
+_query_observer = None
+
+
+def set_query_observer(observer):
+    global _query_observer
+    _query_observer = observer
+
+
+class _TimedCursor:
+    """Cursor proxy that reports how long ``execute``/``executemany`` take."""
+
+    def __init__(self, cursor, observer):
+        self._cursor = cursor
+        self._observer = observer
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, vars)
+        finally:
+            self._observer(time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, vars_list)
+        finally:
+            self._observer(time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+
+class PooledConnection:
+    """Proxy for a pooled connection; ``close()`` hands it back to the pool."""
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+
+    def __getattr__(self, name):
+        if self._slot is None:
+            raise psycopg2.InterfaceError('connection already returned to the pool')
+        return getattr(self._slot.conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.__getattr__('cursor')(*args, **kwargs)
+        observer = _query_observer
+        return cursor if observer is None else _TimedCursor(cursor, observer)
+
+    @property
+    def closed(self):
+        return self._slot is None
+
+    def close(self):
+        if self._slot is not None:
+            slot, self._slot = self._slot, None
+            self._pool._release(slot)
+
+    def __del__(self):
+        # A handler that forgot to close must not leak the connection.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, connect=connect, min_size=None, max_size=None, timeout=None,
+                 max_lifetime=None, validate_after=None):
+        env = os.environ
+        self._connect = connect
+        self.min_size = int(min_size if min_size is not None else env.get('DB_POOL_MIN_SIZE', 1))
+        self.max_size = int(max_size if max_size is not None else env.get('DB_POOL_MAX_SIZE', 10))
+        self.timeout = float(timeout if timeout is not None else env.get('DB_POOL_TIMEOUT_S', 5))
+        self.max_lifetime = float(max_lifetime if max_lifetime is not None
+                                  else env.get('DB_POOL_MAX_LIFETIME_S', 1800))
+        self.validate_after = float(validate_after if validate_after is not None
+                                    else env.get('DB_POOL_VALIDATE_AFTER_S', 30))
+        if self.max_size < 1:
+            raise ValueError('DB_POOL_MAX_SIZE must be at least 1')
+        self.min_size = min(max(self.min_size, 0), self.max_size)
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = collections.deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Inherited sockets belong to the parent process; closing them
+            # here would tear down its sessions, so simply drop them.
+            self._reset_state()
+
+    def _open(self):
+        """Open a connection for a slot already reserved in ``_size``."""
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self.created += 1
+        return _Slot(conn)
+
+    def _close(self, slot):
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _usable(self, slot, now):
+        if slot.conn.closed:
+            return False
+        if now - slot.created_at > self.max_lifetime:
+            self.recycled += 1
+            return False
+        if now - slot.last_used > self.validate_after:
+            try:
+                cur = slot.conn.cursor()
+                cur.execute('SELECT 1')
+                cur.close()
+                slot.conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            with self._cond:
+                self._check_pid()
+                slot = self._idle.pop() if self._idle else None
+                if slot is None and self._size < self.max_size:
+                    self._size += 1
+                    grow = True
+                elif slot is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f'No database connection available after {timeout:g}s')
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                    continue
+                else:
+                    grow = False
+            if grow:
+                slot = self._open()
+            elif not self._usable(slot, time.monotonic()):
+                self._close(slot)
+                continue
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self.acquired += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            return PooledConnection(self, slot)
+
+    def _release(self, slot):
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+        conn = slot.conn
+        healthy = not conn.closed
+        if healthy and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Never hand a connection with an open or failed transaction to
+            # the next request; one that committed or rolled back needs no
+            # extra round trip.
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        if not healthy or time.monotonic() - slot.created_at > self.max_lifetime:
+            if healthy:
+                self.recycled += 1
+            self._close(slot)
+            return
+        slot.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(slot)
+            self._cond.notify()
+
+    def fill(self):
+        """Open connections until the pool holds ``min_size`` of them."""
+        while True:
+            with self._cond:
+                self._check_pid()
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            slot = self._open()
+            with self._cond:
+                self._idle.appendleft(slot)
+                self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), collections.deque()
+        for slot in idle:
+            self._close(slot)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'max_size': self.max_size,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'created': self.created,
+                'recycled': self.recycled,
+                'wait_time_total_s': self.wait_time_total,
+                'wait_time_max_s': self.wait_time_max,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's pool, creating it (and its minimum connections) on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool()
+                pool.fill()
+                _pool = pool
+    return _pool
+
+
+def get_db_connection():
+    return get_pool().getconn()
@@ -0,0 +1,17 @@
+"""gunicorn server hooks for the Flask services.
+
+    gunicorn -c python:polyglot_common.gunicorn_conf app:app
+
+With ``PROMETHEUS_MULTIPROC_DIR`` set, the directory is emptied before the
+workers start and a dead worker's live gauges (in-flight requests, pool
+sizes) are dropped, so ``/metrics`` totals stay right across restarts.
+"""
+from polyglot_common.metrics import mark_process_dead, reset_multiproc_dir
+
+
+def on_starting(server):
+    reset_multiproc_dir()
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
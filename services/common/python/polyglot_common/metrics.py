@@ -0,0 +1,165 @@
+"""Prometheus instrumentation for the Flask services.
+
+``instrument_app(app, service)`` adds, per route template (``/api/v1/products/<product_id>``,
+never the raw path, to keep label cardinality bounded):
+
+- ``http_requests_total{service, method, route, status}``
+- ``http_request_duration_seconds{service, method, route}`` (histogram)
+- ``http_requests_in_flight{service, route}``
+- ``db_query_duration_seconds{service, route}`` for every query run through
+  a ``polyglot_common.db`` pooled connection
+- ``db_pool_*`` gauges from the connection pool
+
+and serves them in the Prometheus text format on ``/metrics``.
+
+Under gunicorn's pre-fork workers, set ``PROMETHEUS_MULTIPROC_DIR`` to a
+writable directory before the app is imported. Every worker then writes its
+samples to memory-mapped files there and ``/metrics`` aggregates all of them
+whichever worker answers. ``polyglot_common.gunicorn_conf`` empties the
+directory on startup and marks dead workers; ``polyglot_common.serve`` uses
+it. Without the variable each process reports only its own metrics.
+"""
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               ProcessCollector, generate_latest, multiprocess)
+
+from polyglot_common import db
+
+# Service latencies are mostly milliseconds; the tail buckets catch timeouts.
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+POOL_STATS_INTERVAL_S = 1.0
+UNMATCHED_ROUTE = '<unmatched>'
+METRICS_ENDPOINT = 'prometheus_metrics'
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests handled',
+                   ['service', 'method', 'route', 'status'])
+LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency',
+                    ['service', 'method', 'route'], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being handled',
+                  ['service', 'route'], multiprocess_mode='livesum')
+DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Database query latency',
+                             ['service', 'route'], buckets=LATENCY_BUCKETS)
+POOL_GAUGES = {
+    stat: Gauge(f'db_pool_{stat}', description, ['service'], multiprocess_mode='livesum')
+    for stat, description in (
+        ('size', 'Open pooled connections'),
+        ('in_use', 'Pooled connections handed out'),
+        ('idle', 'Pooled connections waiting for reuse'),
+        ('waiting', 'Callers waiting for a connection'),
+        ('timeouts', 'Connection requests that timed out since the process started'),
+    )
+}
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else UNMATCHED_ROUTE
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # process_* metrics (memory, CPU) describe the worker that answers.
+        ProcessCollector(registry=registry)
+        return registry
+    return REGISTRY
+
+
+def reset_multiproc_dir():
+    """Create ``PROMETHEUS_MULTIPROC_DIR`` and delete samples of earlier runs.
+
+    Call before any worker starts: files left by a previous run would be
+    added to the new totals.
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith('.db'):
+            os.unlink(os.path.join(path, name))
+
+
+def mark_process_dead(pid):
+    """gunicorn ``child_exit`` hook: drop a dead worker's live gauges."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+class _Instrumentation:
+    def __init__(self, service):
+        self.service = service
+        # Label lookups cost more than the observations themselves, so the
+        # bound children are cached per label combination.
+        self._children = {}
+        self._pool_updated = 0.0
+
+    def child(self, metric, *labels):
+        key = (metric, labels)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = metric.labels(self.service, *labels)
+        return child
+
+    def before_request(self):
+        if request.endpoint == METRICS_ENDPOINT:
+            # Scrapes are not timed: they would skew real routes' numbers.
+            return
+        route = _route()
+        g._metrics_route = route
+        g._metrics_started = time.perf_counter()
+        self.child(IN_FLIGHT, route).inc()
+
+    def after_request(self, response):
+        self._finish(response.status_code)
+        return response
+
+    def teardown_request(self, exc):
+        # after_request is skipped when a view raises; count it as a 500.
+        self._finish(500)
+
+    def _finish(self, status):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return
+        route = g._metrics_route
+        elapsed = time.perf_counter() - started
+        self.child(IN_FLIGHT, route).dec()
+        self.child(LATENCY, request.method, route).observe(elapsed)
+        self.child(REQUESTS, request.method, route, str(status)).inc()
+        now = time.monotonic()
+        if now - self._pool_updated >= POOL_STATS_INTERVAL_S:
+            self._pool_updated = now
+            self.update_pool_stats()
+
+    def observe_query(self, seconds):
+        route = getattr(g, '_metrics_route', UNMATCHED_ROUTE) if has_request_context() else 'background'
+        self.child(DB_QUERY_LATENCY, route).observe(seconds)
+
+    def update_pool_stats(self):
+        pool = db._pool
+        if pool is None or pool._pid != os.getpid():
+            return
+        stats = pool.stats()
+        for stat, gauge in POOL_GAUGES.items():
+            self.child(gauge).set(stats[stat])
+
+
+def instrument_app(app, service):
+    """Record request, latency and DB metrics for ``app`` and serve ``/metrics``."""
+    instrumentation = _Instrumentation(service)
+    app.before_request(instrumentation.before_request)
+    app.after_request(instrumentation.after_request)
+    app.teardown_request(instrumentation.teardown_request)
+    db.set_query_observer(instrumentation.observe_query)
+
+    def metrics():
+        instrumentation.update_pool_stats()
+        return Response(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule('/metrics', METRICS_ENDPOINT, metrics)
+    return app
@@ -0,0 +1,57 @@
+"""Start a service in the serving mode chosen by ``SERVER_MODE``.
+
+Run from the service's directory, where ``app.py`` (Flask) and ``asgi.py``
+(Starlette) both live:
+
+- ``flask`` (default): ``flask run`` as before, or gunicorn with threaded
+  workers and the hooks of ``polyglot_common.gunicorn_conf`` when
+  ``WEB_CONCURRENCY`` is set
+- ``asgi``: uvicorn with ``WEB_CONCURRENCY`` event-loop processes (default 1)
+
+``PORT`` (default 8080) and ``FLASK_THREADS`` (default 8, threads per
+gunicorn worker) apply to both where meaningful. With ``WEB_CONCURRENCY`` set,
+``PROMETHEUS_MULTIPROC_DIR`` defaults to ``/tmp/prometheus-multiproc`` so
+``/metrics`` reports all workers.
+
+    SERVER_MODE=asgi WEB_CONCURRENCY=2 python -m polyglot_common.serve
+"""
+import os
+import sys
+
+from polyglot_common.metrics import reset_multiproc_dir
+
+MODES = ('flask', 'asgi')
+MULTIPROC_DIR = '/tmp/prometheus-multiproc'
+
+
+def command(env):
+    """argv that serves the current directory's app in ``env['SERVER_MODE']``."""
+    mode = env.get('SERVER_MODE', 'flask')
+    if mode not in MODES:
+        raise ValueError(f'SERVER_MODE must be one of {", ".join(MODES)}, not {mode!r}')
+    port = env.get('PORT', '8080')
+    workers = env.get('WEB_CONCURRENCY')
+    if mode == 'asgi':
+        return ['uvicorn', 'asgi:app', '--host', '0.0.0.0', '--port', port, '--workers', workers or '1']
+    if workers:
+        return ['gunicorn', '-c', 'python:polyglot_common.gunicorn_conf', 'app:app',
+                '--bind', f'0.0.0.0:{port}', '--workers', workers,
+                '--worker-class', 'gthread', '--threads', env.get('FLASK_THREADS', '8')]
+    return ['flask', 'run', '--host', '0.0.0.0', '--port', port]
+
+
+def main():
+    try:
+        argv = command(os.environ)
+    except ValueError as e:
+        sys.exit(str(e))
+    os.environ.setdefault('FLASK_APP', 'app.py')
+    if os.environ.get('WEB_CONCURRENCY'):
+        os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', MULTIPROC_DIR)
+    # Samples left by a previous run of this container would count again.
+    reset_multiproc_dir()
+    os.execvp(argv[0], argv)
+
+
+if __name__ == '__main__':
+    main()
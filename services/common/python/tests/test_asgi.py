@@ -0,0 +1,72 @@
+import asyncio
+import contextlib
+import decimal
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from flask import Flask
+
+from polyglot_common import asgi, serve
+from polyglot_common.asgi import dumps
+from polyglot_common.serve import command
+
+
+def test_dumps_matches_flask_jsonify():
+    document = {
+        'b': [1, 2.5, None, True],
+        'a': {'when': datetime(2024, 1, 1, 12, 30, tzinfo=timezone(timedelta(hours=2))),
+              'naive': datetime(2024, 1, 1), 'day': date(2024, 2, 29), 'price': decimal.Decimal('9.99')},
+        'title': 'Café',
+    }
+    with Flask(__name__).app_context() as context:
+        # Flask escapes non-ASCII characters, orjson writes UTF-8; same document.
+        expected = context.app.json.dumps(document, separators=(',', ':'), ensure_ascii=False)
+    assert dumps(document).decode() == expected
+
+
+def test_serve_command():
+    assert command({})[:2] == ['flask', 'run']
+    assert command({'WEB_CONCURRENCY': '4'})[:4] == [
+        'gunicorn', '-c', 'python:polyglot_common.gunicorn_conf', 'app:app']
+    assert command({'SERVER_MODE': 'asgi', 'PORT': '9000'}) == [
+        'uvicorn', 'asgi:app', '--host', '0.0.0.0', '--port', '9000', '--workers', '1']
+    with pytest.raises(ValueError):
+        command({'SERVER_MODE': 'tornado'})
+
+
+def test_serve_shares_metrics_between_workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(serve, 'MULTIPROC_DIR', str(tmp_path / 'multiproc'))
+    environ = {'PATH': os.environ.get('PATH', '')}
+    with patch.dict(os.environ, environ, clear=True), patch('os.execvp') as execvp:
+        serve.main()
+        assert 'PROMETHEUS_MULTIPROC_DIR' not in os.environ
+
+        os.environ['WEB_CONCURRENCY'] = '2'
+        serve.main()
+        assert os.environ['PROMETHEUS_MULTIPROC_DIR'] == str(tmp_path / 'multiproc')
+    assert (tmp_path / 'multiproc').is_dir()
+    assert execvp.call_args[0][0] == 'gunicorn'
+
+
+def test_connections_past_their_lifetime_are_closed_on_release(monkeypatch):
+    fresh, old = MagicMock(created_at=time.monotonic()), MagicMock(created_at=time.monotonic() - 120)
+    for conn in (fresh, old):
+        conn.close = AsyncMock()
+    monkeypatch.setattr(asgi, '_max_lifetime', 60)
+
+    async def use(conn):
+        @contextlib.asynccontextmanager
+        async def acquire(timeout):
+            yield conn
+        monkeypatch.setattr(asgi, '_pool', MagicMock(acquire=acquire))
+        async with asgi.connection():
+            pass
+
+    asyncio.run(use(fresh))
+    asyncio.run(use(old))
+    fresh.close.assert_not_awaited()
+    old.close.assert_awaited_once()
@@ -0,0 +1,91 @@
+import threading
+from unittest.mock import MagicMock
+
+import psycopg2.extensions
+import pytest
+
+from polyglot_common.db import ConnectionPool, PoolTimeout
+
+
+def make_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+def make_pool(**kwargs):
+    connect = MagicMock(side_effect=lambda: make_conn())
+    options = dict(min_size=0, max_size=2, timeout=0.05, max_lifetime=60, validate_after=60)
+    options.update(kwargs)
+    return ConnectionPool(connect=connect, **options), connect
+
+
+def test_close_returns_connection_for_reuse():
+    pool, connect = make_pool()
+    conn = pool.getconn()
+    raw = conn._slot.conn
+    conn.close()
+    conn.close()  # closing twice is harmless
+    assert pool.getconn()._slot.conn is raw
+    assert connect.call_count == 1
+
+
+def test_timeout_when_exhausted():
+    pool, _ = make_pool()
+    held = [pool.getconn(), pool.getconn()]
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['in_use'] == 2
+    assert stats['timeouts'] == 1
+    for conn in held:
+        conn.close()
+
+
+def test_waiter_gets_released_connection():
+    pool, _ = make_pool(timeout=2)
+    held = [pool.getconn(), pool.getconn()]
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.getconn()))
+    waiter.start()
+    held[0].close()
+    waiter.join()
+    assert len(result) == 1
+    assert pool.stats()['size'] == 2
+
+
+def test_open_transaction_is_rolled_back_on_release():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    raw = conn._slot.conn
+    raw.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    conn.close()
+    raw.rollback.assert_called_once()
+
+
+def test_idle_connection_is_not_rolled_back_on_release():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    raw = conn._slot.conn
+    conn.commit()
+    conn.close()
+    raw.rollback.assert_not_called()
+    assert pool.getconn()._slot.conn is raw
+
+
+def test_expired_connection_is_recycled():
+    pool, connect = make_pool(max_lifetime=0)
+    pool.getconn().close()
+    pool.getconn().close()
+    assert connect.call_count == 2
+    assert pool.stats()['recycled'] >= 1
+
+
+def test_broken_idle_connection_is_replaced():
+    pool, connect = make_pool(validate_after=0)
+    conn = pool.getconn()
+    conn._slot.conn.cursor.return_value.execute.side_effect = psycopg2.OperationalError('gone')
+    conn.close()
+    pool.getconn()
+    assert connect.call_count == 2
@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+from polyglot_common import db, gunicorn_conf
+from polyglot_common.metrics import instrument_app, reset_multiproc_dir
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/items/<item_id>')
+    def get_item(item_id):
+        conn = db.PooledConnection(MagicMock(), db._Slot(MagicMock()))
+        conn.cursor().execute('SELECT 1')
+        return {'id': item_id}
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    return instrument_app(app, service='test_service')
+
+
+def scrape(client):
+    rv = client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain')
+    return rv.get_data(as_text=True)
+
+
+def test_requests_are_counted_per_route_template():
+    client = make_app().test_client()
+    for item_id in ('a', 'b'):
+        assert client.get(f'/items/{item_id}').status_code == 200
+    client.get('/missing')
+    body = scrape(client)
+    labels = 'method="GET",route="/items/<item_id>",service="test_service"'
+    assert f'http_requests_total{{{labels},status="200"}} 2.0' in body
+    assert f'http_request_duration_seconds_count{{{labels}}} 2.0' in body
+    assert 'route="<unmatched>"' in body
+    assert 'db_query_duration_seconds_count{route="/items/<item_id>",service="test_service"} 2.0' in body
+    assert 'route="/metrics"' not in body
+    db.set_query_observer(None)
+
+
+def test_unhandled_errors_count_as_500():
+    app = make_app()
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = app.test_client()
+    assert client.get('/boom').status_code == 500
+    body = scrape(client)
+    assert 'route="/boom",service="test_service",status="500"} 1.0' in body
+    assert 'http_requests_in_flight{route="/boom",service="test_service"} 0.0' in body
+    db.set_query_observer(None)
+
+
+def test_reset_multiproc_dir_removes_stale_samples(tmp_path, monkeypatch):
+    path = tmp_path / 'multiproc'
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(path))
+    reset_multiproc_dir()
+    (path / 'counter_123.db').write_bytes(b'stale')
+    (path / 'keep.txt').write_text('not a sample')
+
+    reset_multiproc_dir()
+
+    assert [entry.name for entry in path.iterdir()] == ['keep.txt']
+
+
+def test_gunicorn_child_exit_marks_the_worker_dead():
+    with patch('polyglot_common.gunicorn_conf.mark_process_dead') as mark_process_dead:
+        gunicorn_conf.child_exit(MagicMock(), MagicMock(pid=4321))
+    mark_process_dead.assert_called_once_with(4321)
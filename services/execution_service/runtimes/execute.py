@@ -1,69 +1,312 @@
 #!/usr/bin/env python3
-import sys
+"""Run Python snippets inside the execution sandbox.
+
+One-shot mode (the default) reads a program from stdin, runs it in a fresh
+interpreter and prints a JSON result.
+
+Server mode (``--server``) keeps a warm parent interpreter, optionally with
+modules preloaded, and forks an isolated child per request so programs skip
+interpreter startup and import cost. Requests are JSON lines such as
+``{"id": 1, "code": "print(1)", "stdin": "", "timeout": 5}`` read from stdin,
+or from connections on a Unix socket with ``--socket PATH``; each gets one JSON
+result line back. Children run in their own session with CPU, address-space
+and open-file rlimits applied.
+
+Tests (Linux): ``python -m pytest tests`` from this directory.
+"""
+import argparse
+import importlib
+import json
 import os
-import subprocess
-import tempfile
+import resource
+import selectors
 import signal
+import socket
+import sys
+import tempfile
 import time
+import traceback
+
+TIMEOUT_SECONDS = int(os.environ.get('EXECUTE_TIMEOUT_S', 30))
+MAX_MEMORY_BYTES = int(os.environ.get('EXECUTE_MAX_MEMORY_MB', 512)) * 1024 * 1024
+MAX_OPEN_FILES = int(os.environ.get('EXECUTE_MAX_OPEN_FILES', 64))
+MAX_OUTPUT_BYTES = int(os.environ.get('EXECUTE_MAX_OUTPUT_BYTES', 1024 * 1024))
+
+
+def _lower_limit(kind, value):
+    soft, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(kind, (value, hard if kind == resource.RLIMIT_CPU else value))
+
+
+def apply_limits(timeout):
+    # The CPU limit is a backstop for the wall-clock deadline enforced by the
+    # parent; SIGXCPU fires at the soft limit, SIGKILL at the hard one.
+    _lower_limit(resource.RLIMIT_CPU, int(timeout) + 1)
+    _lower_limit(resource.RLIMIT_AS, MAX_MEMORY_BYTES)
+    _lower_limit(resource.RLIMIT_NOFILE, MAX_OPEN_FILES)
+
+
+def _resident_kb():
+    """Resident set size of this process in kilobytes (Linux), or 0 if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _spawn(target, timeout, limits=False):
+    """Fork a child wired to fresh stdio pipes and run ``target()`` in it.
+
+    With ``limits``, the child gets the rlimits of ``apply_limits``; only
+    server mode sets it, one-shot runs keep the interpreter's own limits.
+    Returns the pipes and the resident size the child inherits at the fork.
+    """
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    inherited_kb = _resident_kb()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setsid()
+            os.dup2(stdin_r, 0)
+            os.dup2(stdout_w, 1)
+            os.dup2(stderr_w, 2)
+            os.closerange(3, os.sysconf('SC_OPEN_MAX'))
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            if limits:
+                apply_limits(timeout)
+            target()
+        except BaseException:
+            traceback.print_exc()
+        os._exit(1)
+    for fd in (stdin_r, stdout_w, stderr_w):
+        os.close(fd)
+    return pid, stdin_w, stdout_r, stderr_r, inherited_kb
+
+
+def _collect(pid, stdin_w, stdout_r, stderr_r, inherited_kb, stdin_data, timeout, started, own_image=False):
+    """Feed stdin, drain stdout/stderr until EOF or the deadline, then reap.
+
+    ``peak_memory_kb`` is the child's peak resident size. A forked child
+    starts out sharing the parent's pages, so for server mode (``own_image``
+    false) the parent's resident size at the fork is subtracted, and the
+    figure approximates what the snippet added on top of the warm server
+    (clamped at zero). One-shot children exec a
+    fresh interpreter, and their figure includes that interpreter.
+    """
+    deadline = started + timeout
+    buffers = {stdout_r: bytearray(), stderr_r: bytearray()}
+    output_bytes = {stdout_r: 0, stderr_r: 0}
+    first_output = None
+    timed_out = False
+    pending = stdin_data.encode('utf-8')
+
+    sel = selectors.DefaultSelector()
+    sel.register(stdout_r, selectors.EVENT_READ)
+    sel.register(stderr_r, selectors.EVENT_READ)
+    if pending:
+        os.set_blocking(stdin_w, False)
+        sel.register(stdin_w, selectors.EVENT_WRITE)
+    else:
+        os.close(stdin_w)
+
+    while len(sel.get_map()):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in sel.select(remaining):
+            fd = key.fd
+            if fd == stdin_w:
+                try:
+                    sent = os.write(fd, pending[:65536])
+                except BrokenPipeError:
+                    sent = len(pending)
+                pending = pending[sent:]
+                if not pending:
+                    sel.unregister(fd)
+                    os.close(fd)
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                sel.unregister(fd)
+                os.close(fd)
+                continue
+            if first_output is None:
+                first_output = time.monotonic()
+            output_bytes[fd] += len(chunk)
+            buf = buffers[fd]
+            if len(buf) < MAX_OUTPUT_BYTES:
+                buf += chunk[:MAX_OUTPUT_BYTES - len(buf)]
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Execution timed out")
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    for key in list(sel.get_map().values()):
+        os.close(key.fd)
+    sel.close()
 
-def execute_code(code):
-    # Set up timeout
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(30)  # 30 seconds timeout
+    _, status, usage = os.wait4(pid, 0)
+    ended = time.monotonic()
+    return {
+        'success': not timed_out and os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0,
+        'stdout': buffers[stdout_r].decode('utf-8', errors='replace'),
+        'stderr': (f'Execution timed out after {timeout} seconds' if timed_out
+                   else buffers[stderr_r].decode('utf-8', errors='replace')),
+        'exit_code': os.waitstatus_to_exitcode(status),
+        'execution_time': int((ended - started) * 1000),
+        'first_output_ms': None if first_output is None else round((first_output - started) * 1000, 3),
+        'cpu_user_ms': round(usage.ru_utime * 1000, 3),
+        'cpu_system_ms': round(usage.ru_stime * 1000, 3),
+        # ru_maxrss is in kilobytes on Linux.
+        'peak_memory_kb': usage.ru_maxrss if own_image else max(0, usage.ru_maxrss - inherited_kb),
+        'stdout_bytes': output_bytes[stdout_r],
+        'stderr_bytes': output_bytes[stderr_r],
+    }
 
+
+def _run_snippet(code):
+    """Child side of server mode: run ``code`` as ``__main__`` and exit."""
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', closefd=False, buffering=1)
+    sys.argv = ['main.py']
+    exit_code = 0
+    try:
+        exec(compile(code, 'main.py', 'exec'), {'__name__': '__main__', '__builtins__': __builtins__})
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # Hide this module's frame so the traceback starts in the snippet.
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception:
+        exit_code = exit_code or 1
+    os._exit(exit_code)
+
+
+def _error_result(message):
+    """Result of a request that failed before its program ran; same keys as ``_collect``."""
+    return {
+        'success': False,
+        'stdout': '',
+        'stderr': message,
+        'exit_code': None,
+        'execution_time': 0,
+        'first_output_ms': None,
+        'cpu_user_ms': None,
+        'cpu_system_ms': None,
+        'peak_memory_kb': None,
+        'stdout_bytes': 0,
+        'stderr_bytes': 0,
+    }
+
+
+def execute_code(code, stdin_data='', timeout=TIMEOUT_SECONDS):
+    """One-shot mode: run ``code`` in a fresh interpreter process."""
     try:
-        # Create temporary file
         with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
             f.write(code)
             temp_file = f.name
+        try:
+            started = time.monotonic()
+            handles = _spawn(lambda: os.execv(sys.executable, [sys.executable, temp_file]), timeout)
+            return _collect(*handles, stdin_data, timeout, started, own_image=True)
+        finally:
+            os.unlink(temp_file)
+    except Exception as e:
+        return _error_result(str(e))
+
 
-        # Execute the code
-        start_time = time.time()
-        result = subprocess.run(
-            [sys.executable, temp_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        end_time = time.time()
-
-        execution_time = int((end_time - start_time) * 1000)
-
-        # Clean up
-        os.unlink(temp_file)
-
-        return {
-            'success': result.returncode == 0,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'execution_time': execution_time
-        }
-
-    except subprocess.TimeoutExpired:
-        return {
-            'success': False,
-            'stdout': '',
-            'stderr': 'Execution timed out after 30 seconds',
-            'execution_time': 30000
-        }
+def handle_request(line):
+    """Server mode: run one JSON-line request in a forked child."""
+    started = time.monotonic()
+    request = {}
+    try:
+        request = json.loads(line)
+        timeout = min(float(request.get('timeout', TIMEOUT_SECONDS)), TIMEOUT_SECONDS)
+        code = request['code']
+        handles = _spawn(lambda: _run_snippet(code), timeout, limits=True)
+        result = _collect(*handles, request.get('stdin', ''), timeout, started)
     except Exception as e:
-        return {
-            'success': False,
-            'stdout': '',
-            'stderr': str(e),
-            'execution_time': 0
-        }
-    finally:
-        signal.alarm(0)  # Cancel the alarm
+        result = _error_result(str(e))
+    if isinstance(request, dict) and 'id' in request:
+        result['id'] = request['id']
+    return json.dumps(result)
 
-if __name__ == "__main__":
-    # Read code from stdin
-    code = sys.stdin.read()
-    result = execute_code(code)
 
-    # Output result as JSON
-    import json
-    print(json.dumps(result))
\ No newline at end of file
+def preload(modules):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f'Could not preload {name}: {e}', file=sys.stderr)
+
+
+def serve_stdio():
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(handle_request(line) + '\n')
+            sys.stdout.flush()
+
+
+def serve_socket(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    # Requests are handled one at a time; run one server per CPU to scale.
+    while True:
+        conn, _ = server.accept()
+        with conn, conn.makefile('rwb') as stream:
+            for line in stream:
+                if line.strip():
+                    stream.write(handle_request(line).encode('utf-8') + b'\n')
+                    stream.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', action='store_true', help='serve JSON-line requests from a warm interpreter')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of stdin/stdout')
+    parser.add_argument('--preload', default=os.environ.get('EXECUTE_PRELOAD', ''),
+                        help='comma-separated modules to import before serving')
+    args = parser.parse_args()
+
+    if not args.server:
+        # Read code from stdin
+        code = sys.stdin.read()
+        result = execute_code(code)
+
+        # Output result as JSON
+        print(json.dumps(result))
+        return
+
+    preload([name for name in args.preload.split(',') if name])
+    if args.socket:
+        serve_socket(args.socket)
+    else:
+        serve_stdio()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import os
+import resource
+import socket
+import threading
+import time
+
+import pytest
+
+import execute
+
+SCHEMA = set(execute._error_result('').keys())
+
+
+def run(code, **request):
+    return json.loads(execute.handle_request(json.dumps(dict(request, code=code))))
+
+
+def alive(pid):
+    """Whether ``pid`` is running (a killed process may linger as a zombie)."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] not in ('Z', 'X')
+    except FileNotFoundError:
+        return False
+
+
+def test_result_has_the_full_schema():
+    result = run('print("hi")', id=1)
+
+    assert set(result) == SCHEMA | {'id'}
+    assert result['success'] is True
+    assert result['stdout'] == 'hi\n'
+    assert result['exit_code'] == 0
+    assert result['stdout_bytes'] == 3
+    assert result['id'] == 1
+
+
+@pytest.mark.parametrize('line, message, keys', [
+    ('{"id": 7, "code": ', 'Expecting value', SCHEMA),
+    ('{"id": 7}', "'code'", SCHEMA | {'id'}),
+    ('{"id": 7, "code": "print(1)", "timeout": "soon"}', 'could not convert', SCHEMA | {'id'}),
+])
+def test_bad_requests_return_an_error_result(line, message, keys):
+    result = json.loads(execute.handle_request(line))
+
+    assert set(result) == keys
+    assert result['success'] is False
+    assert message in result['stderr']
+    assert result['exit_code'] is None and result['peak_memory_kb'] is None
+    assert result.get('id', 7) == 7
+
+
+@pytest.mark.parametrize('code, exit_code, stderr', [
+    ('raise SystemExit(3)', 3, ''),
+    ('raise SystemExit', 0, ''),
+    ('import sys; sys.exit(None)', 0, ''),
+    ('raise SystemExit("bye")', 1, 'bye\n'),
+    ('1 / 0', 1, 'ZeroDivisionError'),
+])
+def test_exit_codes(code, exit_code, stderr):
+    result = run(code)
+
+    assert result['exit_code'] == exit_code
+    assert result['success'] is (exit_code == 0)
+    assert stderr in result['stderr']
+    assert 'execute.py' not in result['stderr']
+
+
+def test_stdin_is_passed_through():
+    assert run('print(input()[::-1])', stdin='abc\n')['stdout'] == 'cba\n'
+
+
+def test_timeout_kills_the_whole_process_group(tmp_path):
+    pid_file = tmp_path / 'pid'
+    code = ('import os, time\n'
+            'pid = os.fork()\n'
+            'if pid == 0:\n'
+            '    time.sleep(60)\n'
+            f'open({str(pid_file)!r}, "w").write(str(pid))\n'
+            'time.sleep(60)\n')
+    started = time.monotonic()
+
+    result = run(code, timeout=0.5)
+
+    assert time.monotonic() - started < 5
+    assert result['success'] is False
+    assert result['stderr'] == 'Execution timed out after 0.5 seconds'
+    grandchild = int(pid_file.read_text())
+    deadline = time.monotonic() + 2
+    while alive(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(grandchild)
+
+
+def test_server_children_get_rlimits():
+    code = ('import resource\n'
+            'for kind in (resource.RLIMIT_CPU, resource.RLIMIT_AS, resource.RLIMIT_NOFILE):\n'
+            '    print(resource.getrlimit(kind)[0])\n')
+
+    limits = [int(line) for line in run(code, timeout=5)['stdout'].split()]
+
+    assert limits == [6, execute.MAX_MEMORY_BYTES, execute.MAX_OPEN_FILES]
+
+
+def test_one_shot_runs_keep_the_interpreter_limits():
+    code = 'import resource; print(resource.getrlimit(resource.RLIMIT_NOFILE)[0])'
+
+    result = execute.execute_code(code, timeout=5)
+
+    assert int(result['stdout']) == resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    assert set(result) == SCHEMA
+
+
+def test_first_output_is_timed():
+    assert run('pass')['first_output_ms'] is None
+    result = run('import time; time.sleep(0.2); print(1)')
+    assert 200 <= result['first_output_ms'] <= result['execution_time'] + 1
+
+
+def test_peak_memory_excludes_the_inherited_server_image():
+    baseline = run('print(1)')['peak_memory_kb']
+    allocated = run('data = bytearray(64 * 1024 * 1024); data[::4096] = b"x" * len(data[::4096])')['peak_memory_kb']
+
+    assert 0 <= baseline < execute._resident_kb()
+    assert allocated - baseline >= 48 * 1024
+
+
+def test_socket_server_answers_each_line(tmp_path):
+    path = str(tmp_path / 'execute.sock')
+    threading.Thread(target=execute.serve_socket, args=(path,), daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(path)
+        stream = client.makefile('rwb')
+        stream.write(b'{"id": 1, "code": "print(1)"}\n\n{"id": 2}\n')
+        stream.flush()
+        first, second = json.loads(stream.readline()), json.loads(stream.readline())
+        stream.close()
+
+    assert (first['id'], first['stdout']) == (1, '1\n')
+    assert (second['id'], second['success']) == (2, False)
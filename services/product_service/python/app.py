@@ -1,52 +1,137 @@
 
+import uuid
+
 from flask import Flask, jsonify, request
-import os
-import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
+from polyglot_common.db import get_db_connection
+from polyglot_common.metrics import instrument_app
+from catalog import (DEFAULT_LIMIT, MAX_LIMIT, PRODUCT_FIELDS, batch_ids, batch_result, decode_cursor, page_of,
+                     parse_fields, parse_int, search_terms)
+import response_cache
 
 app = Flask(__name__)
+instrument_app(app, service='product_service')
+
+PRODUCT_COLUMNS = sql.SQL(', ').join(map(sql.Identifier, PRODUCT_FIELDS))
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get("DB_HOST", "postgres"),
-        database=os.environ.get("DB_NAME", "polyglot"),
-        user=os.environ.get("DB_USER", "pp"),
-        password=os.environ.get("DB_PASSWORD", "pp")
-    )
-    return conn
+def _int_arg(name, default, minimum, maximum=None):
+    return parse_int(request.args.get(name), name, default, minimum, maximum)
 
 @app.route('/healthz')
 def healthz():
     return jsonify({"status": "ok", "uptime_seconds": 0, "version": "0.0.1"})
 
 @app.route('/api/v1/products')
+@response_cache.cache.cached(tags=lambda: [response_cache.LIST_TAG])
 def get_products():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 20))
-    offset = (page - 1) * limit
-    
     search_query = request.args.get('q')
-    
+    try:
+        limit = _int_arg('limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+        page = _int_arg('page', 1, 1)
+        fields = parse_fields(request.args.get('fields'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, ranked=bool(search_query)) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Passing `cursor` (empty for the first page) switches to keyset
+    # pagination, which stays fast however deep the client pages.
+    keyset = cursor is not None
+    columns = sql.SQL(', ').join(map(sql.Identifier, fields))
+    conditions, params = [], []
+
     if search_query:
-        cur.execute("SELECT * FROM products WHERE to_tsvector('english', title) @@ to_tsquery('english', %s) LIMIT %s OFFSET %s", (search_query, limit, offset))
+        # Matches come from the GIN-indexed search_vector and are ordered by
+        # relevance, then id to keep pages stable.
+        function, term = search_terms(search_query, prefix=request.args.get('prefix') in ('1', 'true'))
+        query = sql.SQL("SELECT {}, ts_rank_cd(search_vector, query) AS sort_rank, id AS sort_id "
+                        "FROM products, {}('english', %s) AS query").format(columns, sql.SQL(function))
+        params.append(term)
+        conditions.append(sql.SQL("search_vector @@ query"))
+        if after:
+            conditions.append(sql.SQL("(ts_rank_cd(search_vector, query) < %s::real OR "
+                                      "(ts_rank_cd(search_vector, query) = %s::real AND id > %s::uuid))"))
+            params.extend([after[0], after[0], after[1]])
+        order = sql.SQL(" ORDER BY sort_rank DESC, id")
+    else:
+        query = sql.SQL("SELECT {}, created_at AS sort_created_at, id AS sort_id FROM products").format(columns)
+        if after:
+            conditions.append(sql.SQL("(created_at, id) > (%s::timestamptz, %s::uuid)"))
+            params.extend(after)
+        order = sql.SQL(" ORDER BY created_at, id")
+
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += order + sql.SQL(" LIMIT %s")
+    if keyset:
+        params.append(limit + 1)
     else:
-        cur.execute("SELECT * FROM products LIMIT %s OFFSET %s", (limit, offset))
-        
-    products = cur.fetchall()
-    
+        query += sql.SQL(" OFFSET %s")
+        params.extend([limit, (page - 1) * limit])
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(query, params)
+    rows = cur.fetchall()
     cur.close()
     conn.close()
-    
-    return jsonify({"items": products, "meta": {"page": page, "limit": limit}})
+
+    products, next_cursor = page_of(rows, limit, keyset, bool(search_query))
+
+    if not keyset:
+        return jsonify({"items": products, "meta": {"page": page, "limit": limit}})
+    return jsonify({"items": products, "meta": {"limit": limit, "next_cursor": next_cursor}})
+
+@app.route('/api/v1/products/batch', methods=['POST'])
+def get_products_batch():
+    """Look up many products in one query, e.g. to render a cart.
+
+    Items come back in request order with duplicates dropped; ids that do
+    not exist (or are not valid ids) are listed under `missing`.
+    """
+    try:
+        requested, canonical = batch_ids(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = []
+    if canonical:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(sql.SQL("SELECT {} FROM products WHERE id = ANY(%s::uuid[])").format(PRODUCT_COLUMNS),
+                    (list(set(canonical.values())),))
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    return jsonify(batch_result(requested, canonical, rows))
+
+@app.route('/api/v1/products/cache/stats')
+def get_cache_stats():
+    return jsonify(response_cache.cache.stats())
+
+@app.route('/api/v1/products/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Per-process, best-effort invalidation hook; see response_cache.invalidate."""
+    denied = response_cache.invalidation_denied(request.headers.get('Authorization'))
+    if denied:
+        message, status = denied
+        return jsonify({'error': message}), status
+    data = request.get_json(silent=True) or {}
+    dropped = response_cache.invalidate(data.get('product_id'))
+    return jsonify({'invalidated': dropped})
 
 @app.route('/api/v1/products/<product_id>')
+@response_cache.cache.cached(tags=lambda product_id: [response_cache.product_tag(product_id)])
 def get_product(product_id):
+    try:
+        uuid.UUID(product_id)
+    except ValueError:
+        # Postgres rejects a malformed id rather than matching nothing.
+        return jsonify({'error': 'Product not found'}), 404
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM products WHERE id = %s", (product_id,))
+    cur.execute(sql.SQL("SELECT {} FROM products WHERE id = %s").format(PRODUCT_COLUMNS), (product_id,))
     product = cur.fetchone()
     cur.close()
     conn.close()
@@ -0,0 +1,181 @@
+"""Asyncio (ASGI) serving mode of the product service.
+
+Serves the same routes and JSON documents as ``app.py`` from one event loop
+per process, with asyncpg instead of pooled psycopg2 connections and orjson
+instead of the standard library encoder. Parameter handling, paging and
+batch ordering come from ``catalog.py`` and the response cache is shared,
+so the two modes only differ in how they wait for Postgres.
+
+    SERVER_MODE=asgi python -m polyglot_common.serve
+"""
+import functools
+import uuid
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from polyglot_common.asgi import JSONResponse, MetricsMiddleware, error, fetch, fetchrow, lifespan, metrics
+from polyglot_common.metrics import METRICS_ENDPOINT
+from catalog import (DEFAULT_LIMIT, MAX_LIMIT, PRODUCT_FIELDS, batch_ids, batch_result, decode_cursor, page_of,
+                     parse_fields, parse_int, search_terms)
+import response_cache
+
+PRODUCT_COLUMNS = ', '.join(f'"{field}"' for field in PRODUCT_FIELDS)
+
+
+def _etags(header):
+    """Strong entity tags (and ``*``) listed in an If-None-Match header."""
+    etags = set()
+    for tag in (header or '').split(','):
+        tag = tag.strip()
+        if tag == '*':
+            etags.add(tag)
+        elif tag.startswith('"') and tag.endswith('"') and len(tag) > 1:
+            etags.add(tag[1:-1])
+    return etags
+
+
+def cached(tags):
+    """ASGI counterpart of ``ResponseCache.cached``."""
+    cache = response_cache.cache
+
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            key = cache.key(request.url.path, request.query_params.multi_items())
+            entry = cache.get(key)
+            status = 'HIT'
+            if entry is None:
+                response = await endpoint(request)
+                if response.status_code != 200:
+                    return response
+                entry = cache.put(key, response.body, tags(**request.path_params))
+                status = 'MISS'
+            if cache.revalidated(entry, _etags(request.headers.get('if-none-match'))):
+                return Response(status_code=304, headers=cache.headers(entry, status))
+            return Response(entry.body, media_type='application/json', headers=cache.headers(entry, status))
+        return wrapper
+    return decorator
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok", "uptime_seconds": 0, "version": "0.0.1"})
+
+
+@cached(tags=lambda: [response_cache.LIST_TAG])
+async def get_products(request: Request):
+    args = request.query_params
+    search_query = args.get('q')
+    try:
+        limit = parse_int(args.get('limit'), 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+        page = parse_int(args.get('page'), 'page', 1, 1)
+        fields = parse_fields(args.get('fields'))
+        cursor = args.get('cursor')
+        after = decode_cursor(cursor, ranked=bool(search_query)) if cursor else None
+    except ValueError as e:
+        return error(str(e), 400)
+
+    keyset = cursor is not None
+    columns = ', '.join(f'"{field}"' for field in fields)
+    conditions, params = [], []
+
+    def param(value):
+        params.append(value)
+        return f'${len(params)}'
+
+    if search_query:
+        function, term = search_terms(search_query, prefix=args.get('prefix') in ('1', 'true'))
+        query = (f"SELECT {columns}, ts_rank_cd(search_vector, query) AS sort_rank, id AS sort_id "
+                 f"FROM products, {function}('english', {param(term)}) AS query")
+        conditions.append("search_vector @@ query")
+        if after:
+            rank = param(after[0])
+            conditions.append(f"(ts_rank_cd(search_vector, query) < {rank}::real OR "
+                              f"(ts_rank_cd(search_vector, query) = {rank}::real AND id > {param(after[1])}::uuid))")
+        order = " ORDER BY sort_rank DESC, id"
+    else:
+        query = f"SELECT {columns}, created_at AS sort_created_at, id AS sort_id FROM products"
+        if after:
+            # asyncpg binds timestamptz from datetimes, not strings.
+            conditions.append(f"(created_at, id) > ({param(datetime.fromisoformat(after[0]))}::timestamptz, "
+                              f"{param(after[1])}::uuid)")
+        order = " ORDER BY created_at, id"
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if keyset:
+        query += f"{order} LIMIT {param(limit + 1)}"
+    else:
+        query += f"{order} LIMIT {param(limit)} OFFSET {param((page - 1) * limit)}"
+
+    rows = await fetch(query, *params)
+    products, next_cursor = page_of(rows, limit, keyset, bool(search_query))
+
+    if not keyset:
+        return JSONResponse({"items": products, "meta": {"page": page, "limit": limit}})
+    return JSONResponse({"items": products, "meta": {"limit": limit, "next_cursor": next_cursor}})
+
+
+async def get_products_batch(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        requested, canonical = batch_ids(data)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    rows = []
+    if canonical:
+        rows = await fetch(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = ANY($1::uuid[])",
+                           list(set(canonical.values())))
+    return JSONResponse(batch_result(requested, canonical, rows))
+
+
+async def get_cache_stats(request):
+    return JSONResponse(response_cache.cache.stats())
+
+
+async def invalidate_cache(request: Request):
+    denied = response_cache.invalidation_denied(request.headers.get('authorization'))
+    if denied:
+        return error(*denied)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    dropped = response_cache.invalidate((data if isinstance(data, dict) else {}).get('product_id'))
+    return JSONResponse({'invalidated': dropped})
+
+
+@cached(tags=lambda product_id: [response_cache.product_tag(product_id)])
+async def get_product(request: Request):
+    product_id = request.path_params['product_id']
+    try:
+        product_uuid = uuid.UUID(product_id)
+    except ValueError:
+        # asyncpg refuses to bind a malformed id; it cannot match a product.
+        product = None
+    else:
+        product = await fetchrow(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = $1", product_uuid)
+    if product is None:
+        return error('Product not found', 404)
+    return JSONResponse(product)
+
+
+routes = [
+    Route('/healthz', healthz),
+    Route('/metrics', metrics, name=METRICS_ENDPOINT),
+    Route('/api/v1/products', get_products),
+    Route('/api/v1/products/batch', get_products_batch, methods=['POST']),
+    Route('/api/v1/products/cache/stats', get_cache_stats),
+    Route('/api/v1/products/cache/invalidate', invalidate_cache, methods=['POST']),
+    Route('/api/v1/products/{product_id}', get_product),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, service='product_service', routes=routes)
@@ -0,0 +1,121 @@
+"""Request parsing and response shaping shared by the Flask and ASGI apps.
+
+Nothing here touches the database or a web framework, so both serving modes
+validate parameters, page and order results exactly the same way.
+"""
+import base64
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+
+PRODUCT_FIELDS = ('id', 'title', 'description', 'category', 'price_cents', 'currency', 'stock', 'image_url',
+                  'created_at')
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+BATCH_MAX_IDS = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', 100))
+
+
+def parse_int(raw, name, default, minimum, maximum=None):
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f'between {minimum} and {maximum}' if maximum is not None else f'at least {minimum}'
+        raise ValueError(f'{name} must be {bounds}')
+    return value
+
+
+def parse_fields(raw):
+    """Columns requested via `fields=a,b`; all product columns by default."""
+    if not raw:
+        return list(PRODUCT_FIELDS)
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if field not in PRODUCT_FIELDS:
+            raise ValueError(f'Unknown field: {field}')
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def encode_cursor(position):
+    """Opaque token for a keyset position (the sort key of the last row)."""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, ranked=False):
+    """Position from `encode_cursor`: (created_at, id), or (rank, id) for searches."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key, product_id = json.loads(base64.urlsafe_b64decode(padded))
+        if ranked:
+            key = float(key)
+        else:
+            datetime.fromisoformat(key)
+        uuid.UUID(product_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    return key, product_id
+
+
+def search_terms(text, prefix=False):
+    """Name of the tsquery function matching `text`, and its argument.
+
+    Plain searches use websearch_to_tsquery, which accepts any user input
+    ("quoted phrases", -exclusions, or). Prefix mode is for type-ahead: the
+    words are ANDed and the last one matches as a prefix. Only word
+    characters reach to_tsquery, so its syntax cannot be injected.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if prefix and words:
+        return 'to_tsquery', ' & '.join(words[:-1] + [words[-1] + ':*'])
+    return 'websearch_to_tsquery', text
+
+
+def page_of(rows, limit, keyset, search):
+    """Trim the extra keyset row, derive `next_cursor` and drop the sort columns."""
+    next_cursor = None
+    if keyset and len(rows) > limit:
+        rows = rows[:limit]
+        last_key, last_id = (rows[-1][key] for key in (('sort_rank', 'sort_id') if search
+                                                       else ('sort_created_at', 'sort_id')))
+        if not search:
+            last_key = last_key.isoformat()
+        next_cursor = encode_cursor([last_key, str(last_id)])
+    products = [{key: value for key, value in row.items() if not key.startswith('sort_')} for row in rows]
+    return products, next_cursor
+
+
+def batch_ids(data):
+    """Requested ids (deduplicated, in order) and their canonical UUID forms."""
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(product_id, str) for product_id in ids):
+        raise ValueError('ids must be a list of product ids')
+    if len(ids) > BATCH_MAX_IDS:
+        raise ValueError(f'At most {BATCH_MAX_IDS} ids per request')
+    requested = list(dict.fromkeys(ids))
+    canonical = {}
+    for product_id in requested:
+        try:
+            canonical[product_id] = str(uuid.UUID(product_id))
+        except ValueError:
+            pass
+    return requested, canonical
+
+
+def batch_result(requested, canonical, rows):
+    found = {str(row['id']): row for row in rows}
+    items, missing = [], []
+    for product_id in requested:
+        row = found.get(canonical.get(product_id))
+        if row is None:
+            missing.append(product_id)
+        else:
+            items.append(row)
+    return {'items': items, 'missing': missing}
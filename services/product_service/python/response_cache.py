@@ -0,0 +1,204 @@
+"""In-process read-through cache for serialized product responses.
+
+The catalog changes rarely while list and detail reads dominate traffic, so
+successful GET responses are kept in a TTL-bounded LRU keyed by the path and
+its normalized query string. Each entry carries a strong ETag (a hash of the
+body): a matching ``If-None-Match`` gets a bodyless 304, and every cached
+response advertises ``Cache-Control`` so browsers and proxies can reuse it.
+
+The cache is per process. ``invalidate()`` drops entries in the calling
+process when products change; other workers converge once their entries
+expire after ``PRODUCT_CACHE_TTL_S``. The HTTP invalidation hook is off
+unless ``PRODUCT_CACHE_INVALIDATE_TOKEN`` is set, and is best effort for the
+same reason: it only reaches the process that answers the request.
+"""
+import collections
+import functools
+import hashlib
+import hmac
+import os
+import threading
+import time
+import urllib.parse
+
+from flask import Response, current_app, request
+
+LIST_TAG = 'products'
+INVALIDATE_TOKEN = os.environ.get('PRODUCT_CACHE_INVALIDATE_TOKEN', '')
+
+
+class _Entry:
+    __slots__ = ('body', 'etag', 'expires_at', 'tags', 'size')
+
+    def __init__(self, body, etag, expires_at, tags, size):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+        self.tags = tags
+        self.size = size
+
+
+class ResponseCache:
+    def __init__(self, max_entries=None, max_bytes=None, ttl_seconds=None, max_age=None):
+        env = os.environ
+        self.max_entries = int(max_entries if max_entries is not None else env.get('PRODUCT_CACHE_MAX_ENTRIES', 1024))
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else int(env.get('PRODUCT_CACHE_MAX_MB', 32)) * 1024 * 1024)
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None else env.get('PRODUCT_CACHE_TTL_S', 30))
+        self.max_age = int(max_age if max_age is not None else env.get('PRODUCT_CACHE_MAX_AGE_S', self.ttl_seconds))
+        self.enabled = self.max_entries > 0 and self.max_bytes > 0 and self.ttl_seconds > 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(path, params):
+        """Cache key for a request's path and (name, value) parameters, in any order."""
+        # Encoded, so a value containing '&' or '=' cannot pose as other parameters.
+        return path + '?' + urllib.parse.urlencode(sorted(params))
+
+    @staticmethod
+    def etag(body):
+        return hashlib.sha256(body).hexdigest()[:32]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, tags=()):
+        size = len(key) + len(body)
+        entry = _Entry(body, self.etag(body), time.monotonic() + self.ttl_seconds, frozenset(tags), size)
+        if not self.enabled or size > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key).size
+
+    def invalidate(self, tag=None):
+        """Drop entries carrying ``tag``, or everything when no tag is given."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if tag is None or tag in entry.tags]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += 1
+        return len(keys)
+
+    def clear(self):
+        """Forget all entries and counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.not_modified = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def revalidated(self, entry, etags):
+        """Whether a client holding ``etags`` (If-None-Match values) has ``entry``'s body."""
+        if entry.etag not in etags and '*' not in etags:
+            return False
+        with self._lock:
+            self.not_modified += 1
+        return True
+
+    def headers(self, entry, status):
+        return {'ETag': f'"{entry.etag}"', 'Cache-Control': f'public, max-age={self.max_age}', 'X-Cache': status}
+
+    def _respond(self, entry, status):
+        if self.revalidated(entry, request.if_none_match):
+            response = Response(status=304)
+        else:
+            response = Response(entry.body, mimetype='application/json')
+        response.headers.update(self.headers(entry, status))
+        return response
+
+    def cached(self, tags):
+        """Decorate a Flask view so its 200 responses are served from the cache.
+
+        ``tags(**view_args)`` names the invalidation groups an entry belongs to.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**view_args):
+                key = self.key(request.path, request.args.items(multi=True))
+                entry = self.get(key)
+                if entry is not None:
+                    return self._respond(entry, 'HIT')
+                response = current_app.make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+                entry = self.put(key, response.get_data(), tags(**view_args))
+                return self._respond(entry, 'MISS')
+            return wrapper
+        return decorator
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+cache = ResponseCache()
+
+
+def invalidate(product_id=None):
+    """Call after products change.
+
+    Any change can reorder or alter list pages, so lists are always dropped;
+    detail entries are dropped for ``product_id`` only, or all of them when no
+    id is given.
+    """
+    if product_id is None:
+        return cache.invalidate()
+    return cache.invalidate(LIST_TAG) + cache.invalidate(product_tag(product_id))
+
+
+def invalidation_denied(authorization):
+    """(message, status) refusing an HTTP invalidation request, or None to allow it.
+
+    The hook is disabled (404) without ``PRODUCT_CACHE_INVALIDATE_TOKEN`` and
+    otherwise needs ``Authorization: Bearer <token>``.
+    """
+    if not INVALIDATE_TOKEN:
+        return 'Not found', 404
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), INVALIDATE_TOKEN.encode()):
+        return 'A valid invalidation token is required', 401
+    return None
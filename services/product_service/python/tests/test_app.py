@@ -1,11 +1,13 @@
 
 import pytest
+import response_cache
 from app import app
 from unittest.mock import patch
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
+    response_cache.cache.clear()
     with app.test_client() as client:
         yield client
 
@@ -42,3 +44,136 @@ def test_get_products(mock_get_db_connection, client):
     mock_cur.fetchall.assert_called_once()
     mock_cur.close.assert_called_once()
     mock_conn.close.assert_called_once()
+
+@patch('app.get_db_connection')
+def test_get_products_cursor_pagination(mock_get_db_connection, client):
+    """Keyset mode returns an opaque next_cursor that resumes after the last row."""
+    from datetime import datetime, timezone
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mock_cur.fetchall.return_value = [
+        {'title': f'P{i}', 'sort_created_at': created_at, 'sort_id': f'00000000-0000-0000-0000-00000000000{i}'}
+        for i in range(3)
+    ]
+
+    rv = client.get('/api/v1/products?cursor=&limit=2&fields=title')
+    json_data = rv.get_json()
+
+    assert rv.status_code == 200
+    assert json_data['items'] == [{'title': 'P0'}, {'title': 'P1'}]
+    next_cursor = json_data['meta']['next_cursor']
+    assert next_cursor
+
+    rv = client.get(f'/api/v1/products?cursor={next_cursor}&limit=2')
+    assert rv.status_code == 200
+    _, params = mock_cur.execute.call_args[0]
+    assert params == [created_at.isoformat(), '00000000-0000-0000-0000-000000000001', 3]
+
+def test_get_products_rejects_bad_params(client):
+    """Unknown fields, invalid cursors and out-of-range limits are client errors."""
+    assert client.get('/api/v1/products?fields=password').status_code == 400
+    assert client.get('/api/v1/products?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/v1/products?limit=0').status_code == 400
+
+@patch('app.get_db_connection')
+def test_search_products_prefix(mock_get_db_connection, client):
+    """Type-ahead searches become a sanitized prefix tsquery, ranked by relevance."""
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    mock_cur.fetchall.return_value = [{'id': '1', 'title': 'Mechanical Keyboard', 'sort_rank': 0.5, 'sort_id': '1'}]
+
+    rv = client.get("/api/v1/products?q=mech keyb'):*&prefix=1")
+
+    assert rv.status_code == 200
+    assert rv.get_json()['items'] == [{'id': '1', 'title': 'Mechanical Keyboard'}]
+    query, params = mock_cur.execute.call_args[0]
+    assert params[0] == 'mech & keyb:*'
+
+@patch('app.get_db_connection')
+def test_get_product_cached_with_etag(mock_get_db_connection, client, monkeypatch):
+    """Repeat reads are served from the cache and honour If-None-Match."""
+    monkeypatch.setattr(response_cache, 'INVALIDATE_TOKEN', 'secret')
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    product_id = '00000000-0000-0000-0000-000000000001'
+    mock_cur.fetchone.return_value = {'id': product_id, 'title': 'Test Product'}
+
+    first = client.get(f'/api/v1/products/{product_id}')
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+    assert 'max-age=' in first.headers['Cache-Control']
+    etag = first.headers['ETag']
+
+    second = client.get(f'/api/v1/products/{product_id}')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+
+    revalidated = client.get(f'/api/v1/products/{product_id}', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    mock_get_db_connection.assert_called_once()
+
+    client.post('/api/v1/products/cache/invalidate', json={'product_id': product_id},
+                headers={'Authorization': 'Bearer secret'})
+    assert client.get(f'/api/v1/products/{product_id}').headers['X-Cache'] == 'MISS'
+    assert mock_get_db_connection.call_count == 2
+
+@patch('app.get_db_connection')
+def test_get_product_malformed_id_is_not_found(mock_get_db_connection, client):
+    """An id that is not a UUID cannot name a product; answered without a query."""
+    assert client.get('/api/v1/products/missing').status_code == 404
+    mock_get_db_connection.assert_not_called()
+
+@patch('app.get_db_connection')
+def test_errors_and_param_order_in_cache(mock_get_db_connection, client):
+    """Query parameter order shares one entry; errors are never cached."""
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    mock_cur.fetchall.return_value = [{'id': '1', 'title': 'Test Product'}]
+    mock_cur.fetchone.return_value = None
+
+    assert client.get('/api/v1/products?page=1&limit=5').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/v1/products?limit=5&page=1').headers['X-Cache'] == 'HIT'
+    missing = '/api/v1/products/00000000-0000-0000-0000-000000000009'
+    assert client.get(missing).status_code == 404
+    assert client.get(missing).status_code == 404
+    assert mock_cur.fetchone.call_count == 2
+
+    stats = client.get('/api/v1/products/cache/stats').get_json()
+    assert stats['hits'] == 1
+    assert stats['entries'] == 1
+    assert stats['bytes'] > 0
+
+@patch('app.get_db_connection')
+def test_cache_key_escapes_parameter_values(mock_get_db_connection, client):
+    """A value spelling out other parameters does not share their cache entry."""
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    mock_cur.fetchall.return_value = [{'id': '1', 'title': 'Test Product'}]
+
+    assert client.get('/api/v1/products?prefix=1%26q%3Dshoes').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/v1/products?prefix=1&q=shoes').headers['X-Cache'] == 'MISS'
+    assert response_cache.ResponseCache.key('/p', [('prefix', '1&q=shoes')]) != \
+        response_cache.ResponseCache.key('/p', [('prefix', '1'), ('q', 'shoes')])
+
+@patch('app.get_db_connection')
+def test_get_products_batch(mock_get_db_connection, client):
+    """Batch lookups run one ANY() query and keep request order."""
+    first, second = '00000000-0000-0000-0000-000000000001', '00000000-0000-0000-0000-000000000002'
+    mock_cur = mock_get_db_connection.return_value.cursor.return_value
+    mock_cur.fetchall.return_value = [{'id': second, 'title': 'B'}, {'id': first, 'title': 'A'}]
+
+    rv = client.post('/api/v1/products/batch', json={'ids': [first, 'nope', second, first]})
+
+    assert rv.status_code == 200
+    json_data = rv.get_json()
+    assert [item['title'] for item in json_data['items']] == ['A', 'B']
+    assert json_data['missing'] == ['nope']
+    mock_cur.execute.assert_called_once()
+    assert client.post('/api/v1/products/batch', json={'ids': 'x'}).status_code == 400
+
+def test_invalidate_cache_needs_the_token(client, monkeypatch):
+    """The invalidation hook is off without a configured token and rejects wrong ones."""
+    assert client.post('/api/v1/products/cache/invalidate').status_code == 404
+    monkeypatch.setattr(response_cache, 'INVALIDATE_TOKEN', 'secret')
+    assert client.post('/api/v1/products/cache/invalidate').status_code == 401
+    assert client.post('/api/v1/products/cache/invalidate', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    rv = client.post('/api/v1/products/cache/invalidate', headers={'Authorization': 'Bearer secret'})
+    assert rv.status_code == 200
+    assert rv.get_json() == {'invalidated': 0}
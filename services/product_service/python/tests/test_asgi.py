@@ -0,0 +1,112 @@
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from starlette.testclient import TestClient
+
+import response_cache
+from asgi import app
+
+@pytest.fixture
+def client():
+    response_cache.cache.clear()
+    with TestClient(app) as client:
+        yield client
+
+def test_healthz(client):
+    rv = client.get('/healthz')
+    assert rv.status_code == 200
+    assert rv.json()['status'] == 'ok'
+
+@patch('asgi.fetch', new_callable=AsyncMock)
+def test_get_products_matches_flask_document(mock_fetch, client):
+    """Same JSON as the Flask app: sorted keys and HTTP dates."""
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mock_fetch.return_value = [{'title': 'Test Product', 'id': '1', 'created_at': created_at,
+                                'sort_created_at': created_at, 'sort_id': '1'}]
+
+    rv = client.get('/api/v1/products?limit=5&page=2')
+
+    assert rv.status_code == 200
+    assert rv.content.startswith(b'{"items":[{"created_at":"Mon, 01 Jan 2024 00:00:00 GMT","id":"1",')
+    assert rv.json()['meta'] == {'limit': 5, 'page': 2}
+    query, *params = mock_fetch.call_args[0]
+    assert query.endswith('LIMIT $1 OFFSET $2')
+    assert params == [5, 5]
+
+@patch('asgi.fetch', new_callable=AsyncMock)
+def test_get_products_cursor_pagination(mock_fetch, client):
+    """Keyset positions bind as typed values to numbered parameters."""
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mock_fetch.return_value = [
+        {'title': f'P{i}', 'sort_created_at': created_at, 'sort_id': f'00000000-0000-0000-0000-00000000000{i}'}
+        for i in range(3)
+    ]
+
+    json_data = client.get('/api/v1/products?cursor=&limit=2&fields=title').json()
+    assert json_data['items'] == [{'title': 'P0'}, {'title': 'P1'}]
+
+    rv = client.get(f"/api/v1/products?cursor={json_data['meta']['next_cursor']}&limit=2")
+    assert rv.status_code == 200
+    query, *params = mock_fetch.call_args[0]
+    assert '(created_at, id) > ($1::timestamptz, $2::uuid)' in query
+    assert params == [created_at, '00000000-0000-0000-0000-000000000001', 3]
+
+def test_get_products_rejects_bad_params(client):
+    assert client.get('/api/v1/products?fields=password').status_code == 400
+    assert client.get('/api/v1/products?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/v1/products?limit=0').json() == {'error': 'limit must be between 1 and 100'}
+
+@patch('asgi.fetchrow', new_callable=AsyncMock)
+def test_get_product_cached_with_etag(mock_fetchrow, client, monkeypatch):
+    """Repeat reads are served from the shared cache and honour If-None-Match."""
+    monkeypatch.setattr(response_cache, 'INVALIDATE_TOKEN', 'secret')
+    product_id = '00000000-0000-0000-0000-000000000001'
+    mock_fetchrow.return_value = {'id': product_id, 'title': 'Test Product'}
+
+    first = client.get(f'/api/v1/products/{product_id}')
+    assert first.headers['X-Cache'] == 'MISS'
+    second = client.get(f'/api/v1/products/{product_id}')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.json() == first.json()
+
+    revalidated = client.get(f'/api/v1/products/{product_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b''
+    mock_fetchrow.assert_called_once()
+
+    client.post('/api/v1/products/cache/invalidate', json={'product_id': product_id},
+                headers={'Authorization': 'Bearer secret'})
+    assert client.get(f'/api/v1/products/{product_id}').headers['X-Cache'] == 'MISS'
+
+@patch('asgi.fetchrow', new_callable=AsyncMock)
+def test_get_product_malformed_id_is_not_found(mock_fetchrow, client):
+    assert client.get('/api/v1/products/missing').status_code == 404
+    mock_fetchrow.assert_not_called()
+
+@patch('asgi.fetch', new_callable=AsyncMock)
+def test_get_products_batch(mock_fetch, client):
+    first, second = '00000000-0000-0000-0000-000000000001', '00000000-0000-0000-0000-000000000002'
+    mock_fetch.return_value = [{'id': second, 'title': 'B'}, {'id': first, 'title': 'A'}]
+
+    rv = client.post('/api/v1/products/batch', json={'ids': [first, 'nope', second, first]})
+
+    assert [item['title'] for item in rv.json()['items']] == ['A', 'B']
+    assert rv.json()['missing'] == ['nope']
+    mock_fetch.assert_called_once()
+    assert client.post('/api/v1/products/batch', json={'ids': 'x'}).status_code == 400
+
+def test_metrics_use_flask_route_templates(client):
+    client.get('/api/v1/products/cache/stats')
+    client.get('/api/v1/products/missing')
+    body = client.get('/metrics').text
+    assert 'route="/api/v1/products/cache/stats"' in body
+    assert 'route="/api/v1/products/<product_id>"' in body
+    assert 'route="/metrics"' not in body
+
+def test_invalidate_cache_needs_the_token(client, monkeypatch):
+    assert client.post('/api/v1/products/cache/invalidate').status_code == 404
+    monkeypatch.setattr(response_cache, 'INVALIDATE_TOKEN', 'secret')
+    assert client.post('/api/v1/products/cache/invalidate', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    rv = client.post('/api/v1/products/cache/invalidate', headers={'Authorization': 'Bearer secret'})
+    assert rv.json() == {'invalidated': 0}
@@ -1,8 +1,10 @@
 from flask import Flask, jsonify
+from polyglot_common.metrics import instrument_app
 import os
 import time
 
 app = Flask(__name__)
+instrument_app(app, service='user_service')
 
 start_time = time.time()
 
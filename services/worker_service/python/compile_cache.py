@@ -0,0 +1,141 @@
+"""Content-addressed cache of compiled artifacts for the execution worker.
+
+Snippets are frequently re-run with different stdin, so the build output of a
+compile step is stored on local disk under a key derived from everything that
+can change it: language, toolchain image digest, source and compiler command.
+A hit copies the artifacts straight into the sandbox workspace and the compile
+step is skipped entirely.
+
+Entries live in ``<root>/<key[:2]>/<key>/``. The directory is shared by every
+worker process on the host; entries are published with an atomic rename and
+their mtime doubles as the LRU timestamp, so the on-disk state is the source
+of truth and each process only keeps an approximate index of it.
+"""
+import collections
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+class CompileCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.environ.get(
+            'COMPILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'polyglot-compile-cache'))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('COMPILE_CACHE_MAX_MB', 512)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> size in bytes, LRU first
+        self._bytes = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._rescan()
+
+    @staticmethod
+    def key(language, image_id, source, command):
+        digest = hashlib.sha256()
+        for part in (language, image_id or '', json.dumps(list(command)), source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _rescan(self):
+        """Rebuild the in-memory LRU index from what is actually on disk."""
+        found = []
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir() or len(prefix.name) != 2:
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith('.') or not entry.is_dir():
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                except FileNotFoundError:
+                    continue
+                found.append((mtime, entry.name, size))
+        found.sort()
+        self._entries = collections.OrderedDict((key, size) for _, key, size in found)
+        self._bytes = sum(self._entries.values())
+
+    def restore(self, key, dest_dir):
+        """Copy cached artifacts for ``key`` into ``dest_dir``; False on a miss."""
+        path = self._path(key)
+        try:
+            for entry in os.scandir(path):
+                shutil.copy2(entry.path, os.path.join(dest_dir, entry.name))
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if self._entries.pop(key, None) is not None:
+                    self._rescan()
+            return False
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return True
+
+    def store(self, key, src_dir, patterns):
+        """Save the files in ``src_dir`` matching ``patterns`` under ``key``."""
+        names = [name for name in os.listdir(src_dir)
+                 if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+        if not names:
+            return False
+        final = self._path(key)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(final))
+        try:
+            size = 0
+            for name in names:
+                shutil.copy2(os.path.join(src_dir, name), os.path.join(staging, name))
+                size += os.path.getsize(os.path.join(staging, name))
+            if size > self.max_bytes:
+                shutil.rmtree(staging, ignore_errors=True)
+                return False
+            os.rename(staging, final)
+        except OSError:
+            # Another process published the same key first, or the copy failed.
+            shutil.rmtree(staging, ignore_errors=True)
+            return os.path.isdir(final)
+        with self._lock:
+            self.stores += 1
+            self._entries[key] = size
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                # Other processes share the directory; reconcile before evicting.
+                self._rescan()
+                self._evict()
+        return True
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
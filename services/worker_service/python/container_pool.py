@@ -0,0 +1,460 @@
+"""Warm sandbox container pool for the execution worker.
+
+Starting and tearing down a container per job dominates the latency of short
+snippets, so sandboxes are started ahead of time (network disabled, resource
+limited, kept alive by an idle command) and jobs run inside them with
+``exec``. Every pooled container owns a host workspace directory bind-mounted
+at ``/usr/src/app``; it is wiped when the container goes back to the pool.
+
+Containers are health-checked on checkout, recycled after a fixed number of
+jobs and evicted after sitting idle, while the pool never shrinks below its
+configured minimum.
+"""
+import atexit
+import collections
+import contextlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+import docker
+
+from output import OutputBuffer
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_DIR = '/usr/src/app'
+STDIN_FILE = '.stdin'
+# Written after a measured command: `times` output (shell, then children
+# user/system CPU) followed by the sandbox cgroup's memory high-water mark.
+USAGE_SCRIPT = ('status=$?; times > {file}; cat /sys/fs/cgroup/memory.peak '
+                '/sys/fs/cgroup/memory/memory.max_usage_in_bytes >> {file} 2>/dev/null; exit $status')
+TIMES_PATTERN = re.compile(r'([0-9]+)m([0-9]+(?:\.[0-9]+)?)s')
+IDLE_COMMAND = ['tail', '-f', '/dev/null']
+POOL_LABEL = 'polyglot.pool'
+
+
+class PoolExhausted(Exception):
+    """Raised when no sandbox becomes available within the acquire timeout."""
+
+
+class PoolConfig:
+    def __init__(self, min_size=None, max_size=None, idle_timeout=None,
+                 max_jobs=None, acquire_timeout=None, reap_interval=None):
+        env = os.environ
+        self.min_size = int(min_size if min_size is not None else env.get('POOL_MIN_SIZE', 1))
+        self.max_size = int(max_size if max_size is not None else env.get('POOL_MAX_SIZE', 4))
+        self.idle_timeout = float(idle_timeout if idle_timeout is not None else env.get('POOL_IDLE_TIMEOUT_S', 300))
+        self.max_jobs = int(max_jobs if max_jobs is not None else env.get('POOL_MAX_JOBS', 100))
+        self.acquire_timeout = float(acquire_timeout if acquire_timeout is not None else env.get('POOL_ACQUIRE_TIMEOUT_S', 30))
+        self.reap_interval = float(reap_interval if reap_interval is not None else env.get('POOL_REAP_INTERVAL_S', 30))
+        if self.max_size < 1:
+            raise ValueError('POOL_MAX_SIZE must be at least 1')
+        self.min_size = min(max(self.min_size, 0), self.max_size)
+
+
+class ExecResult:
+    """Outcome of one command; ``stdout``/``stderr`` are ``OutputBuffer``s."""
+
+    def __init__(self, exit_code, stdout, stderr, timed_out=False, usage=None):
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.usage = usage or {}
+
+
+def parse_usage(text):
+    """Turn the output of ``USAGE_SCRIPT`` into CPU milliseconds and peak memory.
+
+    The memory figure is the sandbox cgroup's high-water mark over its whole
+    life; ``PooledContainer.exec`` only keeps it when nothing else ran there.
+    """
+    lines = text.splitlines()
+    usage = {}
+    if len(lines) >= 2:
+        times = TIMES_PATTERN.findall(lines[1])
+        if len(times) == 2:
+            (user_m, user_s), (sys_m, sys_s) = times
+            usage['cpu_user_ms'] = round((int(user_m) * 60 + float(user_s)) * 1000, 3)
+            usage['cpu_system_ms'] = round((int(sys_m) * 60 + float(sys_s)) * 1000, 3)
+    # The workspace is writable by the job, so the file may hold anything.
+    if len(lines) >= 3 and re.fullmatch(r'[0-9]+', lines[2].strip()):
+        usage['peak_memory_kb'] = int(lines[2]) // 1024
+    return usage
+
+
+class PooledContainer:
+    """A running sandbox plus the host directory mounted as its workspace."""
+
+    def __init__(self, container, workspace):
+        self.container = container
+        self.workspace = workspace
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.jobs = 0
+        self.execs = 0
+        self.killed = False
+        self._exec_lock = threading.Lock()
+
+    def write_file(self, name, content):
+        with open(os.path.join(self.workspace, name), 'w') as f:
+            f.write(content)
+
+    def exec(self, command, stdin=None, timeout=None, max_output=None, on_output=None,
+             stdin_file=STDIN_FILE, usage_file=None):
+        """Run ``command`` inside the sandbox, optionally feeding ``stdin``.
+
+        Stdin is staged as a file in the workspace and redirected by a shell
+        wrapper, since the exec API cannot attach a one-shot input stream.
+        Output is read incrementally into bounded buffers and handed to
+        ``on_output(stream, chunk)`` as it arrives. If the command is still
+        running after ``timeout`` seconds the whole container is killed, and
+        the pool will throw it away on release. Concurrent execs in the same
+        sandbox must each use their own ``stdin_file`` and ``usage_file``.
+
+        With ``usage_file`` set, CPU time and peak memory of the command are
+        recorded in that workspace file and returned as ``ExecResult.usage``.
+        The cgroup's memory peak cannot be reset from inside the sandbox, so
+        ``peak_memory_kb`` is only reported for the first command a sandbox
+        ever runs, when no other command ran alongside it.
+        """
+        with self._exec_lock:
+            self.execs += 1
+            first = self.execs == 1
+        script = '"$@"'
+        if stdin is not None:
+            self.write_file(stdin_file, stdin)
+            script += ' < ' + stdin_file
+        if usage_file:
+            command = ['sh', '-c', script + '; ' + USAGE_SCRIPT.format(file=usage_file), 'sh'] + list(command)
+        elif stdin is not None:
+            command = ['sh', '-c', 'exec ' + script, 'sh'] + list(command)
+        api = self.container.client.api
+        exec_id = api.exec_create(self.container.id, command, workdir=WORKSPACE_DIR)['Id']
+        stdout = OutputBuffer(max_output)
+        stderr = OutputBuffer(max_output)
+        errors = []
+
+        def pump():
+            try:
+                for out, err in api.exec_start(exec_id, stream=True, demux=True):
+                    if out:
+                        stdout.write(out)
+                        if on_output:
+                            on_output('stdout', out)
+                    if err:
+                        stderr.write(err)
+                        if on_output:
+                            on_output('stderr', err)
+            except Exception as e:
+                errors.append(e)
+
+        reader = threading.Thread(target=pump, name='sandbox-exec-reader', daemon=True)
+        reader.start()
+        reader.join(timeout)
+        if reader.is_alive():
+            self.kill()
+            reader.join(5)
+            return ExecResult(None, stdout, stderr, timed_out=True)
+        if errors:
+            raise errors[0]
+        usage = {}
+        if usage_file:
+            try:
+                with open(os.path.join(self.workspace, usage_file)) as f:
+                    usage = parse_usage(f.read())
+            except OSError:
+                pass
+            with self._exec_lock:
+                if not first or self.execs > 1:
+                    # Earlier or concurrent commands count towards the peak too.
+                    usage.pop('peak_memory_kb', None)
+        return ExecResult(api.exec_inspect(exec_id)['ExitCode'], stdout, stderr, usage=usage)
+
+    def kill(self):
+        self.killed = True
+        try:
+            self.container.kill()
+        except docker.errors.APIError as e:
+            logger.warning('Failed to kill sandbox %s: %s', self.container.id[:12], e)
+
+    def is_healthy(self):
+        try:
+            self.container.reload()
+        except docker.errors.APIError:
+            return False
+        return self.container.status == 'running'
+
+    def reset_workspace(self):
+        """Remove everything the previous job left behind in the workspace."""
+        try:
+            for entry in os.scandir(self.workspace):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+        except PermissionError:
+            # Files created by the sandbox user may not be removable from the
+            # host side; fall back to cleaning up from inside the container.
+            result = self.container.exec_run(['find', WORKSPACE_DIR, '-mindepth', '1', '-delete'])
+            if result.exit_code != 0:
+                return False
+        return True
+
+    def destroy(self):
+        try:
+            self.container.remove(force=True)
+        except docker.errors.APIError as e:
+            logger.warning('Failed to remove sandbox %s: %s', self.container.id[:12], e)
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+
+class ContainerPool:
+    """Pool of pre-started sandboxes for a single runtime image."""
+
+    def __init__(self, client, image, config=None, **container_kwargs):
+        self.client = client
+        self.image = image
+        self.config = config or PoolConfig()
+        self.container_kwargs = container_kwargs
+        self._idle = collections.deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._image_id = None
+        self.created = 0
+        self.recycled = 0
+        self.evicted = 0
+
+    @property
+    def image_id(self):
+        """Digest of the runtime image, resolved once per pool."""
+        if self._image_id is None:
+            self._image_id = self.client.images.get(self.image).id
+        return self._image_id
+
+    def _start_container(self):
+        workspace = tempfile.mkdtemp(prefix='polyglot-sandbox-')
+        os.chmod(workspace, 0o777)
+        try:
+            container = self.client.containers.run(
+                self.image,
+                command=IDLE_COMMAND,
+                volumes={workspace: {'bind': WORKSPACE_DIR, 'mode': 'rw'}},
+                working_dir=WORKSPACE_DIR,
+                detach=True,
+                init=True,
+                network_disabled=True,
+                labels={POOL_LABEL: self.image},
+                **self.container_kwargs
+            )
+        except Exception:
+            shutil.rmtree(workspace, ignore_errors=True)
+            raise
+        self.created += 1
+        return PooledContainer(container, workspace)
+
+    def _create(self):
+        """Start a sandbox for a slot already reserved in ``_size``."""
+        try:
+            return self._start_container()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _discard(self, pooled):
+        pooled.destroy()
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def acquire(self, timeout=None):
+        timeout = self.config.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolExhausted(f'Pool for {self.image} is closed')
+                pooled = self._idle.pop() if self._idle else None
+                if pooled is None and self._size < self.config.max_size:
+                    # Reserve the slot before the slow docker call.
+                    self._size += 1
+                    grow = True
+                elif pooled is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(f'No {self.image} sandbox available after {timeout:g}s')
+                    self._cond.wait(remaining)
+                    continue
+                else:
+                    grow = False
+            if grow:
+                return self._create()
+            if pooled.is_healthy():
+                return pooled
+            logger.info('Discarding unhealthy sandbox %s', pooled.container.id[:12])
+            self._discard(pooled)
+
+    def release(self, pooled, discard=False):
+        pooled.jobs += 1
+        pooled.last_used = time.monotonic()
+        if pooled.jobs >= self.config.max_jobs:
+            self.recycled += 1
+            discard = True
+        if pooled.killed:
+            discard = True
+        if not discard and not pooled.reset_workspace():
+            discard = True
+        if discard or self._closed:
+            self._discard(pooled)
+            if not self._closed and self._size < self.config.min_size:
+                # Replace the sandbox off the job's critical path.
+                threading.Thread(target=self._safe_fill, daemon=True).start()
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def lease(self, timeout=None):
+        """Check out a sandbox for one job; it is discarded if the job raises."""
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        except BaseException:
+            self.release(pooled, discard=True)
+            raise
+        self.release(pooled)
+
+    def maintain(self):
+        """Evict sandboxes idle past the timeout, then top up to ``min_size``."""
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            keep = collections.deque()
+            # Oldest entries sit at the left; only evict while above min_size.
+            while self._idle:
+                pooled = self._idle.popleft()
+                idle_for = now - pooled.last_used
+                if idle_for > self.config.idle_timeout and self._size - len(stale) > self.config.min_size:
+                    stale.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+        for pooled in stale:
+            self.evicted += 1
+            self._discard(pooled)
+        self.fill()
+
+    def fill(self):
+        while not self._closed:
+            with self._cond:
+                if self._size >= self.config.min_size:
+                    return
+                self._size += 1
+            pooled = self._create()
+            with self._cond:
+                self._idle.appendleft(pooled)
+                self._cond.notify()
+
+    def _safe_fill(self):
+        try:
+            self.fill()
+        except Exception as e:
+            logger.warning('Failed to replenish sandbox pool for %s: %s', self.image, e)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), collections.deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            size = self._size
+        return {
+            'image': self.image,
+            'size': size,
+            'idle': idle,
+            'busy': size - idle,
+            'created': self.created,
+            'recycled': self.recycled,
+            'evicted': self.evicted,
+        }
+
+
+class ContainerPoolManager:
+    """Per-process registry of pools, one per runtime image.
+
+    Docker clients and background threads do not survive ``fork``, so the
+    manager rebuilds its state when it notices it is running in a new process
+    (e.g. a Celery prefork child).
+    """
+
+    def __init__(self, config=None, client_factory=docker.from_env, **container_kwargs):
+        self.config = config or PoolConfig()
+        self.client_factory = client_factory
+        self.container_kwargs = container_kwargs
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._pools = {}
+        self._reaper = None
+
+    def _ensure_process(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._client = self.client_factory()
+        self._pools = {}
+        self._reaper = threading.Thread(target=self._reap_forever, name='sandbox-pool-reaper', daemon=True)
+        self._reaper.start()
+        atexit.register(self.close)
+
+    def get(self, image, **container_kwargs):
+        """Return the pool for ``image``, creating it with the given limits."""
+        with self._lock:
+            self._ensure_process()
+            pool = self._pools.get(image)
+            if pool is None:
+                kwargs = dict(self.container_kwargs, **container_kwargs)
+                pool = ContainerPool(self._client, image, self.config, **kwargs)
+                self._pools[image] = pool
+            return pool
+
+    def warm(self, images):
+        """Start ``min_size`` sandboxes for each ``(image, container_kwargs)`` pair."""
+        for image, container_kwargs in images:
+            try:
+                self.get(image, **container_kwargs).fill()
+            except docker.errors.ImageNotFound:
+                logger.warning('Cannot warm sandbox pool: image %s not found', image)
+            except Exception as e:
+                logger.warning('Cannot warm sandbox pool for %s: %s', image, e)
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(self.config.reap_interval)
+            for pool in list(self._pools.values()):
+                try:
+                    pool.maintain()
+                except Exception as e:
+                    logger.warning('Sandbox pool maintenance failed for %s: %s', pool.image, e)
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        for pool in list(self._pools.values()):
+            pool.close()
+
+    def stats(self):
+        return [pool.stats() for pool in list(self._pools.values())]
@@ -0,0 +1,54 @@
+"""Persistence of execution results into the ``executions`` table."""
+import logging
+import os
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+USAGE_COLUMNS = ['compile_ms', 'run_ms', 'cpu_user_ms', 'cpu_system_ms',
+                 'peak_memory_kb', 'stdout_bytes', 'stderr_bytes']
+
+
+def get_db_connection():
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST", "postgres"),
+        database=os.environ.get("DB_NAME", "polyglot"),
+        user=os.environ.get("DB_USER", "pp"),
+        password=os.environ.get("DB_PASSWORD", "pp")
+    )
+    return conn
+
+
+def _as_int(value):
+    return None if value is None else int(round(value))
+
+
+def record_execution(execution_id, result):
+    """Store status, output and resource usage of a finished job.
+
+    Failures are logged rather than raised: the caller still gets its result
+    even if the database is unavailable.
+    """
+    failed = result.get('status') != 'success'
+    values = {
+        'status': 'failed' if failed else 'success',
+        'output': result.get('stdout'),
+        'error': (result.get('stderr') or result.get('message')) if failed else None,
+        'duration_ms': _as_int(result.get('duration_ms')),
+    }
+    for column in USAGE_COLUMNS:
+        values[column] = _as_int(result.get(column))
+    assignments = ', '.join(f'{column} = %({column})s' for column in values)
+    values['id'] = execution_id
+    try:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"UPDATE executions SET {assignments} WHERE id = %(id)s", values)
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        logger.warning('Could not record execution %s: %s', execution_id, e)
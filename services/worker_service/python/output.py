@@ -0,0 +1,125 @@
+"""Bounded output capture and live output publishing for sandbox jobs."""
+import codecs
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_MAX_BYTES = int(os.environ.get('OUTPUT_MAX_BYTES', 1024 * 1024))
+OUTPUT_KEY_PREFIX = 'execution-output:'
+
+
+class OutputBuffer:
+    """Ring buffer keeping the last ``max_bytes`` bytes written to a stream.
+
+    A runaway program can print far more than the worker should hold in
+    memory, so older output is dropped once the cap is reached and the buffer
+    is flagged as truncated. ``total_bytes`` still counts everything written.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = OUTPUT_MAX_BYTES if max_bytes is None else max_bytes
+        self.total_bytes = 0
+        self._buf = bytearray()
+
+    @property
+    def truncated(self):
+        return self.total_bytes > len(self._buf)
+
+    def write(self, data):
+        self.total_bytes += len(data)
+        if len(data) >= self.max_bytes:
+            self._buf[:] = data[len(data) - self.max_bytes:]
+            return
+        self._buf += data
+        overflow = len(self._buf) - self.max_bytes
+        if overflow > 0:
+            del self._buf[:overflow]
+
+    def getvalue(self):
+        return bytes(self._buf)
+
+    def text(self):
+        # Truncation can cut a multi-byte character in half.
+        return self._buf.decode('utf-8', errors='replace')
+
+
+class OutputPublisher:
+    """Publishes output chunks of a running job to Redis as they arrive.
+
+    Chunks are appended to the list ``execution-output:<task_id>`` (and
+    announced on the channel of the same name) as JSON objects
+    ``{"seq": n, "stream": "stdout"|"stderr", "data": "..."}``; a final
+    ``{"seq": n, "event": "end"}`` marks completion. Writes are batched by
+    time and size so chatty programs do not turn into one round trip per line,
+    and at most ``max_bytes`` per stream are published.
+    """
+
+    def __init__(self, redis_client, task_id, max_bytes=None, flush_interval=0.25,
+                 flush_bytes=16 * 1024, ttl_seconds=3600):
+        self.redis = redis_client
+        self.key = OUTPUT_KEY_PREFIX + task_id
+        self.max_bytes = OUTPUT_MAX_BYTES if max_bytes is None else max_bytes
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_bytes = 0
+        self._published = {'stdout': 0, 'stderr': 0}
+        self._decoders = {stream: codecs.getincrementaldecoder('utf-8')(errors='replace')
+                          for stream in self._published}
+        self._seq = 0
+        self._last_flush = time.monotonic()
+
+    def __call__(self, stream, data):
+        with self._lock:
+            budget = self.max_bytes - self._published[stream]
+            if budget <= 0:
+                return
+            data = data[:budget]
+            self._published[stream] += len(data)
+            text = self._decoders[stream].decode(data)
+            if text:
+                self._pending.append({'seq': self._seq, 'stream': stream, 'data': text})
+                self._seq += 1
+                self._pending_bytes += len(data)
+            due = (self._pending_bytes >= self.flush_bytes
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            if due:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        messages = [json.dumps(chunk) for chunk in self._pending]
+        self._pending = []
+        self._pending_bytes = 0
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.rpush(self.key, *messages)
+            pipe.expire(self.key, self.ttl_seconds)
+            for message in messages:
+                pipe.publish(self.key, message)
+            pipe.execute()
+        except Exception as e:
+            # Live output is best effort; the final result still carries it.
+            logger.warning('Disabling output streaming for %s: %s', self.key, e)
+            self.redis = None
+
+    def close(self):
+        with self._lock:
+            for stream, decoder in self._decoders.items():
+                text = decoder.decode(b'', final=True)
+                if text:
+                    self._pending.append({'seq': self._seq, 'stream': stream, 'data': text})
+                    self._seq += 1
+            self._pending.append({'seq': self._seq, 'event': 'end'})
+            self._seq += 1
+            self._flush_locked()
@@ -0,0 +1,140 @@
+"""Redis-backed cache of execution results with in-flight deduplication.
+
+Deterministic programs produce the same output for the same code, input,
+runtime and limits, so results are cached under a hash of all of these.
+Identical submissions that arrive while the first one is still running do
+not start their own sandbox: the first caller takes a short-lived lock and
+runs the job, the others poll until its result lands in the cache (single
+flight). If the leader dies, followers fall back to running the job
+themselves once the lock expires.
+
+Entries expire after ``RESULT_CACHE_TTL_S`` and results larger than
+``RESULT_CACHE_MAX_ENTRY_BYTES`` are never stored; the Redis instance itself
+should run with a ``maxmemory`` limit and an LRU eviction policy.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'execution-result:'
+STATS_KEY = KEY_PREFIX + 'stats'
+
+# Only release the lock if we still own it.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class ResultCache:
+    def __init__(self, redis_client, ttl_seconds=None, max_entry_bytes=None,
+                 poll_interval=0.01, max_poll_interval=0.1):
+        env = os.environ
+        self.redis = redis_client
+        self.ttl_seconds = int(ttl_seconds if ttl_seconds is not None else env.get('RESULT_CACHE_TTL_S', 3600))
+        self.max_entry_bytes = int(max_entry_bytes if max_entry_bytes is not None
+                                   else env.get('RESULT_CACHE_MAX_ENTRY_BYTES', 256 * 1024))
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._release_lock = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+
+    @staticmethod
+    def key(language, runtime_version, code, input_data, limits):
+        payload = json.dumps([language, runtime_version, code, input_data, limits], sort_keys=True)
+        return KEY_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_cacheable(result):
+        """Only outcomes decided by the program itself are worth replaying."""
+        if result.get('timed_out') or result.get('stdout_truncated') or result.get('stderr_truncated'):
+            return False
+        return result.get('exit_code') is not None or result.get('message') == 'Compilation failed'
+
+    def _count(self, field):
+        try:
+            self.redis.hincrby(STATS_KEY, field, 1)
+        except redis.RedisError:
+            pass
+
+    def get(self, key):
+        raw = self.redis.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def _store(self, key, result):
+        if not self.is_cacheable(result):
+            return
+        payload = json.dumps(result)
+        if len(payload) > self.max_entry_bytes:
+            return
+        self.redis.set(key, payload, ex=self.ttl_seconds)
+
+    def get_or_execute(self, key, execute, lock_seconds):
+        """Return the cached result for ``key`` or compute it once via ``execute()``.
+
+        ``lock_seconds`` should cover the longest the job can take; concurrent
+        callers wait at most that long for the leader before running the job
+        themselves.
+        """
+        lock_key = key + ':lock'
+        token = uuid.uuid4().hex
+        try:
+            cached = self.get(key)
+            if cached is not None:
+                self._count('hits')
+                return dict(cached, cached=True)
+            leader = self.redis.set(lock_key, token, nx=True, ex=max(1, int(lock_seconds)))
+            if not leader:
+                cached = self._wait_for_leader(key, lock_key, lock_seconds)
+                if cached is not None:
+                    self._count('coalesced')
+                    return dict(cached, cached=True)
+        except redis.RedisError as e:
+            logger.warning('Result cache unavailable, executing directly: %s', e)
+            leader = False
+
+        # Either we hold the lock, or the leader failed, produced an
+        # uncacheable result, or Redis is down.
+        self._count('misses')
+        try:
+            result = execute()
+            # Store before unlocking so waiting callers find the result.
+            try:
+                self._store(key, result)
+            except redis.RedisError as e:
+                logger.warning('Could not cache execution result: %s', e)
+        finally:
+            if leader:
+                try:
+                    self._release_lock(keys=[lock_key], args=[token])
+                except redis.RedisError:
+                    pass
+        return result
+
+    def _wait_for_leader(self, key, lock_key, lock_seconds):
+        deadline = time.monotonic() + lock_seconds
+        interval = self.poll_interval
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            if not self.redis.exists(lock_key):
+                return None
+        return None
+
+    def stats(self):
+        raw = self.redis.hgetall(STATS_KEY)
+        counts = {field: int(raw.get(field.encode(), 0)) for field in ('hits', 'misses', 'coalesced')}
+        lookups = sum(counts.values())
+        counts['hit_ratio'] = (counts['hits'] + counts['coalesced']) / lookups if lookups else 0.0
+        return counts
@@ -0,0 +1,90 @@
+"""Language runtime registry for the execution worker.
+
+Each runtime declares how a snippet is laid out, built and run, and what
+resources its sandbox gets. The registry is loaded once when the worker
+starts; a JSON file named by ``WORKER_RUNTIMES_FILE`` can override fields of
+the built-in runtimes or add new languages without touching the task code::
+
+    [{"name": "java", "mem_limit": "1g"},
+     {"name": "kotlin", "extension": "kt", "compile": ["kotlinc", "{source}", "-d", "."],
+      "run": ["kotlin", "MainKt"], "artifacts": ["*.class"]}]
+
+``{source}`` in a command is replaced with the snippet's file name.
+"""
+import json
+import os
+
+CPU_PERIOD = 100000
+
+DEFAULT_RUNTIMES = [
+    {'name': 'python', 'extension': 'py', 'run': ['python', '{source}']},
+    {'name': 'javascript', 'extension': 'js', 'run': ['node', '{source}'], 'mem_limit': '256m'},
+    {'name': 'php', 'extension': 'php', 'run': ['php', '{source}']},
+    {'name': 'ruby', 'extension': 'rb', 'run': ['ruby', '{source}']},
+    {'name': 'cpp', 'extension': 'cpp', 'compile': ['g++', '{source}', '-o', 'main'], 'run': ['./main'],
+     'artifacts': ['main'], 'mem_limit': '256m', 'cpus': 1.0},
+    {'name': 'java', 'extension': 'java', 'compile': ['javac', '{source}'], 'run': ['java', 'Main'],
+     'artifacts': ['*.class'], 'mem_limit': '512m', 'cpus': 1.0, 'timeout_ms': 10000},
+    {'name': 'go', 'extension': 'go', 'compile': ['go', 'build', '-o', 'main', '{source}'], 'run': ['./main'],
+     'artifacts': ['main'], 'mem_limit': '512m', 'cpus': 1.0},
+    {'name': 'rust', 'extension': 'rs', 'compile': ['rustc', '{source}', '-o', 'main'], 'run': ['./main'],
+     'artifacts': ['main'], 'mem_limit': '512m', 'cpus': 1.0},
+]
+
+
+class Runtime:
+    def __init__(self, name, extension, run, compile=None, artifacts=(), image=None,
+                 mem_limit='128m', cpus=0.5, timeout_ms=5000, compile_timeout_ms=30000,
+                 cacheable=None, queue=None):
+        self.name = name
+        self.extension = extension
+        self.image = image or f'polyglot-{name}-runner'
+        self.source_file = f'main.{extension}'
+        self.compile_command = self._expand(compile) if compile else None
+        self.run_command = self._expand(run)
+        self.artifacts = list(artifacts)
+        self.mem_limit = mem_limit
+        self.cpus = float(cpus)
+        self.timeout_ms = int(timeout_ms)
+        self.compile_timeout_ms = int(compile_timeout_ms)
+        # Compile output is cacheable by default whenever we know which files
+        # make up the build.
+        self.cacheable = bool(self.artifacts) if cacheable is None else cacheable
+        # Celery queue of this language's jobs (default ``exec.<name>``); see scheduling.py.
+        self.queue = queue
+
+    def _expand(self, command):
+        return [part.replace('{source}', self.source_file) for part in command]
+
+    def container_limits(self):
+        return {
+            'mem_limit': self.mem_limit,
+            'cpu_period': CPU_PERIOD,
+            'cpu_quota': int(self.cpus * CPU_PERIOD),
+        }
+
+
+def load_runtimes(path=None):
+    """Build the registry from the defaults plus an optional JSON override file.
+
+    Raises ``ValueError`` for a malformed override file, so a bad deployment
+    fails at start-up rather than on the first job.
+    """
+    specs = {spec['name']: dict(spec) for spec in DEFAULT_RUNTIMES}
+    path = path or os.environ.get('WORKER_RUNTIMES_FILE')
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        if not isinstance(overrides, list):
+            raise ValueError(f'{path}: expected a list of runtimes')
+        for override in overrides:
+            if not isinstance(override, dict) or not isinstance(override.get('name'), str):
+                raise ValueError(f'{path}: every runtime needs a "name"')
+            specs.setdefault(override['name'], {}).update(override)
+    runtimes = {}
+    for name, spec in specs.items():
+        try:
+            runtimes[name] = Runtime(**spec)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'{path}: runtime {name!r}: {e}') from e
+    return runtimes
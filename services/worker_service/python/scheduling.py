@@ -0,0 +1,339 @@
+"""Queue routing, priorities, per-user fair share and admission control for execution jobs.
+
+Routing: ``execute_code_task`` and ``execute_batch_task`` go to a queue per
+runtime (``exec.<language>`` unless the runtime names another ``queue``, e.g.
+one shared ``exec.compiled`` queue), so slow compiles only ever wait behind
+other slow compiles. A worker consumes the queues of ``WORKER_LANGUAGES``
+(default: all runtimes) plus the default ``celery`` queue for housekeeping
+tasks, and warms sandboxes for those languages.
+
+Priorities: the Redis transport keeps one list per queue and priority step
+and always pops the lowest step first. ``PRIORITIES`` names the steps; code
+runs default to ``normal``, batches to ``batch``.
+
+Fair share: a job carrying a ``user_id`` takes one of that user's
+``FAIR_SHARE_MAX_RUNNING`` slots (a Redis sorted set of leases shared by all
+workers) for as long as it runs. When the user is at the limit the job goes
+back to the end of its queue and other users' jobs run first.
+
+Admission control: every published job is stamped with ``enqueued_at``. The
+wait of the oldest job still queued is the backlog signal. The router applies
+it on every publish, whoever the producer: once it exceeds
+``ADMISSION_MAX_WAIT_S``, interactive and normal jobs are rejected with
+``QueueOverloaded`` (raised from ``apply_async``/``send_task``) and batch and
+bulk jobs are deferred by the excess instead. Interactive jobs also expire
+after ``INTERACTIVE_EXPIRES_S`` in the queue, since nobody is waiting for them
+anymore.
+
+``collect`` reports queue depth, oldest-job wait, recent start waits and
+admission counters as Prometheus metrics for autoscaling;
+``python scheduling.py --port 9808`` serves them.
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+import redis
+from celery import current_task
+from celery.signals import before_task_publish
+from kombu import Queue
+
+QUEUE_PREFIX = 'exec.'
+DEFAULT_QUEUE = 'celery'
+# Names of the Redis transport's priority steps; lower steps are served first.
+PRIORITIES = {'interactive': 0, 'normal': 3, 'batch': 6, 'bulk': 9}
+PRIORITY_STEPS = sorted(PRIORITIES.values())
+QUEUE_SEP = ':'
+TASK_PRIORITY = {'worker.execute_code_task': 'normal', 'worker.execute_batch_task': 'batch'}
+DEFERRABLE = ('batch', 'bulk')
+# Headers the router sets for ``stamp_headers``; Celery routers cannot set a
+# countdown or expiry themselves.
+DEFER_HEADER = 'admission_defer_seconds'
+EXPIRES_HEADER = 'admission_expires_seconds'
+
+KEY_PREFIX = 'scheduling:'
+WAIT_SAMPLES = 500
+
+# Take a lease if the user holds fewer than ARGV[3] unexpired ones.
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[4])
+redis.call('expireat', KEYS[1], math.ceil(tonumber(ARGV[2])))
+return 1
+"""
+
+
+class QueueOverloaded(Exception):
+    def __init__(self, queue, wait_seconds):
+        super().__init__(f'Queue {queue} is overloaded: oldest job has waited {wait_seconds:.1f}s')
+        self.queue = queue
+        self.wait_seconds = wait_seconds
+
+
+class FairShareExceeded(Exception):
+    pass
+
+
+@before_task_publish.connect
+def stamp_headers(headers=None, **kwargs):
+    """Stamp ``enqueued_at`` and turn the router's admission headers into ``eta`` and ``expires``.
+
+    An ``eta`` or ``expires`` the publisher set itself is kept.
+    """
+    if headers is None:
+        return
+    now = time.time()
+    headers['enqueued_at'] = now
+    for header, field in ((DEFER_HEADER, 'eta'), (EXPIRES_HEADER, 'expires')):
+        seconds = headers.pop(header, None)
+        if seconds and not headers.get(field):
+            headers[field] = datetime.fromtimestamp(now + seconds, timezone.utc).isoformat()
+
+
+def priority_name(step):
+    """Name of the priority level the transport files ``step`` under (the next step down)."""
+    level = PRIORITY_STEPS[max(0, bisect.bisect(PRIORITY_STEPS, step) - 1)]
+    return next(name for name, value in PRIORITIES.items() if value == level)
+
+
+def transport_options():
+    return {'priority_steps': PRIORITY_STEPS, 'sep': QUEUE_SEP}
+
+
+class Scheduler:
+    def __init__(self, runtimes, redis_url=None, languages=None, max_running_per_user=None,
+                 max_wait_seconds=None, interactive_expires_seconds=None, retry_seconds=None):
+        env = os.environ
+        self.runtimes = runtimes
+        self.redis_url = redis_url or env.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+        if languages is None:
+            languages = [language for language in env.get('WORKER_LANGUAGES', '').split(',') if language]
+        self.languages = [language for language in languages or runtimes if language in runtimes]
+        self.max_running_per_user = int(max_running_per_user if max_running_per_user is not None
+                                        else env.get('FAIR_SHARE_MAX_RUNNING', 4))
+        self.max_wait_seconds = float(max_wait_seconds if max_wait_seconds is not None
+                                      else env.get('ADMISSION_MAX_WAIT_S', 30))
+        self.interactive_expires_seconds = float(
+            interactive_expires_seconds if interactive_expires_seconds is not None
+            else env.get('INTERACTIVE_EXPIRES_S', 60))
+        self.retry_seconds = float(retry_seconds if retry_seconds is not None
+                                   else env.get('FAIR_SHARE_RETRY_S', 0.5))
+        self._redis = None
+        self._acquire = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            client = redis.Redis.from_url(self.redis_url)
+            self._acquire = client.register_script(ACQUIRE_SLOT_SCRIPT)
+            self._redis = client
+        return self._redis
+
+    def queue_for(self, language):
+        runtime = self.runtimes.get(language)
+        if runtime is None:
+            # Unknown languages are rejected by whichever worker picks them up.
+            return DEFAULT_QUEUE
+        return runtime.queue or QUEUE_PREFIX + language
+
+    def queues(self):
+        """Queues this worker consumes."""
+        names = list(dict.fromkeys(self.queue_for(language) for language in self.languages))
+        return [Queue(name) for name in names + [DEFAULT_QUEUE]]
+
+    def all_queues(self):
+        return list(dict.fromkeys(self.queue_for(language) for language in self.runtimes))
+
+    def route(self, name, args, kwargs, options, task=None, **kw):
+        """Celery router: language queue, default priority and admission of execution tasks.
+
+        Raises ``QueueOverloaded`` to reject a job; see ``admit``. Jobs
+        republished from a running task (fair-share retries) were admitted
+        when first published and are only routed.
+        """
+        if name not in TASK_PRIORITY:
+            return None
+        language = args[0] if args else kwargs.get('language')
+        queue = self.queue_for(language)
+        step = options.get('priority')
+        if step is None:
+            step = PRIORITIES[TASK_PRIORITY[name]]
+        route = {'queue': queue, 'priority': step}
+        if current_task and current_task.request.id:
+            return route
+        priority = priority_name(step)
+        headers = {}
+        countdown = self.admit(queue, priority)
+        if countdown:
+            headers[DEFER_HEADER] = countdown
+        if priority == 'interactive' and self.interactive_expires_seconds > 0:
+            headers[EXPIRES_HEADER] = self.interactive_expires_seconds
+        if headers:
+            route['headers'] = headers
+        return route
+
+    # Backlog
+
+    def _keys(self, queue):
+        return [queue if step == 0 else f'{queue}{QUEUE_SEP}{step}' for step in PRIORITY_STEPS]
+
+    def depth(self, queue):
+        """Jobs waiting in ``queue``, per priority step."""
+        pipe = self.redis.pipeline()
+        for key in self._keys(queue):
+            pipe.llen(key)
+        return dict(zip(PRIORITY_STEPS, pipe.execute()))
+
+    def oldest_wait(self, queue, now=None):
+        """Seconds the oldest job still in ``queue`` has waited (0 if empty or unstamped)."""
+        now = now or time.time()
+        pipe = self.redis.pipeline()
+        for key in self._keys(queue):
+            # Producers LPUSH and workers BRPOP, so the oldest job is last.
+            pipe.lindex(key, -1)
+        oldest = 0.0
+        for raw in pipe.execute():
+            if raw is None:
+                continue
+            try:
+                enqueued_at = json.loads(raw).get('headers', {}).get('enqueued_at')
+            except (ValueError, AttributeError):
+                continue
+            if enqueued_at:
+                oldest = max(oldest, now - float(enqueued_at))
+        return oldest
+
+    # Admission
+
+    def admit(self, queue, priority):
+        """Seconds to defer a job of ``priority`` in ``queue`` by, or ``QueueOverloaded``."""
+        if self.max_wait_seconds <= 0:
+            return 0
+        wait = self.oldest_wait(queue)
+        if wait <= self.max_wait_seconds:
+            return 0
+        if priority in DEFERRABLE:
+            self.redis.hincrby(KEY_PREFIX + 'admission', f'{queue}{QUEUE_SEP}deferred', 1)
+            return wait - self.max_wait_seconds
+        self.redis.hincrby(KEY_PREFIX + 'admission', f'{queue}{QUEUE_SEP}rejected', 1)
+        raise QueueOverloaded(queue, wait)
+
+    # Worker side
+
+    def started(self, request, language):
+        """Record how long the job described by ``request`` waited in its queue."""
+        enqueued_at = getattr(request, 'enqueued_at', None)
+        if not enqueued_at:
+            return None
+        wait = max(0.0, time.time() - float(enqueued_at))
+        key = KEY_PREFIX + 'waits:' + self.queue_for(language)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.lpush(key, round(wait, 4))
+            pipe.ltrim(key, 0, WAIT_SAMPLES - 1)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+        return wait
+
+    def acquire_slot(self, user_id, job_id, language, lease_seconds):
+        """Take one of ``user_id``'s slots for ``lease_seconds``, or raise ``FairShareExceeded``."""
+        if user_id is None or self.max_running_per_user <= 0:
+            return
+        client = self.redis
+        now = time.time()
+        if not self._acquire(keys=[KEY_PREFIX + f'running:{user_id}'],
+                             args=[now, now + lease_seconds, self.max_running_per_user, job_id], client=client):
+            client.hincrby(KEY_PREFIX + 'admission', f'{self.queue_for(language)}{QUEUE_SEP}fair_share_deferred', 1)
+            raise FairShareExceeded(f'User {user_id} already runs {self.max_running_per_user} jobs')
+
+    def release_slot(self, user_id, job_id):
+        if user_id is None or self.max_running_per_user <= 0:
+            return
+        try:
+            self.redis.zrem(KEY_PREFIX + f'running:{user_id}', job_id)
+        except redis.RedisError:
+            # The lease expires on its own.
+            pass
+
+    def retry_delay(self):
+        # Jitter keeps a user's deferred jobs from coming back in lockstep.
+        return self.retry_seconds * random.uniform(0.5, 1.5)
+
+    # Reporting
+
+    def stats(self):
+        now = time.time()
+        queues = {}
+        for queue in self.all_queues():
+            waits = [float(wait) for wait in self.redis.lrange(KEY_PREFIX + 'waits:' + queue, 0, -1)]
+            queues[queue] = {
+                'depth': self.depth(queue),
+                'oldest_wait_seconds': self.oldest_wait(queue, now),
+                'recent_wait_seconds': {
+                    'samples': len(waits),
+                    'p50': statistics.median(waits) if waits else None,
+                    'p95': sorted(waits)[int(0.95 * (len(waits) - 1))] if waits else None,
+                    'max': max(waits) if waits else None,
+                },
+            }
+        counters = {key.decode(): int(value)
+                    for key, value in self.redis.hgetall(KEY_PREFIX + 'admission').items()}
+        return {'queues': queues, 'admission': counters}
+
+    def describe(self):
+        # Nothing to declare up front: registering must not need Redis.
+        return []
+
+    def collect(self):
+        """Prometheus collector over ``stats()``."""
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        stats = self.stats()
+        depth = GaugeMetricFamily('execution_queue_depth', 'Jobs waiting per queue and priority step',
+                                  labels=['queue', 'priority'])
+        oldest = GaugeMetricFamily('execution_queue_oldest_wait_seconds', 'Wait of the oldest queued job',
+                                   labels=['queue'])
+        recent = GaugeMetricFamily('execution_queue_wait_seconds', 'Queue wait of recently started jobs',
+                                   labels=['queue', 'quantile'])
+        admission = CounterMetricFamily('execution_admission_decisions', 'Jobs rejected or deferred',
+                                        labels=['queue', 'decision'])
+        for queue, queue_stats in stats['queues'].items():
+            for step, count in queue_stats['depth'].items():
+                depth.add_metric([queue, str(step)], count)
+            oldest.add_metric([queue], queue_stats['oldest_wait_seconds'])
+            for quantile, name in (('0.5', 'p50'), ('0.95', 'p95'), ('1', 'max')):
+                value = queue_stats['recent_wait_seconds'][name]
+                if value is not None:
+                    recent.add_metric([queue, quantile], value)
+        for key, count in stats['admission'].items():
+            queue, _, decision = key.rpartition(QUEUE_SEP)
+            admission.add_metric([queue, decision], count)
+        return [depth, oldest, recent, admission]
+
+
+def main():
+    from prometheus_client import start_http_server
+    from prometheus_client.core import REGISTRY
+
+    from runtimes import load_runtimes
+
+    parser = argparse.ArgumentParser(description='Serve execution queue metrics for Prometheus.')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SCHEDULING_METRICS_PORT', 9808)))
+    args = parser.parse_args()
+    REGISTRY.register(Scheduler(load_runtimes()))
+    start_http_server(args.port)
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == '__main__':
+    main()
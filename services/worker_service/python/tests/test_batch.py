@@ -0,0 +1,147 @@
+import contextlib
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import worker
+from container_pool import ExecResult
+from output import OutputBuffer
+
+
+def buffer(text):
+    buf = OutputBuffer()
+    buf.write(text.encode())
+    return buf
+
+
+class FakeSandbox:
+    """Runs each case by looking its stdin up in ``programs``: stdin -> (exit_code, stdout, seconds)."""
+
+    def __init__(self, programs):
+        self.programs = programs
+        self.workspace = '/workspace'
+        self.commands = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def write_file(self, name, content):
+        pass
+
+    def exec(self, command, stdin=None, timeout=None, **kwargs):
+        self.commands.append((command, stdin, timeout, kwargs))
+        exit_code, stdout, seconds = self.programs[stdin]
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(seconds)
+        finally:
+            with self._lock:
+                self.running -= 1
+        if exit_code is None:
+            raise RuntimeError('container went away')
+        return ExecResult(exit_code, buffer(stdout), buffer(''), usage={'peak_memory_kb': 100})
+
+
+@pytest.fixture
+def sandbox(monkeypatch):
+    sandbox = FakeSandbox({
+        '1': (0, '2\n', 0),
+        '2': (0, '4\n', 0),
+        'wrong': (0, '5\n', 0),
+        'fails': (1, '', 0),
+        'slow': (137, '', 0.1),
+        'killed': (137, '', 0),
+        'broken': (None, '', 0),
+    })
+    pool = MagicMock(image_id='sha256:aaa')
+    pool.lease.side_effect = lambda: contextlib.nullcontext(sandbox)
+    monkeypatch.setattr(worker, 'pools', MagicMock(get=MagicMock(return_value=pool)))
+    return sandbox
+
+
+def run(test_inputs, **kwargs):
+    return worker.execute_batch_task('python', 'print(int(input()) * 2)', test_inputs, **kwargs)
+
+
+def test_cases_run_with_their_own_kill_timeout(sandbox):
+    result = run(['1', {'input': '2', 'expected_output': '4'}], timeout_ms=1500)
+
+    assert result['status'] == 'success'
+    assert [case['index'] for case in result['results']] == [0, 1]
+    assert [case['stdout'] for case in result['results']] == ['2\n', '4\n']
+    assert 'passed' not in result['results'][0]
+    assert result['results'][1]['passed'] is True
+    assert result['succeeded'] == 2 and result['passed'] == 1
+
+    command, stdin, timeout, kwargs = sandbox.commands[0]
+    assert command == ['timeout', '-s', 'KILL', '1.5', 'python', 'main.py']
+    assert timeout == 1.5 + worker.BATCH_KILL_GRACE_S
+    assert kwargs['stdin_file'] == '.stdin-0' and kwargs['usage_file'] == '.usage-0'
+    assert sandbox.commands[1][3]['stdin_file'] == '.stdin-1'
+
+
+def test_passed_compares_output_without_trailing_whitespace(sandbox):
+    result = run([{'input': '1', 'expected_output': '2'}, {'input': 'wrong', 'expected_output': '4\n'},
+                  {'input': 'fails', 'expected_output': ''}])
+
+    assert [case['passed'] for case in result['results']] == [True, False, True]
+    assert result['results'][2]['status'] == 'error'
+    assert result['succeeded'] == 2
+
+
+def test_sigkill_after_the_deadline_is_a_timeout(sandbox):
+    result = run([{'input': 'slow', 'expected_output': ''}, 'killed'], timeout_ms=50)
+
+    slow, killed = result['results']
+    assert slow['timed_out'] and slow['status'] == 'error'
+    assert slow['message'] == 'Execution timed out after 50 ms'
+    assert slow['passed'] is False
+    # Killed before the deadline (e.g. out of memory): a failure, not a timeout.
+    assert not killed['timed_out']
+    assert killed['message'] == 'Execution failed'
+
+
+def test_a_failing_case_does_not_fail_the_batch(sandbox):
+    result = run(['1', 'broken'])
+
+    assert result['status'] == 'success'
+    assert result['results'][1] == {'index': 1, 'status': 'error',
+                                    'message': 'Docker error during execution: container went away'}
+
+
+def test_cases_run_concurrently_up_to_the_limit(sandbox, monkeypatch):
+    monkeypatch.setattr(worker, 'BATCH_MAX_CONCURRENCY', 2)
+    sandbox.programs['wait'] = (0, 'ok\n', 0.05)
+
+    result = run(['wait'] * 6, concurrency=8)
+
+    assert [case['index'] for case in result['results']] == list(range(6))
+    assert sandbox.max_running == 2
+
+
+@pytest.mark.parametrize('test_inputs, message', [
+    ('1', 'test_inputs must be a list'),
+    ([1], 'Test input 0 must be a string'),
+    (['1', {'input': 2}], 'Test input 1 must be a string'),
+    ([{'input': '1', 'expected_output': 2}], 'Test input 0 must be a string'),
+    (['1', ['2']], 'Test input 1 must be a string'),
+])
+def test_malformed_cases_are_rejected_up_front(sandbox, test_inputs, message):
+    result = run(test_inputs)
+
+    assert result['status'] == 'error'
+    assert result['message'].startswith(message)
+    assert sandbox.commands == []
+
+
+def test_too_many_cases_are_rejected(sandbox, monkeypatch):
+    monkeypatch.setattr(worker, 'BATCH_MAX_CASES', 2)
+
+    result = run(['1', '1', '1'])
+
+    assert result == {'status': 'error', 'message': 'At most 2 test inputs are allowed per batch'}
+    assert sandbox.commands == []
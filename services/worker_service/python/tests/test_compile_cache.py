@@ -0,0 +1,87 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+import worker
+from compile_cache import CompileCache
+
+COMMAND = ['g++', 'main.cpp', '-o', 'main']
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompileCache(root=str(tmp_path / 'cache'), max_bytes=250)
+
+
+def build(directory, name, content):
+    directory.mkdir(exist_ok=True)
+    (directory / name).write_bytes(content)
+    return str(directory)
+
+
+def test_key_covers_source_toolchain_and_flags():
+    key = CompileCache.key('cpp', 'sha256:aaa', 'int main() {}', COMMAND)
+    assert key == CompileCache.key('cpp', 'sha256:aaa', 'int main() {}', COMMAND)
+    assert key != CompileCache.key('cpp', 'sha256:bbb', 'int main() {}', COMMAND)
+    assert key != CompileCache.key('cpp', 'sha256:aaa', 'int main() {}', COMMAND + ['-O2'])
+    assert key != CompileCache.key('cpp', 'sha256:aaa', 'int main() { }', COMMAND)
+    assert key != CompileCache.key('c', 'sha256:aaa', 'int main() {}', COMMAND)
+
+
+def test_store_then_restore(cache, tmp_path):
+    key = CompileCache.key('cpp', 'sha256:aaa', 'int main() {}', COMMAND)
+    src = build(tmp_path / 'build', 'main', b'\x7fELF')
+    (tmp_path / 'build' / 'main.cpp').write_text('int main() {}')
+
+    assert not cache.restore(key, str(tmp_path))
+    assert cache.store(key, src, ['main'])
+    dest = tmp_path / 'restored'
+    dest.mkdir()
+    assert cache.restore(key, str(dest))
+
+    assert [path.name for path in dest.iterdir()] == ['main']
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_eviction_removes_least_recently_used_first(cache, tmp_path):
+    keys = {name: CompileCache.key('cpp', 'sha256:aaa', name, COMMAND) for name in 'abc'}
+    for mtime, name in enumerate('ab', start=1):
+        cache.store(keys[name], build(tmp_path / name, 'main', b'x' * 100), ['main'])
+        os.utime(cache._path(keys[name]), (mtime, mtime))
+    # Using `a` makes `b` the least recently used entry.
+    assert cache.restore(keys['a'], str(tmp_path))
+
+    cache.store(keys['c'], build(tmp_path / 'c', 'main', b'x' * 100), ['main'])
+
+    assert not os.path.isdir(cache._path(keys['b']))
+    assert os.path.isdir(cache._path(keys['a'])) and os.path.isdir(cache._path(keys['c']))
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 200
+
+
+def test_index_is_rebuilt_from_disk(cache, tmp_path):
+    key = CompileCache.key('cpp', 'sha256:aaa', 'int main() {}', COMMAND)
+    cache.store(key, build(tmp_path / 'build', 'main', b'x' * 10), ['main'])
+    assert CompileCache(root=cache.root, max_bytes=250).stats()['entries'] == 1
+
+
+def test_compile_hit_skips_the_compiler(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, 'compile_cache', cache)
+    runtime = worker.RUNTIMES['cpp']
+    pool = MagicMock(image_id='sha256:aaa')
+    sandbox = MagicMock(workspace=str(tmp_path / 'workspace'))
+    os.makedirs(sandbox.workspace)
+
+    def compile_in_workspace(command, timeout):
+        build(tmp_path / 'workspace', 'main', b'\x7fELF')
+        return MagicMock(timed_out=False, exit_code=0)
+    sandbox.exec.side_effect = compile_in_workspace
+
+    assert worker._compile(sandbox, pool, runtime, 'int main() {}') is None
+    assert worker._compile(sandbox, pool, runtime, 'int main() {}') is None
+    assert sandbox.exec.call_count == 1
+
+    pool.image_id = 'sha256:bbb'
+    assert worker._compile(sandbox, pool, runtime, 'int main() {}') is None
+    assert sandbox.exec.call_count == 2
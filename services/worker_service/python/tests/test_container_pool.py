@@ -0,0 +1,180 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from container_pool import ContainerPool, ContainerPoolManager, PoolConfig, PoolExhausted, PooledContainer
+
+
+def make_client():
+    client = MagicMock()
+
+    def run(image, **kwargs):
+        container = MagicMock()
+        container.id = f'container{client.containers.run.call_count:04d}'
+        container.status = 'running'
+        container.client = client
+        return container
+    client.containers.run.side_effect = run
+    return client
+
+
+def make_pool(**config):
+    config = dict({'min_size': 0, 'max_size': 2, 'max_jobs': 100, 'acquire_timeout': 0}, **config)
+    return ContainerPool(make_client(), 'polyglot/python', PoolConfig(**config))
+
+
+def test_acquire_grows_to_max_size_then_times_out():
+    pool = make_pool()
+    first, second = pool.acquire(), pool.acquire()
+    assert pool.stats()['size'] == 2
+    assert pool.stats()['busy'] == 2
+    with pytest.raises(PoolExhausted):
+        pool.acquire(timeout=0)
+
+    pool.release(first)
+    assert pool.stats()['idle'] == 1
+    assert pool.acquire() is first
+    assert pool.created == 2
+    pool.close()
+
+
+def test_release_recycles_after_max_jobs():
+    pool = make_pool(max_jobs=2)
+    pooled = pool.acquire()
+    pool.release(pooled)
+    assert pool.acquire() is pooled
+    pool.release(pooled)
+
+    assert pool.recycled == 1
+    assert pool.stats()['size'] == 0
+    pooled.container.remove.assert_called_once_with(force=True)
+    assert pool.acquire() is not pooled
+
+
+def test_unhealthy_idle_sandbox_is_replaced():
+    pool = make_pool()
+    pooled = pool.acquire()
+    pool.release(pooled)
+    pooled.container.status = 'exited'
+
+    replacement = pool.acquire()
+
+    assert replacement is not pooled
+    pooled.container.remove.assert_called_once_with(force=True)
+    stats = pool.stats()
+    assert (stats['size'], stats['idle'], stats['busy']) == (1, 0, 1)
+    pool.close()
+
+
+def test_lease_discards_sandbox_when_job_raises():
+    pool = make_pool()
+    with pytest.raises(RuntimeError):
+        with pool.lease() as pooled:
+            raise RuntimeError('boom')
+    assert pool.stats()['size'] == 0
+    pooled.container.remove.assert_called_once()
+
+
+def test_maintain_evicts_idle_sandboxes_above_min_size():
+    pool = make_pool(min_size=1, idle_timeout=0)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+
+    pool.maintain()
+
+    assert pool.evicted == 1
+    assert pool.stats()['size'] == 1
+    pool.close()
+
+
+def test_exec_collects_output_exit_code_and_usage():
+    pool = make_pool()
+    pooled = pool.acquire()
+    api = pooled.container.client.api
+    api.exec_create.return_value = {'Id': 'exec1'}
+    api.exec_start.return_value = iter([(b'hello\n', None), (None, b'oops\n')])
+    api.exec_inspect.return_value = {'ExitCode': 3}
+    pooled.write_file('.usage', '0m0.001s 0m0.002s\n0m0.250s 0m0.050s\n2097152\n')
+    chunks = []
+
+    result = pooled.exec(['python', 'main.py'], stdin='input', on_output=lambda *chunk: chunks.append(chunk),
+                         usage_file='.usage')
+
+    assert result.exit_code == 3
+    assert result.stdout.text() == 'hello\n'
+    assert result.stderr.text() == 'oops\n'
+    assert chunks == [('stdout', b'hello\n'), ('stderr', b'oops\n')]
+    assert result.usage == {'cpu_user_ms': 250.0, 'cpu_system_ms': 50.0, 'peak_memory_kb': 2048}
+    command = api.exec_create.call_args[0][1]
+    assert command[:2] == ['sh', '-c'] and '< .stdin' in command[2]
+    pool.release(pooled)
+    pool.close()
+
+
+def test_exec_reports_peak_memory_only_for_a_sandbox_first_command():
+    pool = make_pool()
+    pooled = pool.acquire()
+    api = pooled.container.client.api
+    api.exec_create.return_value = {'Id': 'exec1'}
+    api.exec_start.side_effect = lambda *args, **kwargs: iter([])
+    api.exec_inspect.return_value = {'ExitCode': 0}
+    pooled.write_file('.usage', '0m0.000s 0m0.000s\n0m0.250s 0m0.050s\n2097152\n')
+
+    assert pooled.exec(['python', 'main.py'], usage_file='.usage').usage['peak_memory_kb'] == 2048
+    # The cgroup peak now includes the first command.
+    assert pooled.exec(['python', 'main.py'], usage_file='.usage').usage == {
+        'cpu_user_ms': 250.0, 'cpu_system_ms': 50.0}
+    pool.release(pooled)
+
+    compiled = pool.acquire()
+    compiled.container.client.api.exec_inspect.return_value = {'ExitCode': 0}
+    compiled.container.client.api.exec_start.side_effect = lambda *args, **kwargs: iter([])
+    compiled.write_file('.usage', '0m0.000s 0m0.000s\n0m0.250s 0m0.050s\n2097152\n')
+    compiled.exec(['g++', 'main.cpp'])
+    assert 'peak_memory_kb' not in compiled.exec(['./main'], usage_file='.usage').usage
+    pool.close()
+
+
+def test_exec_timeout_kills_sandbox_and_pool_discards_it():
+    pool = make_pool()
+    pooled = pool.acquire()
+    api = pooled.container.client.api
+    api.exec_create.return_value = {'Id': 'exec1'}
+    stop = threading.Event()
+
+    def hang(*args, **kwargs):
+        stop.wait(5)
+        return iter([])
+    api.exec_start.side_effect = hang
+    pooled.container.kill.side_effect = lambda: stop.set()
+
+    result = pooled.exec(['sleep', '60'], timeout=0.05)
+
+    assert result.timed_out and result.exit_code is None
+    assert pooled.killed
+    pool.release(pooled)
+    assert pool.stats()['size'] == 0
+    pooled.container.remove.assert_called_once()
+
+
+def test_manager_rebuilds_state_in_a_forked_process():
+    factory = MagicMock(side_effect=make_client)
+    manager = ContainerPoolManager(config=PoolConfig(reap_interval=3600), client_factory=factory)
+    with patch('container_pool.atexit'):
+        with patch('container_pool.os.getpid', return_value=100):
+            pool = manager.get('polyglot/python', mem_limit='256m')
+            assert manager.get('polyglot/python') is pool
+            assert pool.container_kwargs == {'mem_limit': '256m'}
+        with patch('container_pool.os.getpid', return_value=200):
+            assert manager.get('polyglot/python') is not pool
+    assert factory.call_count == 2
+
+
+def test_pooled_container_reset_workspace(tmp_path):
+    (tmp_path / 'main.py').write_text('print(1)')
+    (tmp_path / 'build').mkdir()
+    pooled = PooledContainer(MagicMock(), str(tmp_path))
+    assert pooled.reset_workspace()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock
+
+import psycopg2
+import pytest
+
+import executions
+import worker
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = MagicMock()
+    monkeypatch.setattr(executions, 'get_db_connection', MagicMock(return_value=conn))
+    return conn
+
+
+def executed(conn):
+    (sql, values), _ = conn.cursor.return_value.execute.call_args
+    return sql, values
+
+
+def test_success_maps_result_fields_to_columns(conn):
+    executions.record_execution('exec-1', {
+        'status': 'success', 'stdout': 'hi\n', 'stderr': 'warning', 'duration_ms': 12.6,
+        'compile_ms': 0.4, 'run_ms': 12.2, 'cpu_user_ms': 9.5, 'cpu_system_ms': 1.49,
+        'peak_memory_kb': 2048, 'stdout_bytes': 3, 'stderr_bytes': 7,
+    })
+
+    sql, values = executed(conn)
+    assert sql.startswith('UPDATE executions SET status = %(status)s, output = %(output)s')
+    assert sql.endswith('WHERE id = %(id)s')
+    for column in ['error', 'duration_ms'] + executions.USAGE_COLUMNS:
+        assert f'{column} = %({column})s' in sql
+    assert values == {
+        'id': 'exec-1', 'status': 'success', 'output': 'hi\n', 'error': None, 'duration_ms': 13,
+        'compile_ms': 0, 'run_ms': 12, 'cpu_user_ms': 10, 'cpu_system_ms': 1,
+        'peak_memory_kb': 2048, 'stdout_bytes': 3, 'stderr_bytes': 7,
+    }
+    conn.commit.assert_called_once()
+    conn.close.assert_called_once()
+
+
+def test_failures_store_stderr_or_message_and_missing_usage_as_null(conn):
+    executions.record_execution('exec-1', {'status': 'error', 'stdout': '', 'stderr': 'Traceback'})
+    _, values = executed(conn)
+    assert (values['status'], values['error']) == ('failed', 'Traceback')
+    assert all(values[column] is None for column in ['duration_ms'] + executions.USAGE_COLUMNS)
+
+    executions.record_execution('exec-2', {'status': 'error', 'message': 'Unsupported language: cobol'})
+    _, values = executed(conn)
+    assert (values['status'], values['output'], values['error']) == ('failed', None, 'Unsupported language: cobol')
+
+
+def test_database_errors_are_logged_not_raised(conn, caplog):
+    conn.cursor.return_value.execute.side_effect = psycopg2.OperationalError('connection lost')
+
+    executions.record_execution('exec-1', {'status': 'success'})
+
+    conn.commit.assert_not_called()
+    conn.close.assert_called_once()
+    assert 'Could not record execution exec-1: connection lost' in caplog.text
+
+
+@pytest.mark.parametrize('execution_id, recorded', [(None, False), ('', False), ('exec-1', True)])
+def test_execute_code_task_records_only_with_an_execution_id(monkeypatch, execution_id, recorded):
+    record = MagicMock()
+    monkeypatch.setattr(worker, 'record_execution', record)
+
+    result = worker.execute_code_task('cobol', 'DISPLAY 1', execution_id=execution_id)
+
+    assert result == {'status': 'error', 'message': 'Unsupported language: cobol'}
+    if recorded:
+        record.assert_called_once_with('exec-1', result)
+    else:
+        record.assert_not_called()
@@ -0,0 +1,76 @@
+import json
+
+import fakeredis
+
+from container_pool import parse_usage
+from output import OutputBuffer, OutputPublisher
+
+
+def test_output_buffer_keeps_everything_under_the_cap():
+    buffer = OutputBuffer(10)
+    buffer.write(b'hello')
+    buffer.write(b'world')
+    assert buffer.getvalue() == b'helloworld'
+    assert buffer.total_bytes == 10
+    assert not buffer.truncated
+
+
+def test_output_buffer_keeps_the_tail_and_counts_all_bytes():
+    buffer = OutputBuffer(8)
+    for chunk in (b'line 1\n', b'line 2\n', b'line 3\n'):
+        buffer.write(chunk)
+    assert buffer.getvalue() == b'\nline 3\n'
+    assert buffer.total_bytes == 21
+    assert buffer.truncated
+
+
+def test_output_buffer_single_write_larger_than_the_cap():
+    buffer = OutputBuffer(4)
+    buffer.write(b'ab')
+    buffer.write(b'0123456789')
+    assert buffer.getvalue() == b'6789'
+    assert buffer.total_bytes == 12
+    assert buffer.truncated
+
+
+def test_output_buffer_text_replaces_a_cut_character():
+    buffer = OutputBuffer(3)
+    buffer.write('aé€'.encode())
+    assert buffer.text() == '€'
+    buffer.write(b'\x82\xacz')
+    assert buffer.text() == '��z'
+
+
+def test_parse_usage_reads_times_and_memory_peak():
+    text = '0m0.010s 0m0.002s\n1m2.500s 0m0.125s\n52428800\n'
+    assert parse_usage(text) == {'cpu_user_ms': 62500.0, 'cpu_system_ms': 125.0, 'peak_memory_kb': 51200}
+
+
+def test_parse_usage_without_memory_line():
+    assert parse_usage('0m0.000s 0m0.000s\n0m0.040s 0m0.010s\n') == {'cpu_user_ms': 40.0, 'cpu_system_ms': 10.0}
+
+
+def test_parse_usage_ignores_malformed_trailers():
+    # The job can write to the workspace, so the usage file may be forged.
+    assert parse_usage('') == {}
+    assert parse_usage('garbage') == {}
+    assert parse_usage('0m0.000s 0m0.000s\n0m1.2.3s 0m0.1s\nmax\n') == {}
+    assert parse_usage('x\n0m1s 0m2s 0m3s\n²\n') == {}
+    assert parse_usage('x\n0m1s 0m2s\n-1024\n') == {'cpu_user_ms': 1000.0, 'cpu_system_ms': 2000.0}
+
+
+def test_output_publisher_bounds_each_stream_and_ends():
+    redis = fakeredis.FakeStrictRedis()
+    publisher = OutputPublisher(redis, 'task1', max_bytes=5, flush_interval=3600)
+    publisher('stdout', b'hello world')
+    publisher('stderr', b'\xe2\x82')
+    publisher('stderr', b'\xac!')
+    publisher.close()
+
+    chunks = [json.loads(message) for message in redis.lrange('execution-output:task1', 0, -1)]
+    assert chunks == [
+        {'seq': 0, 'stream': 'stdout', 'data': 'hello'},
+        {'seq': 1, 'stream': 'stderr', 'data': '€!'},
+        {'seq': 2, 'event': 'end'},
+    ]
+    assert redis.ttl('execution-output:task1') > 0
@@ -0,0 +1,117 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import fakeredis
+import pytest
+import redis
+
+from result_cache import ResultCache
+
+KEY = ResultCache.key('python', 'sha256:aaa', 'print(1)', '', {'timeout_ms': 1000})
+RESULT = {'status': 'success', 'exit_code': 0, 'stdout': '1\n', 'stderr': ''}
+
+
+@pytest.fixture
+def cache():
+    return ResultCache(fakeredis.FakeStrictRedis(), ttl_seconds=60, max_entry_bytes=1024)
+
+
+def counting(result):
+    calls = []
+
+    def execute():
+        calls.append(1)
+        return result
+    return execute, calls
+
+
+def test_key_depends_on_every_input():
+    assert KEY == ResultCache.key('python', 'sha256:aaa', 'print(1)', '', {'timeout_ms': 1000})
+    assert KEY != ResultCache.key('python', 'sha256:aaa', 'print(1)', 'x', {'timeout_ms': 1000})
+    assert KEY != ResultCache.key('python', 'sha256:aaa', 'print(1)', '', {'timeout_ms': 2000})
+    assert KEY != ResultCache.key('python', 'sha256:bbb', 'print(1)', '', {'timeout_ms': 1000})
+
+
+def test_miss_stores_then_hit_replays(cache):
+    execute, calls = counting(RESULT)
+
+    assert cache.get_or_execute(KEY, execute, 5) == RESULT
+    assert cache.get_or_execute(KEY, execute, 5) == dict(RESULT, cached=True)
+
+    assert len(calls) == 1
+    assert not cache.redis.exists(KEY + ':lock')
+    assert 0 < cache.redis.ttl(KEY) <= 60
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'coalesced': 0, 'hit_ratio': 0.5}
+
+
+@pytest.mark.parametrize('result', [
+    dict(RESULT, exit_code=None, timed_out=True),
+    dict(RESULT, stdout_truncated=True),
+    {'status': 'error', 'message': 'No python sandbox available'},
+    dict(RESULT, stdout='x' * 2048),
+])
+def test_uncacheable_or_oversized_results_are_not_stored(cache, result):
+    execute, calls = counting(result)
+    cache.get_or_execute(KEY, execute, 5)
+    cache.get_or_execute(KEY, execute, 5)
+    assert len(calls) == 2
+    assert not cache.redis.exists(KEY)
+
+
+def test_compilation_failures_are_cached(cache):
+    execute, calls = counting({'status': 'error', 'message': 'Compilation failed', 'stderr': 'error: ...'})
+    cache.get_or_execute(KEY, execute, 5)
+    cache.get_or_execute(KEY, execute, 5)
+    assert len(calls) == 1
+
+
+def test_follower_receives_the_leaders_result(cache):
+    cache.redis.set(KEY + ':lock', 'leader-token', ex=5)
+
+    def leader_finishes():
+        time.sleep(0.05)
+        cache._store(KEY, RESULT)
+        cache.redis.delete(KEY + ':lock')
+    threading.Thread(target=leader_finishes).start()
+    execute, calls = counting(dict(RESULT, stdout='follower\n'))
+
+    assert cache.get_or_execute(KEY, execute, 5) == dict(RESULT, cached=True)
+    assert calls == []
+    assert cache.stats()['coalesced'] == 1
+
+
+def test_follower_takes_over_when_the_leaders_lock_expires(cache):
+    cache.redis.set(KEY + ':lock', 'dead-leader', px=100)
+    execute, calls = counting(RESULT)
+
+    started = time.monotonic()
+    assert cache.get_or_execute(KEY, execute, 5) == RESULT
+
+    assert len(calls) == 1
+    assert time.monotonic() - started < 2
+    assert cache.get(KEY) == RESULT
+
+
+def test_leader_releases_only_its_own_lock_when_execute_raises(cache):
+    def fail():
+        raise RuntimeError('sandbox crashed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_execute(KEY, fail, 5)
+    assert not cache.redis.exists(KEY + ':lock')
+
+    cache.redis.set(KEY + ':lock', 'someone-else')
+    cache._release_lock(keys=[KEY + ':lock'], args=['not-mine'])
+    assert cache.redis.get(KEY + ':lock') == b'someone-else'
+
+
+def test_redis_outage_executes_directly():
+    client = MagicMock()
+    client.get.side_effect = redis.ConnectionError('down')
+    client.set.side_effect = redis.ConnectionError('down')
+    client.hincrby.side_effect = redis.ConnectionError('down')
+    execute, calls = counting(RESULT)
+
+    assert ResultCache(client).get_or_execute(KEY, execute, 5) == RESULT
+    assert len(calls) == 1
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from runtimes import CPU_PERIOD, DEFAULT_RUNTIMES, load_runtimes
+
+
+@pytest.fixture
+def override_file(tmp_path):
+    def write(overrides):
+        path = tmp_path / 'runtimes.json'
+        path.write_text(json.dumps(overrides))
+        return str(path)
+    return write
+
+
+def test_defaults(monkeypatch):
+    monkeypatch.delenv('WORKER_RUNTIMES_FILE', raising=False)
+    runtimes = load_runtimes()
+
+    assert set(runtimes) == {spec['name'] for spec in DEFAULT_RUNTIMES}
+    python, cpp = runtimes['python'], runtimes['cpp']
+    assert python.source_file == 'main.py'
+    assert python.run_command == ['python', 'main.py']
+    assert python.compile_command is None and python.cacheable is False
+    assert python.image == 'polyglot-python-runner'
+    assert cpp.compile_command == ['g++', 'main.cpp', '-o', 'main']
+    assert cpp.cacheable is True
+
+
+def test_container_limits(monkeypatch):
+    monkeypatch.delenv('WORKER_RUNTIMES_FILE', raising=False)
+    runtimes = load_runtimes()
+
+    assert runtimes['python'].container_limits() == {
+        'mem_limit': '128m', 'cpu_period': CPU_PERIOD, 'cpu_quota': CPU_PERIOD // 2}
+    assert runtimes['java'].container_limits() == {
+        'mem_limit': '512m', 'cpu_period': CPU_PERIOD, 'cpu_quota': CPU_PERIOD}
+
+
+def test_overrides_merge_into_defaults_and_add_languages(override_file, monkeypatch):
+    monkeypatch.setenv('WORKER_RUNTIMES_FILE', override_file([
+        {'name': 'java', 'mem_limit': '1g', 'timeout_ms': '15000'},
+        {'name': 'kotlin', 'extension': 'kt', 'compile': ['kotlinc', '{source}', '-d', '.'],
+         'run': ['kotlin', 'MainKt'], 'artifacts': ['*.class'], 'queue': 'exec.compiled'},
+    ]))
+    runtimes = load_runtimes()
+
+    java = runtimes['java']
+    assert java.mem_limit == '1g' and java.timeout_ms == 15000
+    assert java.compile_command == ['javac', 'main.java']
+    assert java.cpus == 1.0
+    kotlin = runtimes['kotlin']
+    assert kotlin.compile_command == ['kotlinc', 'main.kt', '-d', '.']
+    assert kotlin.cacheable is True and kotlin.queue == 'exec.compiled'
+    assert kotlin.container_limits()['mem_limit'] == '128m'
+    assert 'python' in runtimes
+
+
+def test_explicit_path_wins_over_the_environment(override_file, monkeypatch):
+    monkeypatch.setenv('WORKER_RUNTIMES_FILE', '/does/not/exist.json')
+    path = override_file([{'name': 'python', 'cacheable': True}])
+
+    assert load_runtimes(path)['python'].cacheable is True
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'name': 'python'}, 'expected a list of runtimes'),
+    (['python'], 'every runtime needs a "name"'),
+    ([{'mem_limit': '1g'}], 'every runtime needs a "name"'),
+    ([{'name': 'python', 'memory': '1g'}], "runtime 'python': "),
+    ([{'name': 'kotlin', 'run': ['kotlin', 'MainKt']}], "runtime 'kotlin': "),
+    ([{'name': 'python', 'cpus': 'half'}], "runtime 'python': "),
+])
+def test_bad_override_files_are_rejected(override_file, overrides, message):
+    path = override_file(overrides)
+
+    with pytest.raises(ValueError) as raised:
+        load_runtimes(path)
+    assert str(raised.value).startswith(path)
+    assert message in str(raised.value)
+
+
+def test_invalid_json_is_rejected(tmp_path):
+    path = tmp_path / 'runtimes.json'
+    path.write_text('[{"name": "python",]')
+
+    with pytest.raises(ValueError):
+        load_runtimes(str(path))
@@ -0,0 +1,176 @@
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+from celery import Celery
+from celery.signals import after_task_publish
+
+import scheduling
+from scheduling import (ACQUIRE_SLOT_SCRIPT, KEY_PREFIX, FairShareExceeded, QueueOverloaded, Scheduler,
+                        priority_name)
+
+RUNTIMES = {'python': SimpleNamespace(queue=None), 'cpp': SimpleNamespace(queue='exec.compiled')}
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def scheduler(client):
+    scheduler = Scheduler(RUNTIMES, languages=[], max_running_per_user=2, max_wait_seconds=30,
+                          interactive_expires_seconds=60)
+    scheduler._redis = client
+    scheduler._acquire = client.register_script(ACQUIRE_SLOT_SCRIPT)
+    return scheduler
+
+
+@pytest.fixture
+def app(scheduler):
+    app = Celery('test', broker='memory://')
+    app.conf.update(task_routes=(scheduler.route,))
+    return app
+
+
+@pytest.fixture
+def published():
+    messages = []
+
+    def record(headers=None, **kwargs):
+        messages.append(dict(headers))
+    after_task_publish.connect(record, weak=False)
+    yield messages
+    after_task_publish.disconnect(record)
+
+
+def enqueue(client, key, enqueued_at):
+    # Producers LPUSH, so the oldest job ends up last.
+    client.lpush(key, json.dumps({'headers': {'enqueued_at': enqueued_at}}))
+
+
+def counters(client):
+    return {key.decode(): int(value) for key, value in client.hgetall(KEY_PREFIX + 'admission').items()}
+
+
+def test_priority_name_follows_the_transport_steps():
+    assert [priority_name(step) for step in (0, 2, 3, 5, 6, 9, 10)] == [
+        'interactive', 'interactive', 'normal', 'normal', 'batch', 'bulk', 'bulk']
+
+
+def test_queue_for_language():
+    scheduler = Scheduler(RUNTIMES, languages=[])
+    assert scheduler.queue_for('python') == 'exec.python'
+    assert scheduler.queue_for('cpp') == 'exec.compiled'
+    assert scheduler.queue_for('cobol') == 'celery'
+
+
+def test_oldest_wait_looks_at_every_priority_step(scheduler, client):
+    now = time.time()
+    assert scheduler.oldest_wait('exec.python', now) == 0
+    enqueue(client, 'exec.python', now - 5)
+    enqueue(client, 'exec.python', now - 1)
+    enqueue(client, 'exec.python:6', now - 40)
+    enqueue(client, 'exec.python:6', now - 2)
+    client.lpush('exec.python:9', b'not json')
+    assert scheduler.oldest_wait('exec.python', now) == pytest.approx(40)
+    assert scheduler.oldest_wait('exec.compiled', now) == 0
+
+
+def test_admit_without_backlog(scheduler, client):
+    enqueue(client, 'exec.python', time.time() - 10)
+    assert scheduler.admit('exec.python', 'normal') == 0
+    assert counters(client) == {}
+
+
+def test_admit_rejects_urgent_jobs_and_defers_batch_jobs(scheduler, client):
+    enqueue(client, 'exec.python:3', time.time() - 50)
+    for priority in ('interactive', 'normal'):
+        with pytest.raises(QueueOverloaded) as raised:
+            scheduler.admit('exec.python', priority)
+        assert raised.value.queue == 'exec.python'
+        assert raised.value.wait_seconds == pytest.approx(50, abs=1)
+    for priority in ('batch', 'bulk'):
+        assert scheduler.admit('exec.python', priority) == pytest.approx(20, abs=1)
+    assert counters(client) == {'exec.python:rejected': 2, 'exec.python:deferred': 2}
+
+
+def test_admit_disabled(scheduler, client):
+    scheduler.max_wait_seconds = 0
+    enqueue(client, 'exec.python', time.time() - 500)
+    assert scheduler.admit('exec.python', 'interactive') == 0
+
+
+def test_publishing_applies_admission(scheduler, client, app, published):
+    app.send_task('worker.execute_code_task', args=['python', 'print(1)'])
+    assert published[-1]['eta'] is None
+    assert published[-1]['expires'] is None
+    assert 'enqueued_at' in published[-1]
+
+    enqueue(client, 'exec.python', time.time() - 50)
+    with pytest.raises(QueueOverloaded):
+        app.send_task('worker.execute_code_task', args=['python', 'print(1)'])
+    with pytest.raises(QueueOverloaded):
+        app.send_task('worker.execute_batch_task', args=['python', []], priority=0)
+
+    app.send_task('worker.execute_batch_task', args=['python', []])
+    headers = published[-1]
+    assert scheduling.DEFER_HEADER not in headers
+    deferred = datetime.fromisoformat(headers['eta']).timestamp() - headers['enqueued_at']
+    assert deferred == pytest.approx(20, abs=1)
+    assert len(published) == 2
+
+
+def test_interactive_jobs_expire(scheduler, app, published):
+    app.send_task('worker.execute_code_task', args=['python', 'print(1)'], priority=0)
+    headers = published[-1]
+    assert scheduling.EXPIRES_HEADER not in headers
+    expires = datetime.fromisoformat(headers['expires']).timestamp() - headers['enqueued_at']
+    assert expires == pytest.approx(60, abs=1)
+
+
+def test_retries_from_a_running_task_are_not_readmitted(scheduler, client, app, published):
+    enqueue(client, 'exec.python', time.time() - 50)
+    with patch.object(scheduling, 'current_task', SimpleNamespace(request=SimpleNamespace(id='job-1'))):
+        app.send_task('worker.execute_code_task', args=['python', 'print(1)'])
+    assert len(published) == 1
+    assert counters(client) == {}
+
+
+def test_other_tasks_are_not_routed(scheduler):
+    assert scheduler.route('worker.health_check', (), {}, {}) is None
+
+
+def test_acquire_slot_limits_running_jobs_per_user(scheduler, client):
+    scheduler.acquire_slot('alice', 'job-1', 'python', 60)
+    scheduler.acquire_slot('alice', 'job-2', 'python', 60)
+    with pytest.raises(FairShareExceeded):
+        scheduler.acquire_slot('alice', 'job-3', 'python', 60)
+    scheduler.acquire_slot('bob', 'job-4', 'python', 60)
+    assert counters(client) == {'exec.python:fair_share_deferred': 1}
+    assert client.ttl(KEY_PREFIX + 'running:alice') > 0
+
+    scheduler.release_slot('alice', 'job-1')
+    scheduler.acquire_slot('alice', 'job-3', 'python', 60)
+
+
+def test_acquire_slot_drops_expired_leases(scheduler):
+    now = time.time()
+    scheduler.acquire_slot('alice', 'job-1', 'python', 10)
+    scheduler.acquire_slot('alice', 'job-2', 'python', 60)
+    with patch.object(scheduling.time, 'time', return_value=now + 30):
+        scheduler.acquire_slot('alice', 'job-3', 'python', 60)
+        with pytest.raises(FairShareExceeded):
+            scheduler.acquire_slot('alice', 'job-4', 'python', 60)
+
+
+def test_acquire_slot_without_user_or_limit(scheduler, client):
+    scheduler.acquire_slot(None, 'job-1', 'python', 60)
+    scheduler.max_running_per_user = 0
+    for job in ('job-2', 'job-3', 'job-4'):
+        scheduler.acquire_slot('alice', job, 'python', 60)
+    assert client.keys() == []
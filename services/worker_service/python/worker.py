@@ -1,12 +1,75 @@
 from celery import Celery
+from celery.exceptions import MaxRetriesExceededError
+from celery.signals import worker_process_init
+from concurrent.futures import ThreadPoolExecutor
 import time
 import os
-import tempfile
 import docker
+import redis
 
-app = Celery('worker', broker='redis://localhost:6379/0', backend='redis://localhost:6379/0')
+from compile_cache import CompileCache
+from container_pool import ContainerPoolManager, PoolExhausted
+from executions import record_execution
+from result_cache import ResultCache
+from output import OutputPublisher
+from runtimes import load_runtimes
+from scheduling import FairShareExceeded, Scheduler, transport_options
 
-client = docker.from_env()
+BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', BROKER_URL)
+
+app = Celery('worker', broker=BROKER_URL, backend=RESULT_BACKEND)
+
+# Per-language images, commands and resource budgets; see runtimes.py.
+RUNTIMES = load_runtimes()
+
+# Language queues, priorities, fair share and admission; see scheduling.py.
+scheduler = Scheduler(RUNTIMES, redis_url=BROKER_URL)
+FAIR_SHARE_MAX_RETRIES = int(os.environ.get('FAIR_SHARE_MAX_RETRIES', 600))
+
+app.conf.update(
+    task_routes=(scheduler.route,),
+    task_queues=scheduler.queues(),
+    broker_transport_options=transport_options(),
+    # Take a job only when a process is free to run it, so a worker busy with
+    # long compiles does not sit on quick jobs that an idle worker could run.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+)
+
+# Sandboxes are reused across jobs; see container_pool.py for sizing knobs.
+pools = ContainerPoolManager()
+
+compile_cache = CompileCache()
+
+RESULT_CACHE_URL = os.environ.get('RESULT_CACHE_URL', 'redis://localhost:6379/0')
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'
+_result_cache = None
+
+def result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(redis.Redis.from_url(RESULT_CACHE_URL))
+    return _result_cache
+
+# Upper bound for caller-supplied timeouts; runtimes define their defaults.
+MAX_TIMEOUT_MS = int(os.environ.get('MAX_TIMEOUT_MS', 60000))
+
+USAGE_FILE = '.usage'
+
+BATCH_MAX_CASES = int(os.environ.get('BATCH_MAX_CASES', 100))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 4))
+BATCH_OUTPUT_MAX_BYTES = int(os.environ.get('BATCH_OUTPUT_MAX_BYTES', 64 * 1024))
+BATCH_KILL_GRACE_S = 2
+
+# Dedicated workers (WORKER_LANGUAGES set) warm every language they serve.
+WARM_LANGUAGES = [l for l in os.environ.get('POOL_WARM_LANGUAGES',
+                                            os.environ.get('WORKER_LANGUAGES') or 'python,javascript').split(',') if l]
+
+@worker_process_init.connect
+def warm_sandbox_pools(**kwargs):
+    pools.warm([(RUNTIMES[language].image, RUNTIMES[language].container_limits())
+                for language in WARM_LANGUAGES if language in RUNTIMES])
 
 @app.task
 def debug_task(x, y):
@@ -14,201 +77,268 @@ def debug_task(x, y):
     print(f'Debug task executed: {x} + {y} = {x + y}')
     return x + y
 
-@app.task
-def execute_code_task(language: str, code: str, input_data: str = '', timeout_ms: int = 5000):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        file_extension = get_file_extension(language)
-        file_name = f'main.{file_extension}'
-        file_path_in_host = os.path.join(temp_dir, file_name)
-
-        with open(file_path_in_host, 'w') as f:
-            f.write(code)
-
-        container_name = f'polyglot-executor-{app.request.id}'
-        image_name = f'polyglot-{language}-runner' # Assuming images like polyglot-python-runner exist
-
-        command = []
-        if language == 'python':
-            command = ['python', file_name]
-        elif language == 'javascript':
-            command = ['node', file_name]
-        elif language == 'cpp':
-            executable_name = 'main'
-            compile_command = ['g++', file_name, '-o', executable_name]
-            # Execute compile command in container
-            try:
-                compile_result = client.containers.run(
-                    image_name,
-                    command=compile_command,
-                    volumes={temp_dir: {'bind': '/usr/src/app', 'mode': 'rw'}},
-                    working_dir='/usr/src/app',
-                    remove=True,
-                    detach=False,
-                    stdout=True,
-                    stderr=True,
-                    network_disabled=True,
-                    mem_limit='128m',
-                    cpu_period=100000,
-                    cpu_quota=50000, # 0.5 CPU
-                )
-                if compile_result.exit_status != 0:
-                    return {'status': 'error', 'message': 'Compilation failed', 'stderr': compile_result.stderr.decode('utf-8')}
-            except docker.errors.ContainerError as e:
-                return {'status': 'error', 'message': 'Compilation failed', 'stderr': e.stderr.decode('utf-8')}
-            except Exception as e:
-                return {'status': 'error', 'message': f'Docker error during compilation: {str(e)}'}
-            command = [f'./{executable_name}']
-        elif language == 'java':
-            class_name = 'Main'
-            compile_command = ['javac', file_name]
-            try:
-                compile_result = client.containers.run(
-                    image_name,
-                    command=compile_command,
-                    volumes={temp_dir: {'bind': '/usr/src/app', 'mode': 'rw'}},
-                    working_dir='/usr/src/app',
-                    remove=True,
-                    detach=False,
-                    stdout=True,
-                    stderr=True,
-                    network_disabled=True,
-                    mem_limit='128m',
-                    cpu_period=100000,
-                    cpu_quota=50000,
-                )
-                if compile_result.exit_status != 0:
-                    return {'status': 'error', 'message': 'Compilation failed', 'stderr': compile_result.stderr.decode('utf-8')}
-            except docker.errors.ContainerError as e:
-                return {'status': 'error', 'message': 'Compilation failed', 'stderr': e.stderr.decode('utf-8')}
-            except Exception as e:
-                return {'status': 'error', 'message': f'Docker error during compilation: {str(e)}'}
-            command = ['java', class_name]
-        elif language == 'go':
-            executable_name = 'main'
-            compile_command = ['go', 'build', '-o', executable_name, file_name]
-            try:
-                compile_result = client.containers.run(
-                    image_name,
-                    command=compile_command,
-                    volumes={temp_dir: {'bind': '/usr/src/app', 'mode': 'rw'}},
-                    working_dir='/usr/src/app',
-                    remove=True,
-                    detach=False,
-                    stdout=True,
-                    stderr=True,
-                    network_disabled=True,
-                    mem_limit='128m',
-                    cpu_period=100000,
-                    cpu_quota=50000,
-                )
-                if compile_result.exit_status != 0:
-                    return {'status': 'error', 'message': 'Compilation failed', 'stderr': compile_result.stderr.decode('utf-8')}
-            except docker.errors.ContainerError as e:
-                return {'status': 'error', 'message': 'Compilation failed', 'stderr': e.stderr.decode('utf-8')}
-            except Exception as e:
-                return {'status': 'error', 'message': f'Docker error during compilation: {str(e)}'}
-            command = [f'./{executable_name}']
-        elif language == 'php':
-            command = ['php', file_name]
-        elif language == 'rust':
-            executable_name = 'main'
-            compile_command = ['rustc', file_name, '-o', executable_name]
-            try:
-                compile_result = client.containers.run(
-                    image_name,
-                    command=compile_command,
-                    volumes={temp_dir: {'bind': '/usr/src/app', 'mode': 'rw'}},
-                    working_dir='/usr/src/app',
-                    remove=True,
-                    detach=False,
-                    stdout=True,
-                    stderr=True,
-                    network_disabled=True,
-                    mem_limit='128m',
-                    cpu_period=100000,
-                    cpu_quota=50000,
-                )
-                if compile_result.exit_status != 0:
-                    return {'status': 'error', 'message': 'Compilation failed', 'stderr': compile_result.stderr.decode('utf-8')}
-            except docker.errors.ContainerError as e:
-                return {'status': 'error', 'message': 'Compilation failed', 'stderr': e.stderr.decode('utf-8')}
-            except Exception as e:
-                return {'status': 'error', 'message': f'Docker error during compilation: {str(e)}'}
-            command = [f'./{executable_name}']
-        elif language == 'ruby':
-            command = ['ruby', file_name]
-        else:
-            return {'status': 'error', 'message': f'Unsupported language: {language}'}
+def _compile(sandbox, pool, runtime, code):
+    """Build ``code`` in ``sandbox``, reusing cached artifacts when possible.
+
+    Returns an error result if compilation fails, otherwise None.
+    """
+    if not runtime.compile_command:
+        return None
+    cache_key = None
+    if runtime.cacheable:
+        cache_key = CompileCache.key(runtime.name, pool.image_id, code, runtime.compile_command)
+    if cache_key is not None and compile_cache.restore(cache_key, sandbox.workspace):
+        return None
+    compile_result = sandbox.exec(runtime.compile_command, timeout=runtime.compile_timeout_ms / 1000)
+    if compile_result.timed_out:
+        return {'status': 'error', 'message': f'Compilation timed out after {runtime.compile_timeout_ms} ms'}
+    if compile_result.exit_code != 0:
+        return {'status': 'error', 'message': 'Compilation failed', 'stderr': compile_result.stderr.text()}
+    if cache_key is not None:
+        compile_cache.store(cache_key, sandbox.workspace, runtime.artifacts)
+    return None
 
+def _run_response(result, timeout_ms, duration):
+    response = {
+        'status': 'success',
+        'stdout': result.stdout.text(),
+        'stderr': result.stderr.text(),
+        'stdout_truncated': result.stdout.truncated,
+        'stderr_truncated': result.stderr.truncated,
+        'duration_ms': duration,
+        'exit_code': result.exit_code,
+        'timed_out': result.timed_out,
+        'run_ms': duration,
+        'cpu_user_ms': result.usage.get('cpu_user_ms'),
+        'cpu_system_ms': result.usage.get('cpu_system_ms'),
+        'peak_memory_kb': result.usage.get('peak_memory_kb'),
+        'stdout_bytes': result.stdout.total_bytes,
+        'stderr_bytes': result.stderr.total_bytes,
+    }
+    if result.timed_out:
+        response.update(status='error', message=f'Execution timed out after {timeout_ms} ms')
+    elif result.exit_code != 0:
+        response.update(status='error', message='Execution failed')
+    return response
+
+def _lease_seconds(runtime, timeout_ms):
+    """Upper bound on how long a job can hold its user's fair-share slot."""
+    timeout_ms = min(timeout_ms or runtime.timeout_ms, MAX_TIMEOUT_MS)
+    return (runtime.compile_timeout_ms + timeout_ms) / 1000 + 30
+
+def _fair_share(task, language, user_id, lease_seconds, run):
+    """Run ``run()`` in one of ``user_id``'s slots; requeue the job while the user has none free."""
+    scheduler.started(task.request, language)
+    try:
+        scheduler.acquire_slot(user_id, task.request.id or '', language, lease_seconds)
+    except FairShareExceeded as e:
         try:
+            raise task.retry(countdown=scheduler.retry_delay(), max_retries=FAIR_SHARE_MAX_RETRIES)
+        except MaxRetriesExceededError:
+            return {'status': 'error', 'message': str(e)}
+    try:
+        return run()
+    finally:
+        scheduler.release_slot(user_id, task.request.id or '')
+
+@app.task(bind=True)
+def execute_code_task(self, language: str, code: str, input_data: str = '', timeout_ms: int = None,
+                      execution_id: str = None, cache: bool = True, user_id: str = None):
+    """Run ``code`` once; if ``execution_id`` is given the result is saved to that executions row.
+
+    Results of deterministic runs are shared through the result cache, and
+    identical jobs running at the same time are coalesced into one. Pass
+    ``cache=False`` for programs whose output is not a pure function of their
+    code and input (randomness, clocks, ...). Jobs with a ``user_id`` count
+    against that user's fair share of concurrent executions.
+    """
+    runtime = RUNTIMES.get(language)
+    if runtime is None:
+        result = _execute(self, language, code, input_data, timeout_ms)
+    else:
+        def run():
+            if cache and RESULT_CACHE_ENABLED:
+                return _execute_cached(self, runtime, code, input_data, timeout_ms)
+            return _execute(self, language, code, input_data, timeout_ms)
+        result = _fair_share(self, language, user_id, _lease_seconds(runtime, timeout_ms), run)
+    if execution_id:
+        record_execution(execution_id, result)
+    return result
+
+def _execute_cached(task, runtime, code, input_data, timeout_ms):
+    try:
+        image_id = pools.get(runtime.image, **runtime.container_limits()).image_id
+    except Exception:
+        # Let the uncached path report missing images and docker errors.
+        return _execute(task, runtime.name, code, input_data, timeout_ms)
+    effective_timeout_ms = min(timeout_ms or runtime.timeout_ms, MAX_TIMEOUT_MS)
+    limits = dict(runtime.container_limits(), timeout_ms=effective_timeout_ms)
+    key = ResultCache.key(runtime.name, image_id, code, input_data, limits)
+    lock_seconds = (runtime.compile_timeout_ms + effective_timeout_ms) / 1000 + 5
+    return result_cache().get_or_execute(
+        key, lambda: _execute(task, runtime.name, code, input_data, timeout_ms), lock_seconds)
+
+def _execute(task, language, code, input_data, timeout_ms):
+    runtime = RUNTIMES.get(language)
+    if runtime is None:
+        return {'status': 'error', 'message': f'Unsupported language: {language}'}
+    timeout_ms = min(timeout_ms or runtime.timeout_ms, MAX_TIMEOUT_MS)
+
+    publisher = None
+    redis_client = getattr(app.backend, 'client', None)
+    if task.request.id and redis_client is not None:
+        publisher = OutputPublisher(redis_client, task.request.id)
+
+    try:
+        # Compile and run happen in the same warm sandbox, so build outputs
+        # are already in place for the run step.
+        pool = pools.get(runtime.image, **runtime.container_limits())
+        with pool.lease() as sandbox:
+            sandbox.write_file(runtime.source_file, code)
             start_time = time.time()
-            container_output = client.containers.run(
-                image_name,
-                command=command,
-                volumes={temp_dir: {'bind': '/usr/src/app', 'mode': 'rw'}},
-                working_dir='/usr/src/app',
-                remove=True,
-                detach=False,
-                stdout=True,
-                stderr=True,
-                network_disabled=True, # Disable network for security
-                mem_limit='128m', # Limit memory
-                cpu_period=100000,
-                cpu_quota=50000, # 0.5 CPU
-                input=input_data.encode('utf-8'), # Pass input to stdin
-                stream=False, # Capture all output at once
-                # timeout=timeout_ms / 1000, # Docker SDK timeout is for API call, not container execution
-            )
-            end_time = time.time()
-            duration = (end_time - start_time) * 1000  # Convert to ms
-
-            # Docker SDK run method returns stdout/stderr combined if stream=False
-            # Need to parse it out if both are expected
-            # For simplicity, assuming stdout is main output and stderr is error output
-            stdout_output = container_output.decode('utf-8')
-            stderr_output = ""
-            exit_code = 0 # Docker SDK doesn't directly return exit code for run, need to inspect container
-
-            return {
-                'status': 'success',
-                'stdout': stdout_output,
-                'stderr': stderr_output,
-                'duration_ms': duration,
-                'exit_code': exit_code,
-            }
-        except docker.errors.ContainerError as e:
-            return {
-                'status': 'error',
-                'message': 'Execution failed',
-                'stdout': e.stdout.decode('utf-8'),
-                'stderr': e.stderr.decode('utf-8'),
-                'exit_code': e.exit_status,
-                'duration_ms': (time.time() - start_time) * 1000,
-            }
-        except docker.errors.ImageNotFound:
-            return {'status': 'error', 'message': f'Docker image for {language} not found. Please build it.'}
-        except Exception as e:
-            return {'status': 'error', 'message': f'Docker error during execution: {str(e)}'}
+            error = _compile(sandbox, pool, runtime, code)
+            compile_ms = (time.time() - start_time) * 1000
+            if error:
+                error['compile_ms'] = compile_ms
+                return error
 
-def get_file_extension(language: str) -> str:
-    if language == 'python':
-        return 'py'
-    elif language == 'javascript':
-        return 'js'
-    elif language == 'cpp':
-        return 'cpp'
-    elif language == 'java':
-        return 'java'
-    elif language == 'go':
-        return 'go'
-    elif language == 'php':
-        return 'php'
-    elif language == 'rust':
-        return 'rs'
-    elif language == 'ruby':
-        return 'rb'
+            start_time = time.time()
+            result = sandbox.exec(runtime.run_command, stdin=input_data, timeout=timeout_ms / 1000,
+                                  on_output=publisher, usage_file=USAGE_FILE)
+        duration = (time.time() - start_time) * 1000  # Convert to ms
+        response = _run_response(result, timeout_ms, duration)
+        response['compile_ms'] = compile_ms
+        return response
+    except docker.errors.ImageNotFound:
+        return {'status': 'error', 'message': f'Docker image for {language} not found. Please build it.'}
+    except PoolExhausted as e:
+        return {'status': 'error', 'message': f'No sandbox available: {str(e)}'}
+    except Exception as e:
+        return {'status': 'error', 'message': f'Docker error during execution: {str(e)}'}
+    finally:
+        if publisher is not None:
+            publisher.close()
+
+def _batch_error(test_inputs):
+    """Why ``test_inputs`` cannot be run as a batch, or None."""
+    if not isinstance(test_inputs, list):
+        return 'test_inputs must be a list'
+    if len(test_inputs) > BATCH_MAX_CASES:
+        return f'At most {BATCH_MAX_CASES} test inputs are allowed per batch'
+    for index, case in enumerate(test_inputs):
+        if isinstance(case, str):
+            continue
+        if (not isinstance(case, dict) or not isinstance(case.get('input', ''), str)
+                or not isinstance(case.get('expected_output'), (str, type(None)))):
+            return (f'Test input {index} must be a string or an object with string '
+                    f'"input" and "expected_output" fields')
+    return None
+
+def _run_case(sandbox, runtime, index, case, timeout_ms):
+    if isinstance(case, dict):
+        input_data, expected = case.get('input', ''), case.get('expected_output')
     else:
-        return 'txt'
+        input_data, expected = case, None
+    # The in-sandbox timeout kills just this case's process so the other
+    # cases sharing the sandbox keep running; the host-side deadline is only
+    # a backstop that takes the whole sandbox down.
+    command = ['timeout', '-s', 'KILL', f'{timeout_ms / 1000:g}'] + runtime.run_command
+    start_time = time.time()
+    try:
+        result = sandbox.exec(command, stdin=input_data, timeout=timeout_ms / 1000 + BATCH_KILL_GRACE_S,
+                              max_output=BATCH_OUTPUT_MAX_BYTES, stdin_file=f'.stdin-{index}',
+                              usage_file=f'.usage-{index}')
+    except Exception as e:
+        return {'index': index, 'status': 'error', 'message': f'Docker error during execution: {str(e)}'}
+    duration = (time.time() - start_time) * 1000
+    if result.exit_code == 137 and duration >= timeout_ms:
+        result.timed_out = True
+    response = _run_response(result, timeout_ms, duration)
+    response['index'] = index
+    if expected is not None:
+        response['passed'] = not result.timed_out and result.stdout.text().rstrip() == expected.rstrip()
+    return response
+
+@app.task(bind=True)
+def execute_batch_task(self, language: str, code: str, test_inputs: list, timeout_ms: int = None,
+                       concurrency: int = 1, user_id: str = None):
+    """Compile ``code`` once and run it against every entry of ``test_inputs``.
+
+    Each test input is either a stdin string or a ``{"input", "expected_output"}``
+    object. All cases share one sandbox, run up to ``concurrency`` at a time
+    and each get their own timeout. A batch takes one of ``user_id``'s
+    fair-share slots.
+    """
+    runtime = RUNTIMES.get(language)
+    if runtime is None:
+        return {'status': 'error', 'message': f'Unsupported language: {language}'}
+    error = _batch_error(test_inputs)
+    if error:
+        return {'status': 'error', 'message': error}
+    timeout_ms = min(timeout_ms or runtime.timeout_ms, MAX_TIMEOUT_MS)
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    # Cases run in waves of `concurrency`; the lease covers the whole batch.
+    lease_seconds = _lease_seconds(runtime, timeout_ms) * -(-len(test_inputs) // concurrency)
+    return _fair_share(self, language, user_id, lease_seconds,
+                       lambda: _execute_batch(runtime, code, test_inputs, timeout_ms, concurrency))
+
+def _execute_batch(runtime, code, test_inputs, timeout_ms, concurrency):
+    language = runtime.name
+    try:
+        pool = pools.get(runtime.image, **runtime.container_limits())
+        with pool.lease() as sandbox:
+            sandbox.write_file(runtime.source_file, code)
+            start_time = time.time()
+            error = _compile(sandbox, pool, runtime, code)
+            compile_ms = (time.time() - start_time) * 1000
+            if error:
+                error['compile_ms'] = compile_ms
+                return error
+
+            start_time = time.time()
+            if concurrency == 1:
+                results = [_run_case(sandbox, runtime, i, case, timeout_ms) for i, case in enumerate(test_inputs)]
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    results = list(executor.map(
+                        lambda args: _run_case(sandbox, runtime, args[0], args[1], timeout_ms),
+                        enumerate(test_inputs)))
+            duration = (time.time() - start_time) * 1000
+    except docker.errors.ImageNotFound:
+        return {'status': 'error', 'message': f'Docker image for {language} not found. Please build it.'}
+    except PoolExhausted as e:
+        return {'status': 'error', 'message': f'No sandbox available: {str(e)}'}
+    except Exception as e:
+        return {'status': 'error', 'message': f'Docker error during execution: {str(e)}'}
+
+    return {
+        'status': 'success',
+        'results': results,
+        'succeeded': sum(1 for r in results if r['status'] == 'success'),
+        'passed': sum(1 for r in results if r.get('passed')),
+        'duration_ms': duration,
+        'compile_ms': compile_ms,
+    }
+
+@app.task
+def sandbox_pool_stats():
+    return pools.stats()
+
+@app.task
+def compile_cache_stats():
+    return compile_cache.stats()
+
+@app.task
+def result_cache_stats():
+    return result_cache().stats()
+
+@app.task
+def queue_stats():
+    return scheduler.stats()
+
+def get_file_extension(language: str) -> str:
+    runtime = RUNTIMES.get(language)
+    return runtime.extension if runtime else 'txt'
 
 # This is a worker, it doesn't expose HTTP endpoints directly.
 # Health checks would typically involve monitoring the Redis queue or Celery's own monitoring tools.